@@ -12,24 +12,38 @@ __all__ = [
     'assembly_compare',
     'assembly_variants',
     'bam_parse',
+    'batch_assembly',
+    'batch_mapping',
+    'batch_nucmer',
+    'batch_report_filter',
+    'batch_samtools_variants',
     'best_seq_chooser',
     'card_record',
     'cdhit',
     'cluster',
     'clusters',
     'common',
+    'consensus',
     'external_progs',
     'faidx',
     'flag',
     'histogram',
+    'interval_index',
     'link',
+    'local_assembler',
     'mapping',
+    'memory_scheduler',
+    'pairwise_aligner',
+    'pysam_variants',
     'read_store',
     'reference_data',
     'ref_genes_getter',
     'ref_preparer',
     'report',
     'report_filter',
+    'report_reader',
+    'report_xls',
+    'results_db',
     'scaffold_graph',
     'samtools_variants',
     'sequence_metadata',
@@ -38,6 +52,7 @@ __all__ = [
     'summary_cluster',
     'summary_sample',
     'tasks',
+    'variant_index',
     'versions',
     'vfdb_parser',
 ]
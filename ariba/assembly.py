@@ -3,7 +3,7 @@ import sys
 import shutil
 import pyfastaq
 import pymummer
-from ariba import common, mapping, bam_parse, external_progs
+from ariba import common, mapping, bam_parse, external_progs, local_assembler, pairwise_aligner
 
 class Error (Exception): pass
 
@@ -32,6 +32,10 @@ class Assembly:
       reads_insert=500,
       extern_progs=None,
       clean=True,
+      contigs_fa=None,
+      nucmer_coords_out=None,
+      aligner='nucmer',
+      map_reads=True,
     ):
         self.reads1 = os.path.abspath(reads1)
         self.reads2 = os.path.abspath(reads2)
@@ -56,6 +60,12 @@ class Assembly:
         self.sspace_sd = sspace_sd
         self.reads_insert = reads_insert
         self.clean = clean
+        self.contigs_fa = None if contigs_fa is None else os.path.abspath(contigs_fa)
+        self.nucmer_coords_out = None if nucmer_coords_out is None else os.path.abspath(nucmer_coords_out)
+        self.nucmer_coords_made = False
+        self.aligner = aligner
+        self.map_reads = map_reads
+        self.scaff_graph_ok = None
 
         if extern_progs is None:
             self.extern_progs = external_progs.ExternalProgs()
@@ -166,6 +176,19 @@ class Assembly:
             shutil.rmtree(self.assembler_dir)
 
 
+    def _assemble_with_local_assembler(self):
+        assembler = local_assembler.LocalAssembler(
+            self.reads1,
+            self.reads2,
+            self.ref_fasta,
+            self.assembly_contigs,
+            kmer=self.assembly_kmer,
+            min_contig_length=self.min_scaff_length,
+            log_fh=self.log_fh,
+        )
+        self.assembled_ok = assembler.run() > 0
+
+
     def _scaffold_with_sspace(self):
         if not os.path.exists(self.assembly_contigs):
             raise Error('Cannot scaffold because contigs file not found: ' + self.assembly_contigs)
@@ -269,22 +292,75 @@ class Assembly:
 
 
     @staticmethod
-    def _fix_contig_orientation(contigs_fa, ref_fa, outfile, min_id=90, min_length=20, breaklen=200):
+    def _write_nucmer_file_with_reversed_contigs(infile, outfile, contigs, snps=False):
+        '''Rewrites a nucmer coords file (made by show-coords -dTlro), or snps file (made by show-snps -TClr) if
+           snps=True, so that the coordinates are as if each contig in the set contigs was reverse complemented'''
+        f_in = pyfastaq.utils.open_file_read(infile)
+        f_out = pyfastaq.utils.open_file_write(outfile)
+        lines = []
+
+        for line in f_in:
+            if line.startswith('[') or '\t' not in line:
+                print(line.rstrip('\n'), file=f_out)
+                continue
+
+            fields = line.rstrip('\n').split('\t')
+            if snps:
+                # P1 SUB SUB P2 BUFF DIST (R Q) LEN_R LEN_Q FRM FRM ref_name qry_name
+                if fields[-1] in contigs:
+                    qry_length = int(fields[-5])
+                    fields[3] = str(qry_length - int(fields[3]) + 1)
+                    fields[-3] = str(-1 * int(fields[-3]))
+                lines.append(((int(fields[0]), fields[-1], int(fields[3])), fields))
+            else:
+                # S1 E1 S2 E2 LEN_1 LEN_2 IDY LEN_R LEN_Q FRM FRM ref_name qry_name (TAGS)
+                if fields[12] in contigs:
+                    qry_length = int(fields[8])
+                    fields[2] = str(qry_length - int(fields[2]) + 1)
+                    fields[3] = str(qry_length - int(fields[3]) + 1)
+                    fields[10] = str(-1 * int(fields[10]))
+                lines.append((None, fields))
+
+        pyfastaq.utils.close(f_in)
+
+        # After reversing a contig, its indels are listed in decreasing order of
+        # query position. Sort so that it looks like they came from show-snps
+        if snps:
+            lines.sort(key=lambda x: x[0])
+
+        for key, fields in lines:
+            print(*fields, sep='\t', file=f_out)
+
+        pyfastaq.utils.close(f_out)
+
+
+    @staticmethod
+    def _fix_contig_orientation(contigs_fa, ref_fa, outfile, min_id=90, min_length=20, breaklen=200, coords_out=None, aligner='nucmer', coords_in=None):
         '''Changes orientation of each contig to match the reference, when possible.
-           Returns a set of names of contigs that had hits in both orientations to the reference'''
+           Returns a set of names of contigs that had hits in both orientations to the reference.
+           If coords_out is given, then the nucmer coords and snps files (coords_out and coords_out.snps)
+           are also written, using the coordinates of the contigs after fixing their orientation.
+           aligner = 'nucmer' or 'internal' (to use pairwise_aligner instead of running nucmer).
+           If coords_in is given, then the alignment is not run. Instead, coords_in (and coords_in.snps
+           if coords_out is given) must be the output of aligning contigs_fa to ref_fa'''
         if not os.path.exists(contigs_fa):
             raise Error('Cannot fix orientation of assembly contigs because file not found: ' + contigs_fa)
 
-        tmp_coords = os.path.join(outfile + '.tmp.rename.coords')
-        pymummer.nucmer.Runner(
-            ref_fa,
-            contigs_fa,
-            tmp_coords,
-            min_id=min_id,
-            min_length=min_length,
-            breaklen=breaklen,
-            maxmatch=True,
-        ).run()
+        if coords_in is None:
+            tmp_coords = os.path.join(outfile + '.tmp.rename.coords')
+            runner = pairwise_aligner.Runner if aligner == 'internal' else pymummer.nucmer.Runner
+            runner(
+                ref_fa,
+                contigs_fa,
+                tmp_coords,
+                min_id=min_id,
+                min_length=min_length,
+                breaklen=breaklen,
+                maxmatch=True,
+                show_snps=coords_out is not None,
+            ).run()
+        else:
+            tmp_coords = coords_in
 
         to_revcomp = set()
         not_revcomp = set()
@@ -295,9 +371,17 @@ class Assembly:
             else:
                 to_revcomp.add(hit.qry_name)
 
-        os.unlink(tmp_coords)
         in_both = to_revcomp.intersection(not_revcomp)
 
+        if coords_out is not None:
+            Assembly._write_nucmer_file_with_reversed_contigs(tmp_coords, coords_out, to_revcomp - in_both)
+            Assembly._write_nucmer_file_with_reversed_contigs(tmp_coords + '.snps', coords_out + '.snps', to_revcomp - in_both, snps=True)
+            if coords_in is None:
+                os.unlink(tmp_coords + '.snps')
+
+        if coords_in is None:
+            os.unlink(tmp_coords)
+
         f = pyfastaq.utils.open_file_write(outfile)
         seq_reader = pyfastaq.sequences.file_reader(contigs_fa)
         for seq in seq_reader:
@@ -320,8 +404,61 @@ class Assembly:
         return bam_parser.scaff_graph_is_consistent(min_scaff_depth, max_insert)
 
 
-    def run(self):
-        self._assemble_with_spades()
+    def _map_reads_and_check_scaffold_graph(self):
+        if not self.map_reads:
+            print('Not mapping reads to the assembly. The scaffold graph will be checked later', file=self.log_fh)
+            return
+
+        mapping.run_bowtie2(
+            self.reads1,
+            self.reads2,
+            self.final_assembly_fa,
+            self.final_assembly_bam[:-4],
+            threads=1,
+            sort=True,
+            samtools=self.extern_progs.exe('samtools'),
+            bowtie2=self.extern_progs.exe('bowtie2'),
+            bowtie2_preset=self.bowtie2_preset,
+            verbose=True,
+            verbose_filehandle=self.log_fh
+        )
+
+        self._check_scaffold_graph(self.final_assembly_bam)
+
+
+    def _check_scaffold_graph(self, bam):
+        self.scaff_graph_ok = self._parse_bam(self.sequences, bam, self.min_scaff_depth, self.max_insert)
+        print('Scaffolding graph is OK:', self.scaff_graph_ok, file=self.log_fh)
+
+        if self.clean:
+            for suffix in ['soft_clipped', 'unmapped_mates', 'scaff']:
+                filename = bam + '.' + suffix
+                print('Deleting file', filename, file=self.log_fh)
+                os.unlink(filename)
+
+
+    def check_scaffold_graph(self, log_fh, bam):
+        '''Checks the scaffold graph when the assembly was run with map_reads=False.
+           bam must be the sorted BAM file made by mapping self.reads1 and self.reads2
+           to self.final_assembly_fa'''
+        self.log_fh = log_fh
+        self._check_scaffold_graph(bam)
+        # This is to make this object picklable, to keep multithreading happy
+        self.log_fh = None
+
+
+    def run(self, stop_before_orientation=False):
+        '''Assembles, scaffolds and gap fills, then fixes the orientation of the contigs and
+           maps the reads to them. If stop_before_orientation is True, then stops after gap
+           filling. The contigs are then in self.gapfilled_length_filtered, and
+           run_after_alignment() must be called to finish the assembly'''
+        if self.contigs_fa is not None:
+            print('Using contigs already made from file', self.contigs_fa, file=self.log_fh)
+            shutil.copyfile(self.contigs_fa, self.assembly_contigs)
+        elif self.assembler == 'local':
+            self._assemble_with_local_assembler()
+        else:
+            self._assemble_with_spades()
         self.sequences = {}
 
         # double-check we got some contigs
@@ -345,33 +482,41 @@ class Assembly:
                 self.log_fh = None
                 return
 
-            contigs_both_strands = self._fix_contig_orientation(self.gapfilled_length_filtered, self.ref_fasta, self.final_assembly_fa, min_id=self.nucmer_min_id, min_length=self.nucmer_min_len, breaklen=self.nucmer_breaklen)
-            self.has_contigs_on_both_strands = len(contigs_both_strands) > 0
-            pyfastaq.tasks.file_to_dict(self.final_assembly_fa, self.sequences)
-
-            mapping.run_bowtie2(
-                self.reads1,
-                self.reads2,
-                self.final_assembly_fa,
-                self.final_assembly_bam[:-4],
-                threads=1,
-                sort=True,
-                samtools=self.extern_progs.exe('samtools'),
-                bowtie2=self.extern_progs.exe('bowtie2'),
-                bowtie2_preset=self.bowtie2_preset,
-                verbose=True,
-                verbose_filehandle=self.log_fh
-            )
-
-            self.scaff_graph_ok = self._parse_bam(self.sequences, self.final_assembly_bam, self.min_scaff_depth, self.max_insert)
-            print('Scaffolding graph is OK:', self.scaff_graph_ok, file=self.log_fh)
-
-            if self.clean:
-                for suffix in ['soft_clipped', 'unmapped_mates', 'scaff']:
-                    filename = self.final_assembly_bam + '.' + suffix
-                    print('Deleting file', filename, file=self.log_fh)
-                    os.unlink(filename)
+            if not stop_before_orientation:
+                self._orient_contigs_and_map_reads()
+
+        # This is to make this object picklable, to keep multithreading happy
+        self.log_fh = None
 
 
+    def _orient_contigs_and_map_reads(self, coords_in=None):
+        contigs_both_strands = self._fix_contig_orientation(self.gapfilled_length_filtered, self.ref_fasta, self.final_assembly_fa, min_id=self.nucmer_min_id, min_length=self.nucmer_min_len, breaklen=self.nucmer_breaklen, coords_out=self.nucmer_coords_out, aligner=self.aligner, coords_in=coords_in)
+        self.nucmer_coords_made = self.nucmer_coords_out is not None
+        self.has_contigs_on_both_strands = len(contigs_both_strands) > 0
+        pyfastaq.tasks.file_to_dict(self.final_assembly_fa, self.sequences)
+        self._map_reads_and_check_scaffold_graph()
+
+
+    def run_after_alignment(self, log_fh, coords_in):
+        '''Finishes the assembly after run(stop_before_orientation=True), using coords_in
+           (and coords_in.snps) as the nucmer output of aligning self.gapfilled_length_filtered
+           to the reference, instead of running nucmer'''
+        self.log_fh = log_fh
+        self._orient_contigs_and_map_reads(coords_in=coords_in)
+        # This is to make this object picklable, to keep multithreading happy
+        self.log_fh = None
+
+
+    def run_with_consensus(self, consensus_fa):
+        '''Uses the sequence in consensus_fa as the assembly, instead of running
+           the assembler, scaffolder and gap filler'''
+        self.sequences = {}
+        self._rename_scaffolds(consensus_fa, self.final_assembly_fa, self.scaff_name_prefix)
+        pyfastaq.tasks.file_to_dict(self.final_assembly_fa, self.sequences)
+        self.assembled_ok = len(self.sequences) > 0
+        self.has_contigs_on_both_strands = False
+        if self.assembled_ok:
+            self._map_reads_and_check_scaffold_graph()
+
         # This is to make this object picklable, to keep multithreading happy
         self.log_fh = None
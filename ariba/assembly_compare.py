@@ -2,6 +2,7 @@ import os
 import copy
 import pyfastaq
 import pymummer
+from ariba import interval_index, pairwise_aligner
 
 class Error (Exception): pass
 
@@ -19,6 +20,8 @@ class AssemblyCompare:
       assembled_threshold=0.95,
       unique_threshold=0.03,
       max_gene_nt_extend=30,
+      nucmer_already_run=False,
+      aligner='nucmer',
     ):
         self.assembly_fa = os.path.abspath(assembly_fa)
         self.assembly_sequences = assembly_sequences
@@ -33,17 +36,22 @@ class AssemblyCompare:
         self.assembled_threshold = assembled_threshold
         self.unique_threshold = unique_threshold
         self.max_gene_nt_extend = max_gene_nt_extend
+        self.nucmer_already_run = nucmer_already_run
+        self.aligner = aligner
         self.gene_matching_ref = None
         self.gene_matching_ref_type = None
         self.gene_start_bases_added = None
         self.gene_end_bases_added = None
+        self.ref_coords_index = None
+        self.nucmer_variants = None
 
         self.nucmer_coords_file = self.outprefix + '.nucmer.coords'
         self.nucmer_snps_file = self.nucmer_coords_file + '.snps'
 
 
     def _run_nucmer(self):
-        pymummer.nucmer.Runner(
+        runner = pairwise_aligner.Runner if self.aligner == 'internal' else pymummer.nucmer.Runner
+        runner(
             self.ref_fa,
             self.assembly_fa,
             self.nucmer_coords_file,
@@ -72,6 +80,25 @@ class AssemblyCompare:
         return nucmer_hits
 
 
+    @staticmethod
+    def _parse_nucmer_snps_file(snps_file):
+        '''Input is snps file made by self._run_nucmer.
+           Returns dictionary. Key = assembly contig name. Value = list of
+           pymummer.variant.Variant objects in that contig, in the same order as the file'''
+        nucmer_variants = {}
+        for variant in pymummer.snp_file.get_all_variants(snps_file):
+            nucmer_variants.setdefault(variant.qry_name, []).append(variant)
+        return nucmer_variants
+
+
+    def nucmer_variants_by_contig(self):
+        '''Returns the variants in self.nucmer_snps_file, as made by _parse_nucmer_snps_file.
+           The file is only parsed the first time this is called'''
+        if self.nucmer_variants is None:
+            self.nucmer_variants = self._parse_nucmer_snps_file(self.nucmer_snps_file)
+        return self.nucmer_variants
+
+
     @staticmethod
     def _nucmer_hits_to_percent_identity(nucmer_hits):
         '''Input is hits made by self._parse_nucmer_coords_file.
@@ -344,6 +371,34 @@ class AssemblyCompare:
         return flag
 
 
+    @staticmethod
+    def _make_ref_coords_index(nucmer_hits):
+        '''Returns dictionary of reference name -> interval_index.IntervalIndex of the
+           reference coords of the hits. The value of each interval is a tuple
+           (n, hit), where hit is the nth hit found when looping over nucmer_hits'''
+        intervals = {}
+        n = 0
+        for contig_name in nucmer_hits:
+            for hit in nucmer_hits[contig_name]:
+                coords = hit.ref_coords()
+                intervals.setdefault(hit.ref_name, []).append((coords.start, coords.end, (n, hit)))
+                n += 1
+
+        return {ref_name: interval_index.IntervalIndex(intervals[ref_name]) for ref_name in intervals}
+
+
+    @staticmethod
+    def _hit_containing_position_from_index(index, ref_name, ref_position):
+        '''index = made by _make_ref_coords_index. Returns the hit that was first in
+           nucmer_hits that contains the given reference location, or None if there isn't one'''
+        if ref_name not in index:
+            return None
+        hits = index[ref_name].containing(ref_position)
+        if len(hits) == 0:
+            return None
+        return min(hits, key=lambda x: x[0])[1]
+
+
     @staticmethod
     def nucmer_hit_containing_reference_position(nucmer_hits, ref_name, ref_position):
         '''Returns the first nucmer match found that contains the given
@@ -357,8 +412,17 @@ class AssemblyCompare:
         return None
 
 
+    def hit_containing_reference_position(self, ref_name, ref_position):
+        '''Same as nucmer_hit_containing_reference_position(self.nucmer_hits, ref_name, ref_position),
+           but uses an index of the hits, which is made the first time this is called'''
+        if self.ref_coords_index is None:
+            self.ref_coords_index = self._make_ref_coords_index(self.nucmer_hits)
+        return self._hit_containing_position_from_index(self.ref_coords_index, ref_name, ref_position)
+
+
     def run(self):
-        self._run_nucmer()
+        if not self.nucmer_already_run:
+            self._run_nucmer()
         self.nucmer_hits = self._parse_nucmer_coords_file(self.nucmer_coords_file, self.ref_sequence.id)
         self.percent_identities = self._nucmer_hits_to_percent_identity(self.nucmer_hits)
         self.assembled_reference_sequences = self._get_assembled_reference_sequences(self.nucmer_hits, self.ref_sequence, self.assembly_sequences)
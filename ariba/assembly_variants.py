@@ -2,19 +2,26 @@ import sys
 import operator
 import pyfastaq
 import pymummer
-from ariba import sequence_variant
+from ariba import interval_index, sequence_variant
 from pyfastaq import intervals
 
 
 class Error (Exception): pass
 
+codon_tables = {}
+
 class AssemblyVariants:
     def __init__(self,
       refdata,
       nucmer_snp_file,
+      nucmer_variants=None,
     ):
+        '''nucmer_variants = the variants in nucmer_snp_file, already parsed by
+           assembly_compare.AssemblyCompare.nucmer_variants_by_contig(). If given,
+           nucmer_snp_file is not read'''
         self.refdata = refdata
         self.nucmer_snp_file = nucmer_snp_file
+        self.nucmer_variants = nucmer_variants
 
 
     @classmethod
@@ -27,12 +34,20 @@ class AssemblyVariants:
 
     @classmethod
     def _get_mummer_variants(cls, snp_file):
-        variants = pymummer.snp_file.get_all_variants(snp_file)
+        return AssemblyVariants._group_mummer_variants(pymummer.snp_file.get_all_variants(snp_file))
+
+
+    @staticmethod
+    def _group_mummer_variants(variants):
+        '''variants = list of pymummer.variant.Variant objects. Returns dictionary
+           of contig name -> list of lists of variants, where each list has the
+           variants in the same codon. The input list is not changed'''
         mummer_variants = {}
 
         if len(variants) == 0:
             return {}
 
+        variants = list(variants)
         variants.sort(key=operator.attrgetter('qry_name'))
         variants.sort(key=operator.attrgetter('ref_start'))
 
@@ -60,73 +75,106 @@ class AssemblyVariants:
         return mummer_variants
 
 
-    @classmethod
-    def _get_variant_effect(cls, variants, ref_sequence):
-        '''variants = list of variants in the same codon.
-           returns type of variant (cannot handle more than one indel in the same codon).'''
-        assert len(variants) != 0
+    @staticmethod
+    def _codon_table():
+        '''Returns dictionary of codon -> amino acid, for the genetic code currently used by
+           pyfastaq. Has upper and lower case versions of each codon'''
+        code = pyfastaq.sequences.genetic_code
+        if code not in codon_tables:
+            table = {}
+            for codon, aa in pyfastaq.genetic_codes.codes[code].items():
+                table[codon] = aa
+                table[codon.lower()] = aa
+            codon_tables[code] = table
+
+        return codon_tables[code]
 
+
+    @staticmethod
+    def _translate(seq, codon_table):
+        '''Returns the translation of seq (a string or bytes), giving the same
+           result as translating a pyfastaq.sequences.Fasta object with the same sequence'''
+        if isinstance(seq, bytes):
+            seq = seq.decode()
+        return ''.join([codon_table.get(seq[i:i+3], None) or codon_table.get(seq[i:i+3].upper(), 'X') for i in range(0, len(seq) - 1, 3)])
+
+
+    @staticmethod
+    def _get_variant_effect_from_string(variants, ref_seq, codon_table):
+        '''Same as _get_variant_effect, but ref_seq is the reference sequence as a string, and
+           codon_table = dictionary made by _codon_table()'''
         var_types = [x.var_type for x in variants]
         if len(set(var_types)) != 1:
             return 'MULTIPLE', '.', '.'
 
         var_type = var_types[0]
-
-        assert set([x.ref_name for x in variants]) == set([ref_sequence.id])
         codon_starts = [AssemblyVariants._get_codon_start(0, x.ref_start) for x in variants]
         assert len(set(codon_starts)) == 1
         codon_start = codon_starts[0]
         aa_start = codon_start // 3
-        ref_codon = pyfastaq.sequences.Fasta('codon', ref_sequence[codon_start:codon_start+3])
-        ref_aa = ref_codon.translate()
+        ref_codon = ref_seq[codon_start:codon_start+3]
+        ref_aa = AssemblyVariants._translate(ref_codon, codon_table)
 
         if var_type == pymummer.variant.SNP:
-            new_codon = list(ref_codon.seq)
+            new_codon = list(ref_codon)
             for v in variants:
                 new_codon[v.ref_start - codon_start] = v.qry_base
-            new_codon = pyfastaq.sequences.Fasta('new', ''.join(new_codon))
-            qry_aa = new_codon.translate()
+            qry_aa = AssemblyVariants._translate(''.join(new_codon), codon_table)
 
-            if ref_aa.seq == qry_aa.seq:
+            if ref_aa == qry_aa:
                 return ('SYN', '.', aa_start)
-            elif qry_aa.seq == '*':
-                return ('TRUNC', ref_aa.seq + str(aa_start + 1) + 'trunc', aa_start)
+            elif qry_aa == '*':
+                return ('TRUNC', ref_aa + str(aa_start + 1) + 'trunc', aa_start)
             else:
-                return ('NONSYN', ref_aa.seq + str(aa_start + 1) + qry_aa.seq, aa_start)
+                return ('NONSYN', ref_aa + str(aa_start + 1) + qry_aa, aa_start)
         elif var_type in [pymummer.variant.INS, pymummer.variant.DEL]:
             if len(variants) > 1:
                 return 'INDELS', '.', aa_start
 
             var = variants[0]
-
-            if var_type == pymummer.variant.INS:
-                new_seq = pyfastaq.sequences.Fasta('seq', var.qry_base)
-            else:
-                new_seq = pyfastaq.sequences.Fasta('seq', var.ref_base)
+            new_seq = var.qry_base if var_type == pymummer.variant.INS else var.ref_base
 
             if len(new_seq) % 3 != 0:
-                return ('FSHIFT', ref_aa.seq + str(aa_start + 1) + 'fs', aa_start)
+                return ('FSHIFT', ref_aa + str(aa_start + 1) + 'fs', aa_start)
 
-            new_seq_aa = new_seq.translate()
-            if '*' in new_seq_aa.seq:
-                return ('TRUNC', ref_aa.seq + str(aa_start + 1) + 'trunc', aa_start)
+            new_seq_aa = AssemblyVariants._translate(new_seq, codon_table)
+            if '*' in new_seq_aa:
+                return ('TRUNC', ref_aa + str(aa_start + 1) + 'trunc', aa_start)
             elif var_type == pymummer.variant.INS:
-                ref_codon_after_ins = pyfastaq.sequences.Fasta('codon', ref_sequence[codon_start+3:codon_start+6])
-                aa_after_ins = ref_codon_after_ins.translate()
-                return ('INS', ref_aa.seq + str(aa_start + 1) + '_' + aa_after_ins.seq + str(aa_start + 2) + 'ins' + new_seq_aa.seq , aa_start)
+                aa_after_ins = AssemblyVariants._translate(ref_seq[codon_start+3:codon_start+6], codon_table)
+                return ('INS', ref_aa + str(aa_start + 1) + '_' + aa_after_ins + str(aa_start + 2) + 'ins' + new_seq_aa , aa_start)
             else:
                 if len(new_seq) == 3:
-                    return ('DEL', ref_aa.seq + str(aa_start + 1) + 'del', aa_start)
+                    return ('DEL', ref_aa + str(aa_start + 1) + 'del', aa_start)
                 else:
                     assert len(new_seq) % 3 == 0
-                    ref_codon_after_ins = pyfastaq.sequences.Fasta('codon', ref_sequence[codon_start+3:codon_start+6])
-                    aa_after_ins = ref_codon_after_ins.translate()
-                    return ('DEL', ref_aa.seq + str(aa_start + 1)+ '_' + aa_after_ins.seq + str(aa_start + 2) + 'del', aa_start)
+                    aa_after_ins = AssemblyVariants._translate(ref_seq[codon_start+3:codon_start+6], codon_table)
+                    return ('DEL', ref_aa + str(aa_start + 1)+ '_' + aa_after_ins + str(aa_start + 2) + 'del', aa_start)
 
         else:
             return ('UNKNOWN', '.', aa_start)
 
 
+    @staticmethod
+    def _get_variant_effects(variant_lists, ref_sequence):
+        '''variant_lists = list of lists of variants, where each list has variants in the same codon.
+           Returns list of the variant effects (see _get_variant_effect), one per list'''
+        codon_table = AssemblyVariants._codon_table()
+        effects = []
+        for variants in variant_lists:
+            assert len(variants) != 0
+            assert set([x.ref_name for x in variants]) == set([ref_sequence.id])
+            effects.append(AssemblyVariants._get_variant_effect_from_string(variants, ref_sequence.seq, codon_table))
+        return effects
+
+
+    @classmethod
+    def _get_variant_effect(cls, variants, ref_sequence):
+        '''variants = list of variants in the same codon.
+           returns type of variant (cannot handle more than one indel in the same codon).'''
+        return AssemblyVariants._get_variant_effects([variants], ref_sequence)[0]
+
+
     @staticmethod
     def _filter_mummer_variants(mummer_variants, ref_sequence):
         if len(mummer_variants) == 0:
@@ -134,8 +182,9 @@ class AssemblyVariants:
 
         for contig in mummer_variants:
             variants = mummer_variants[contig]
+            effects = AssemblyVariants._get_variant_effects(variants, ref_sequence)
             for i in range(len(variants)):
-                t = AssemblyVariants._get_variant_effect(variants[i], ref_sequence)
+                t = effects[i]
                 if t is not None and t[0] in ['TRUNC', 'FSHIFT']:
                     break
             mummer_variants[contig] = variants[:i+1]
@@ -185,8 +234,11 @@ class AssemblyVariants:
 
 
     @staticmethod
-    def _get_one_variant_for_one_contig_coding(ref_sequence, refdata_var_dict, mummer_variants_list):
-        aa_var_effect, aa_var_string, aa_var_position = AssemblyVariants._get_variant_effect(mummer_variants_list, ref_sequence)
+    def _get_one_variant_for_one_contig_coding(ref_sequence, refdata_var_dict, mummer_variants_list, variant_effect=None):
+        '''variant_effect = the result of _get_variant_effect(mummer_variants_list, ref_sequence), if already known'''
+        if variant_effect is None:
+            variant_effect = AssemblyVariants._get_variant_effect(mummer_variants_list, ref_sequence)
+        aa_var_effect, aa_var_string, aa_var_position = variant_effect
         var_tuple = None
         used_known_variants = set()
 
@@ -236,11 +288,11 @@ class AssemblyVariants:
            ref variants. Also need to check that the variant is in a nucmer match to an
            assembly contig.'''
         variants = []
+        nucmer_coords_index = interval_index.IntervalIndex([(x.start, x.end, None) for x in nucmer_coords])
 
         for ref_variant_pos, ref_variants_set in sorted(known_ref_variants.items()):
             for known_ref_variant in ref_variants_set:
                 if known_ref_variant not in used_ref_variants:
-                    variant_pos_matches_contig = False
                     pos = known_ref_variant.variant.position
 
                     if known_ref_variant.variant_type == 'n':
@@ -250,12 +302,7 @@ class AssemblyVariants:
                     else:
                         raise Error('Unexpected variant type "' + known_ref_variant.variant_type + '" in _get_remaining_known_ref_variants. Cannot continue')
 
-                    for interval in nucmer_coords:
-                        if ref_interval.intersects(interval):
-                            variant_pos_matches_contig = True
-                            break
-
-                    if variant_pos_matches_contig:
+                    if nucmer_coords_index.overlaps(ref_interval.start, ref_interval.end):
                         variants.append((None, known_ref_variant.variant_type, None, None, None, {known_ref_variant}, set()))
 
         return variants
@@ -276,14 +323,17 @@ class AssemblyVariants:
                6 = set {known ref metadata (=sequence_metadata.SequenceMetadata)  at same position as SNP}, excluding those from 4
            )
         '''
-        mummer_variants = self._get_mummer_variants(self.nucmer_snp_file)
+        if self.nucmer_variants is None:
+            mummer_variants = self._get_mummer_variants(self.nucmer_snp_file)
+        else:
+            mummer_variants = self._group_mummer_variants([v for contig in self.nucmer_variants for v in self.nucmer_variants[contig]])
         variants = {}
         ref_sequence_type = self.refdata.sequence_type(ref_sequence_name)
         assert ref_sequence_type is not None
         ref_sequence = self.refdata.sequence(ref_sequence_name)
 
         if ref_sequence_name in self.refdata.metadata:
-            refdata_var_dict = self.refdata.metadata[ref_sequence_name]
+            refdata_var_dict = self.refdata.variant_index(ref_sequence_name).variants
         else:
             refdata_var_dict = None
 
@@ -294,12 +344,15 @@ class AssemblyVariants:
             variants[contig] = []
 
             if contig in mummer_variants:
-                for mummer_variant_list in mummer_variants[contig]:
+                if ref_sequence_type != 'non_coding':
+                    variant_effects = self._get_variant_effects(mummer_variants[contig], ref_sequence)
+
+                for i, mummer_variant_list in enumerate(mummer_variants[contig]):
                     if ref_sequence_type == 'non_coding':
                         for mummer_variant in mummer_variant_list:
                             new_variant, used_variants = self._get_one_variant_for_one_contig_non_coding(refdata_var_dict, mummer_variant)
                     else:
-                        new_variant, used_variants = self._get_one_variant_for_one_contig_coding(ref_sequence, refdata_var_dict, mummer_variant_list)
+                        new_variant, used_variants = self._get_one_variant_for_one_contig_coding(ref_sequence, refdata_var_dict, mummer_variant_list, variant_effect=variant_effects[i])
 
                     if new_variant is not None:
                             variants[contig].append(new_variant)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import pyfastaq
+import pymummer
+from ariba import assembly, pairwise_aligner
+
+class Error (Exception): pass
+
+
+class BatchAssembly:
+    def __init__(self,
+      clusters,
+      working_dir,
+      logfile,
+      kmer=21,
+      spades_other_options=None,
+      nucmer_min_id=90,
+      nucmer_min_len=20,
+      nucmer_breaklen=200,
+      aligner='nucmer',
+      extern_progs=None,
+      clean=True,
+    ):
+        '''Assembles the reads from several clusters in one run of SPAdes, using the reference
+           sequences of all the clusters as untrusted contigs. The contigs are then assigned back
+           to clusters by aligning them to the references.
+           clusters = list of tuples (reads_1, reads_2, reference_fa, contigs_out_fa), one per cluster.
+           Each reference_fa must have one sequence, and the names must be unique across all clusters.
+           The contigs assigned to each cluster are written to its contigs_out_fa (which
+           can be empty, if none were assigned)'''
+        self.clusters = clusters
+        self.working_dir = os.path.abspath(working_dir)
+        self.logfile = logfile
+        self.kmer = kmer
+        self.spades_other_options = spades_other_options
+        self.nucmer_min_id = nucmer_min_id
+        self.nucmer_min_len = nucmer_min_len
+        self.nucmer_breaklen = nucmer_breaklen
+        self.aligner = aligner
+        self.extern_progs = extern_progs
+        self.clean = clean
+
+        self.reads1 = os.path.join(self.working_dir, 'reads_1.fq')
+        self.reads2 = os.path.join(self.working_dir, 'reads_2.fq')
+        self.refs_fa = os.path.join(self.working_dir, 'references.fa')
+        self.coords_file = os.path.join(self.working_dir, 'contigs_vs_refs.coords')
+
+
+    def _write_reads_and_refs(self):
+        '''Writes all the reads and references to one pair of reads files and one fasta file.
+           Reads are renamed so that names are unique. Returns list of reference names,
+           in the same order as self.clusters'''
+        reads_out = [pyfastaq.utils.open_file_write(self.reads1), pyfastaq.utils.open_file_write(self.reads2)]
+        refs_out = pyfastaq.utils.open_file_write(self.refs_fa)
+        ref_names = []
+
+        for i, (reads_1, reads_2, reference_fa, contigs_out_fa) in enumerate(self.clusters):
+            for reads_in, f_out in zip([reads_1, reads_2], reads_out):
+                for read in pyfastaq.sequences.file_reader(reads_in):
+                    read.id = str(i + 1) + '.' + read.id
+                    print(read, file=f_out)
+
+            refs = [x for x in pyfastaq.sequences.file_reader(reference_fa)]
+            if len(refs) != 1:
+                raise Error('Expected one sequence in file ' + reference_fa + ' but got ' + str(len(refs)))
+            if refs[0].id in ref_names:
+                raise Error('Reference name ' + refs[0].id + ' found in more than one cluster. Cannot continue')
+            ref_names.append(refs[0].id)
+            print(refs[0], file=refs_out)
+
+        for f in reads_out + [refs_out]:
+            pyfastaq.utils.close(f)
+
+        return ref_names
+
+
+    @staticmethod
+    def _assign_contigs_to_refs(coords_file):
+        '''Returns dict of contig name -> name of reference that has the most bases
+           of the contig aligned to it. Contigs with no hits are not in the dict'''
+        aligned_bases = {}
+        for hit in pymummer.coords_file.reader(coords_file):
+            key = (hit.qry_name, hit.ref_name)
+            aligned_bases[key] = aligned_bases.get(key, 0) + hit.hit_length_qry
+
+        best_refs = {}
+        for (contig, ref), bases in sorted(aligned_bases.items()):
+            if contig not in best_refs or bases > best_refs[contig][1]:
+                best_refs[contig] = (ref, bases)
+
+        return {x: best_refs[x][0] for x in best_refs}
+
+
+    def run(self):
+        try:
+            os.mkdir(self.working_dir)
+        except:
+            raise Error('Error mkdir ' + self.working_dir)
+
+        log_fh = pyfastaq.utils.open_file_write(self.logfile)
+        print('{:_^79}'.format(' LOG FILE START batch assembly ' + self.working_dir + ' '), file=log_fh, flush=True)
+        ref_names = self._write_reads_and_refs()
+        print('Assembling reads from clusters with these references:', ', '.join(ref_names), file=log_fh, flush=True)
+
+        batch_assembly = assembly.Assembly(
+            self.reads1,
+            self.reads2,
+            self.refs_fa,
+            os.path.join(self.working_dir, 'Assembly'),
+            os.path.join(self.working_dir, 'assembly.fa'),
+            os.path.join(self.working_dir, 'assembly.bam'),
+            log_fh,
+            kmer=self.kmer,
+            spades_other_options=self.spades_other_options,
+            extern_progs=self.extern_progs,
+            clean=self.clean,
+        )
+        batch_assembly._assemble_with_spades()
+
+        contigs = {}
+        if batch_assembly.assembled_ok and os.path.exists(batch_assembly.assembly_contigs):
+            pyfastaq.tasks.file_to_dict(batch_assembly.assembly_contigs, contigs)
+
+        if len(contigs) > 0:
+            runner = pairwise_aligner.Runner if self.aligner == 'internal' else pymummer.nucmer.Runner
+            runner(
+                self.refs_fa,
+                batch_assembly.assembly_contigs,
+                self.coords_file,
+                min_id=self.nucmer_min_id,
+                min_length=self.nucmer_min_len,
+                breaklen=self.nucmer_breaklen,
+                maxmatch=True,
+            ).run()
+            contig_to_ref = self._assign_contigs_to_refs(self.coords_file)
+        else:
+            contig_to_ref = {}
+
+        print('Made', len(contigs), 'contigs, of which', len(contig_to_ref), 'were assigned to a reference', file=log_fh, flush=True)
+
+        for ref_name, (reads_1, reads_2, reference_fa, contigs_out_fa) in zip(ref_names, self.clusters):
+            f = pyfastaq.utils.open_file_write(contigs_out_fa)
+            for contig_name in sorted([x for x in contig_to_ref if contig_to_ref[x] == ref_name]):
+                print(contigs[contig_name], file=f)
+            pyfastaq.utils.close(f)
+
+        print('{:_^79}'.format(' LOG FILE END batch assembly ' + self.working_dir + ' '), file=log_fh, flush=True)
+        pyfastaq.utils.close(log_fh)
+
+        if self.clean:
+            shutil.rmtree(self.working_dir)
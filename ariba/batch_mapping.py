@@ -0,0 +1,176 @@
+import os
+import shutil
+import pysam
+import pyfastaq
+from ariba import mapping
+
+class Error (Exception): pass
+
+
+class BatchMapping:
+    def __init__(self,
+      jobs,
+      working_dir,
+      logfile,
+      threads=1,
+      samtools_exe='samtools',
+      bowtie2_exe='bowtie2',
+      bowtie2_preset='very-sensitive-local',
+      clean=True,
+    ):
+        '''Maps the reads of several clusters to their assemblies with one bowtie2 index
+           and one run of bowtie2, instead of one of each per cluster.
+           jobs = list of tuples (reads_1, reads_2, assembly_fa, bam_out). More than one job
+           can use the same assembly_fa, but contig names must be unique across the assemblies.
+           Each bam_out is sorted and indexed, and is the same as mapping the reads of the job
+           to its assembly on its own. Where that cannot be known from the one run of bowtie2
+           (a read or its mate mapped to another assembly, or a read has a second best hit that
+           could be in another assembly), the reads of the job are mapped again on their own'''
+        self.jobs = jobs
+        self.working_dir = os.path.abspath(working_dir)
+        self.logfile = logfile
+        self.threads = threads
+        self.samtools_exe = samtools_exe
+        self.bowtie2_exe = bowtie2_exe
+        self.bowtie2_preset = bowtie2_preset
+        self.clean = clean
+
+        self.reads1 = os.path.join(self.working_dir, 'reads_1.fq')
+        self.reads2 = os.path.join(self.working_dir, 'reads_2.fq')
+        self.assemblies_fa = os.path.join(self.working_dir, 'assemblies.fa')
+        self.bam_prefix = os.path.join(self.working_dir, 'reads_mapped')
+
+
+    def _write_reads_and_assemblies(self):
+        '''Writes all the reads and assemblies to one pair of reads files and one fasta file.
+           Each read name is prefixed with the (1-based) number of its job. Returns a tuple:
+           (dict of contig name -> index of the assembly it came from, list of the index of the
+           assembly of each job)'''
+        reads_out = [pyfastaq.utils.open_file_write(self.reads1), pyfastaq.utils.open_file_write(self.reads2)]
+        contigs_out = pyfastaq.utils.open_file_write(self.assemblies_fa)
+        assembly_indexes = {}
+        job_to_assembly = []
+        contig_to_assembly = {}
+
+        for i, (reads_1, reads_2, assembly_fa, bam_out) in enumerate(self.jobs):
+            for reads_in, f_out in zip([reads_1, reads_2], reads_out):
+                for read in pyfastaq.sequences.file_reader(reads_in):
+                    read.id = str(i + 1) + '.' + read.id
+                    print(read, file=f_out)
+
+            if assembly_fa not in assembly_indexes:
+                assembly_indexes[assembly_fa] = len(assembly_indexes)
+                for contig in pyfastaq.sequences.file_reader(assembly_fa):
+                    if contig.id in contig_to_assembly:
+                        raise Error('Contig name ' + contig.id + ' found more than once. Cannot continue')
+                    contig_to_assembly[contig.id] = assembly_indexes[assembly_fa]
+                    print(contig, file=contigs_out)
+
+            job_to_assembly.append(assembly_indexes[assembly_fa])
+
+        for f in reads_out + [contigs_out]:
+            pyfastaq.utils.close(f)
+
+        return contig_to_assembly, job_to_assembly
+
+
+    @staticmethod
+    def _split_bam(bam, outfiles, contig_to_assembly, job_to_assembly):
+        '''Splits the sorted BAM file bam (made by mapping the reads written by
+           _write_reads_and_assemblies) into one sorted and indexed BAM file per job.
+           Returns the set of indexes of the jobs whose BAM file might not be the same as
+           mapping the reads of the job on their own. Those jobs have a read that
+           mapped to a different assembly, a mate that mapped to a different assembly, or a
+           read with an XS tag (its second best hit could be in a different assembly, which
+           changes the mapping quality)'''
+        sam_reader = pysam.Samfile(bam, 'rb')
+        assembly_contigs = [[] for x in range(max(job_to_assembly) + 1)]
+        new_tid = {-1: -1}
+        for tid, (name, length) in enumerate(zip(sam_reader.references, sam_reader.lengths)):
+            contigs = assembly_contigs[contig_to_assembly[name]]
+            new_tid[tid] = len(contigs)
+            contigs.append({'SN': name, 'LN': length})
+
+        writers = []
+        for outfile, assembly in zip(outfiles, job_to_assembly):
+            header = {'HD': {'VN': '1.0', 'SO': 'coordinate'}, 'SQ': assembly_contigs[assembly]}
+            writers.append(pysam.Samfile(outfile, 'wb', header=header))
+
+        jobs_to_remap = set()
+
+        for read in sam_reader.fetch(until_eof=True):
+            job, read_name = read.qname.split('.', maxsplit=1)
+            job = int(job) - 1
+            if job in jobs_to_remap:
+                continue
+
+            assembly = job_to_assembly[job]
+            if (read.tid >= 0 and contig_to_assembly[sam_reader.references[read.tid]] != assembly) \
+              or (read.rnext >= 0 and contig_to_assembly[sam_reader.references[read.rnext]] != assembly) \
+              or read.has_tag('XS'):
+                jobs_to_remap.add(job)
+                continue
+
+            read.qname = read_name
+            read.tid = new_tid[read.tid]
+            read.rnext = new_tid[read.rnext]
+            writers[job].write(read)
+
+        sam_reader.close()
+        for writer, outfile in zip(writers, outfiles):
+            writer.close()
+            pysam.index(outfile)
+
+        return jobs_to_remap
+
+
+    def run(self):
+        try:
+            os.mkdir(self.working_dir)
+        except:
+            raise Error('Error mkdir ' + self.working_dir)
+
+        log_fh = pyfastaq.utils.open_file_write(self.logfile)
+        print('{:_^79}'.format(' LOG FILE START batch mapping ' + self.working_dir + ' '), file=log_fh, flush=True)
+        contig_to_assembly, job_to_assembly = self._write_reads_and_assemblies()
+        print('Mapping reads from', len(self.jobs), 'jobs to', len(contig_to_assembly), 'contigs', file=log_fh, flush=True)
+
+        mapping.run_bowtie2(
+            self.reads1,
+            self.reads2,
+            self.assemblies_fa,
+            self.bam_prefix,
+            threads=self.threads,
+            sort=True,
+            samtools=self.samtools_exe,
+            bowtie2=self.bowtie2_exe,
+            bowtie2_preset=self.bowtie2_preset,
+            verbose=True,
+            verbose_filehandle=log_fh
+        )
+
+        jobs_to_remap = self._split_bam(self.bam_prefix + '.bam', [x[3] for x in self.jobs], contig_to_assembly, job_to_assembly)
+        print('Reads of', len(jobs_to_remap), 'jobs need mapping again on their own', file=log_fh, flush=True)
+
+        for i in sorted(jobs_to_remap):
+            reads_1, reads_2, assembly_fa, bam_out = self.jobs[i]
+            print('Mapping again reads', reads_1, reads_2, 'to', assembly_fa, file=log_fh, flush=True)
+            mapping.run_bowtie2(
+                reads_1,
+                reads_2,
+                assembly_fa,
+                bam_out[:-4],
+                threads=self.threads,
+                sort=True,
+                samtools=self.samtools_exe,
+                bowtie2=self.bowtie2_exe,
+                bowtie2_preset=self.bowtie2_preset,
+                verbose=True,
+                verbose_filehandle=log_fh
+            )
+
+        print('{:_^79}'.format(' LOG FILE END batch mapping ' + self.working_dir + ' '), file=log_fh, flush=True)
+        pyfastaq.utils.close(log_fh)
+
+        if self.clean:
+            shutil.rmtree(self.working_dir)
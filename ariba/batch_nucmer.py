@@ -0,0 +1,181 @@
+import os
+import shutil
+import pyfastaq
+from ariba import common, external_progs, pairwise_aligner
+
+class Error (Exception): pass
+
+
+class BatchNucmer:
+    def __init__(self,
+      jobs,
+      working_dir,
+      min_id=90,
+      min_length=20,
+      breaklen=200,
+      aligner='nucmer',
+      extern_progs=None,
+      clean=True,
+    ):
+        '''Aligns the contigs of several clusters to their references with one run of
+           nucmer, instead of one run per cluster.
+           jobs = list of tuples (reference_fa, contigs_fa, coords_out), one per cluster.
+           The hits of each job's contigs to its reference(s) are written to coords_out, and
+           the snps to coords_out.snps, in the same format made by pymummer.nucmer.Runner.
+           Sequence names must be unique across all the jobs. Hits between a contig and a
+           reference from different jobs are removed before the snps are found, so that
+           the snps of each job are the same as when it is aligned on its own.
+           The MUMmer programs are run from the same directory as the nucmer in extern_progs
+           (if extern_progs is None, then it is made when needed)'''
+        self.jobs = jobs
+        self.working_dir = os.path.abspath(working_dir)
+        self.min_id = min_id
+        self.min_length = min_length
+        self.breaklen = breaklen
+        self.aligner = aligner
+        self.extern_progs = extern_progs
+        self.clean = clean
+
+        self.refs_fa = os.path.join(self.working_dir, 'references.fa')
+        self.contigs_fa = os.path.join(self.working_dir, 'contigs.fa')
+        self.coords_file = os.path.join(self.working_dir, 'contigs_vs_refs.coords')
+        self.delta_file = os.path.join(self.working_dir, 'contigs_vs_refs.delta')
+
+
+    @staticmethod
+    def _cat_files(infiles, outfile):
+        '''Writes all sequences in infiles to outfile. Returns dict of
+           sequence name -> index of the input file it came from'''
+        seq_to_file = {}
+        f = pyfastaq.utils.open_file_write(outfile)
+
+        for i, filename in enumerate(infiles):
+            for seq in pyfastaq.sequences.file_reader(filename):
+                if seq.id in seq_to_file:
+                    raise Error('Sequence name ' + seq.id + ' found more than once. Cannot continue')
+                seq_to_file[seq.id] = i
+                print(seq, file=f)
+
+        pyfastaq.utils.close(f)
+        return seq_to_file
+
+
+    @staticmethod
+    def _split_nucmer_file(infile, outfiles, ref_to_job, contig_to_job):
+        '''Splits a coords or snps file into one file per job. A line is written to
+           outfiles[i] if its reference and contig are both from job i. The header
+           lines are written to every output file'''
+        filehandles = [pyfastaq.utils.open_file_write(x) for x in outfiles]
+        f_in = pyfastaq.utils.open_file_read(infile)
+
+        for line in f_in:
+            if line.startswith('[') or '\t' not in line:
+                for f_out in filehandles:
+                    print(line, end='', file=f_out)
+            else:
+                ref_name, contig_name = line.rstrip().split('\t')[-2:]
+                job = ref_to_job[ref_name]
+                if contig_to_job[contig_name] == job:
+                    print(line, end='', file=filehandles[job])
+
+        pyfastaq.utils.close(f_in)
+        for f_out in filehandles:
+            pyfastaq.utils.close(f_out)
+
+
+    @staticmethod
+    def _filter_delta_file(infile, outfile, ref_to_job, contig_to_job):
+        '''Writes a copy of the nucmer delta file infile, but only keeping the
+           alignments between a reference and a contig from the same job'''
+        f_in = pyfastaq.utils.open_file_read(infile)
+        f_out = pyfastaq.utils.open_file_write(outfile)
+        keep = True
+
+        for i, line in enumerate(f_in):
+            if i >= 2 and line.startswith('>'):
+                ref_name, contig_name = line[1:].split()[:2]
+                keep = ref_to_job[ref_name] == contig_to_job[contig_name]
+
+            if keep:
+                print(line, end='', file=f_out)
+
+        pyfastaq.utils.close(f_in)
+        pyfastaq.utils.close(f_out)
+
+
+    def _mummer_exe(self, prog):
+        '''Returns the path to the MUMmer program prog (eg show-snps), which
+           is in the same directory as the configured nucmer'''
+        if self.extern_progs is None:
+            self.extern_progs = external_progs.ExternalProgs()
+        return os.path.join(os.path.dirname(self.extern_progs.exe('nucmer')), prog)
+
+
+    def _run_nucmer(self, ref_to_job, contig_to_job):
+        '''Runs nucmer and delta-filter once on all the jobs, with the same options used
+           by pymummer.nucmer.Runner. Then removes the alignments between different jobs,
+           runs show-coords and show-snps once, and splits their output into the files of each job'''
+        nucmer_prefix = self.delta_file[:-6]
+        filtered_delta = self.delta_file + '.filter'
+        jobs_delta = self.delta_file + '.jobs'
+        nucmer_command = [self._mummer_exe('nucmer'), '-p', nucmer_prefix]
+        if self.breaklen is not None:
+            nucmer_command.extend(['-b', str(self.breaklen)])
+        nucmer_command.extend(['--maxmatch', self.refs_fa, self.contigs_fa])
+        common.syscall(' '.join(nucmer_command))
+
+        filter_command = [self._mummer_exe('delta-filter')]
+        if self.min_id is not None:
+            filter_command.extend(['-i', str(self.min_id)])
+        if self.min_length is not None:
+            filter_command.extend(['-l', str(self.min_length)])
+        filter_command.extend([self.delta_file, '>', filtered_delta])
+        common.syscall(' '.join(filter_command))
+
+        # show-snps -C leaves out snps where the reference or contig is in more than one hit.
+        # Only keeping hits within each job means this is done per job, as if each job was run on its own
+        self._filter_delta_file(filtered_delta, jobs_delta, ref_to_job, contig_to_job)
+        common.syscall(' '.join([self._mummer_exe('show-coords'), '-dTlro', jobs_delta, '>', self.coords_file]))
+        common.syscall(' '.join([self._mummer_exe('show-snps'), '-TClr', jobs_delta, '>', self.coords_file + '.snps']))
+        self._split_output_files(ref_to_job, contig_to_job)
+
+
+    def _run_internal_aligner(self, ref_to_job, contig_to_job):
+        '''Runs pairwise_aligner.Runner once on all the jobs, only aligning each
+           contig to the references of its own job'''
+        pairwise_aligner.Runner(
+            self.refs_fa,
+            self.contigs_fa,
+            self.coords_file,
+            min_id=self.min_id,
+            min_length=self.min_length,
+            breaklen=self.breaklen,
+            maxmatch=True,
+            show_snps=True,
+            seq_groups={**ref_to_job, **contig_to_job},
+        ).run()
+        self._split_output_files(ref_to_job, contig_to_job)
+
+
+    def _split_output_files(self, ref_to_job, contig_to_job):
+        coords_outfiles = [x[2] for x in self.jobs]
+        self._split_nucmer_file(self.coords_file, coords_outfiles, ref_to_job, contig_to_job)
+        self._split_nucmer_file(self.coords_file + '.snps', [x + '.snps' for x in coords_outfiles], ref_to_job, contig_to_job)
+
+
+    def run(self):
+        try:
+            os.mkdir(self.working_dir)
+        except:
+            raise Error('Error mkdir ' + self.working_dir)
+
+        ref_to_job = self._cat_files([x[0] for x in self.jobs], self.refs_fa)
+        contig_to_job = self._cat_files([x[1] for x in self.jobs], self.contigs_fa)
+
+        if self.aligner == 'internal':
+            self._run_internal_aligner(ref_to_job, contig_to_job)
+        else:
+            self._run_nucmer(ref_to_job, contig_to_job)
+
+        if self.clean:
+            shutil.rmtree(self.working_dir)
@@ -0,0 +1,188 @@
+import os
+import time
+import multiprocessing
+import pyfastaq
+from ariba import report_filter, results_db
+
+class Error (Exception): pass
+
+index_columns = ['number', 'infile', 'sample', 'outfile', 'lines_in', 'lines_out', 'seconds', 'lines_per_second', 'error']
+
+_filter_options = None # set in each process of the pool, so that it is only sent once to each process
+
+
+def _init_filter_options(filter_options):
+    global _filter_options
+    _filter_options = filter_options
+
+
+def _filter_one_report(job):
+    '''Filters one report. job = tuple (number, infile, sample, outprefix, streaming).
+       sample is None if infile is a report tsv file, otherwise infile is a results
+       database and the unfiltered report records of sample are used. Uses the
+       filter options set by _init_filter_options. Returns list of values in the same
+       order as index_columns'''
+    number, infile, sample, outprefix, streaming = job
+    start_time = time.time()
+
+    try:
+        if sample is not None:
+            db = results_db.ResultsDb(infile)
+            records = db.report_records(sample, filtered=False)
+            db.close()
+            rf = report_filter.ReportFilter(records=records, **_filter_options)
+            lines_in = rf.lines_in
+            rf.run(outprefix)
+            lines_out = len(rf.report_dicts())
+        elif streaming:
+            rf = report_filter.ReportFilter(**_filter_options)
+            lines_in, lines_out = rf.run_streaming(infile, outprefix)
+        else:
+            rf = report_filter.ReportFilter(infile=infile, **_filter_options)
+            lines_in = rf.lines_in
+            rf.run(outprefix)
+            lines_out = len(rf.report_dicts())
+        error = '.'
+    except Exception as e:
+        lines_in, lines_out = '.', '.'
+        error = str(e).replace('\n', ' ').replace('\t', ' ')
+
+    seconds = round(time.time() - start_time, 3)
+    lines_per_second = round(lines_in / seconds) if error == '.' and seconds > 0 else '.'
+    return [number, infile, '.' if sample is None else sample, outprefix + '.tsv', lines_in, lines_out, seconds, lines_per_second, error]
+
+
+class BatchReportFilter:
+    def __init__(self,
+      infiles,
+      outdir,
+      threads=1,
+      streaming=False,
+      min_pc_ident=90,
+      min_ref_base_assembled=1,
+      ignore_not_has_known_variant=False,
+      remove_synonymous_snps=True,
+      exclude_flags=None,
+      results_dbs=False,
+      samples=None,
+      verbose=False,
+    ):
+        '''Filters many report files with the same options, using a pool of threads processes.
+           infiles = list of report files. The filtered report of the nth file (counting from 1)
+           is written to outdir/n.tsv. The file outdir/index.tsv has the input and output filenames,
+           number of lines in and out, and time taken for each file, sorted by number. If verbose,
+           then each line of the index is also printed to stdout as each file is finished,
+           so these lines are not necessarily in order when threads > 1.
+           If results_dbs is True, then infiles are results databases instead of report files,
+           and each sample in each database is filtered as if it were a separate report file.
+           samples = optional list of sample names, to only filter those samples'''
+        if results_dbs and streaming:
+            raise Error('Cannot use streaming with results databases')
+
+        self.infiles = infiles
+        self.outdir = os.path.abspath(outdir)
+        self.threads = threads
+        self.streaming = streaming
+        self.results_dbs = results_dbs
+        self.samples = samples
+        self.filter_options = {
+            'min_pc_ident': min_pc_ident,
+            'min_ref_base_assembled': min_ref_base_assembled,
+            'ignore_not_has_known_variant': ignore_not_has_known_variant,
+            'remove_synonymous_snps': remove_synonymous_snps,
+            'exclude_flags': exclude_flags,
+        }
+        self.verbose = verbose
+        self.index_file = os.path.join(self.outdir, 'index.tsv')
+
+
+    @staticmethod
+    def load_fofn(fofn):
+        '''Returns list of filenames in the file fofn, one per line (blank lines are ignored)'''
+        f = pyfastaq.utils.open_file_read(fofn)
+        filenames = [x.rstrip() for x in f if x.strip() != '']
+        pyfastaq.utils.close(f)
+        return filenames
+
+
+    def _inputs(self):
+        '''Returns list of tuples (infile, sample), one for each report to be filtered'''
+        if not self.results_dbs:
+            return [(os.path.abspath(x), None) for x in self.infiles]
+
+        inputs = []
+        samples_found = set()
+
+        for infile in self.infiles:
+            if not os.path.exists(infile):
+                raise Error('Results database not found: ' + infile)
+            db = results_db.ResultsDb(infile)
+            for sample in db.sample_names():
+                if self.samples is None or sample in self.samples:
+                    inputs.append((os.path.abspath(infile), sample))
+                    samples_found.add(sample)
+            db.close()
+
+        if self.samples is not None:
+            not_found = [x for x in self.samples if x not in samples_found]
+            if len(not_found) > 0:
+                raise Error('Samples not found in results databases: ' + ', '.join(not_found))
+
+        return inputs
+
+
+    def _jobs(self):
+        return [(i + 1, infile, sample, os.path.join(self.outdir, str(i + 1)), self.streaming) for i, (infile, sample) in enumerate(self._inputs())]
+
+
+    def run(self):
+        jobs = self._jobs()
+
+        try:
+            os.mkdir(self.outdir)
+        except:
+            raise Error('Error mkdir ' + self.outdir)
+
+        start_time = time.time()
+
+        if self.threads > 1:
+            pool = multiprocessing.Pool(self.threads, initializer=_init_filter_options, initargs=(self.filter_options,))
+            results = pool.imap_unordered(_filter_one_report, jobs)
+        else:
+            pool = None
+            _init_filter_options(self.filter_options)
+            results = map(_filter_one_report, jobs)
+
+        if self.verbose:
+            print('\t'.join(index_columns), flush=True)
+
+        # Results come back in the order the files finish, so that one slow file
+        # does not hold back the others. The index file is sorted by number
+        finished = []
+        failed = 0
+        total_lines = 0
+        for result in results:
+            finished.append(result)
+            if self.verbose:
+                print('\t'.join([str(x) for x in result]), flush=True)
+            if result[-1] == '.':
+                total_lines += result[4]
+            else:
+                failed += 1
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        f = pyfastaq.utils.open_file_write(self.index_file)
+        print('#' + '\t'.join(index_columns), file=f)
+        for result in sorted(finished):
+            print('\t'.join([str(x) for x in result]), file=f)
+        pyfastaq.utils.close(f)
+
+        if self.verbose:
+            seconds = time.time() - start_time
+            print('Filtered', len(jobs), 'reports with', total_lines, 'lines in total, in', round(seconds, 3), 'seconds', flush=True)
+
+        if failed > 0:
+            raise Error('Error filtering ' + str(failed) + ' of ' + str(len(jobs)) + ' reports. See ' + self.index_file + ' for details')
@@ -0,0 +1,137 @@
+import os
+import shutil
+import pysam
+import pyfastaq
+from ariba import common, samtools_variants
+
+class Error (Exception): pass
+
+
+class BatchSamtoolsVariants:
+    def __init__(self,
+      jobs,
+      working_dir,
+      logfile,
+      samtools_exe='samtools',
+      bcftools_exe='bcftools',
+      bcf_min_dp=10,
+      bcf_min_dv=5,
+      bcf_min_dv_over_dp=0.3,
+      bcf_min_qual=20,
+      regions=None,
+      clean=True,
+    ):
+        '''Calls variants for several clusters with one run of samtools mpileup and bcftools,
+           instead of one run per cluster.
+           jobs = list of tuples (ref_fa, bam, outprefix), one per cluster. The BAM files are
+           merged and the reference files concatenated, so sequence names must be unique across
+           all the jobs. For each job, the VCF and read depths files are written to the same
+           filenames that SamtoolsVariants(ref_fa, bam, outprefix).run() makes, so that the results
+           can be used by making a SamtoolsVariants object with the same outprefix (without running it).
+           regions = as for SamtoolsVariants, for the sequences of all the jobs'''
+        self.jobs = jobs
+        self.working_dir = os.path.abspath(working_dir)
+        self.logfile = logfile
+        self.samtools_exe = samtools_exe
+        self.bcftools_exe = bcftools_exe
+        self.bcf_min_dp = bcf_min_dp
+        self.bcf_min_dv = bcf_min_dv
+        self.bcf_min_dv_over_dp = bcf_min_dv_over_dp
+        self.bcf_min_qual = bcf_min_qual
+        self.regions = regions
+        self.clean = clean
+
+        self.refs_fa = os.path.join(self.working_dir, 'references.fa')
+        self.bam = os.path.join(self.working_dir, 'merged.bam')
+
+
+    def _cat_refs(self):
+        '''Writes all the reference sequences to one file. Returns dict of
+           sequence name -> index of the job it came from'''
+        seq_to_job = {}
+        f = pyfastaq.utils.open_file_write(self.refs_fa)
+
+        for i, (ref_fa, bam, outprefix) in enumerate(self.jobs):
+            for seq in pyfastaq.sequences.file_reader(ref_fa):
+                if seq.id in seq_to_job:
+                    raise Error('Sequence name ' + seq.id + ' found more than once. Cannot continue')
+                seq_to_job[seq.id] = i
+                print(seq, file=f)
+
+        pyfastaq.utils.close(f)
+        return seq_to_job
+
+
+    @staticmethod
+    def _split_vcf(infile, outfiles, seq_to_job):
+        '''Writes the header of the VCF file infile to every file in outfiles,
+           and each record to the outfile of the job that its sequence came from'''
+        filehandles = [pyfastaq.utils.open_file_write(x) for x in outfiles]
+        f_in = pyfastaq.utils.open_file_read(infile)
+
+        for line in f_in:
+            if line.startswith('#'):
+                for f_out in filehandles:
+                    print(line, end='', file=f_out)
+            else:
+                print(line, end='', file=filehandles[seq_to_job[line.split('\t', maxsplit=1)[0]]])
+
+        pyfastaq.utils.close(f_in)
+        for f_out in filehandles:
+            pyfastaq.utils.close(f_out)
+
+
+    @staticmethod
+    def _split_read_depths(infile, outfiles, seq_to_job):
+        '''Splits the read depths file infile (made by SamtoolsVariants) by job.
+           Each output file is bgzipped and tabix indexed'''
+        filehandles = [pyfastaq.utils.open_file_write(x + '.tmp') for x in outfiles]
+        f_in = pyfastaq.utils.open_file_read(infile)
+
+        for line in f_in:
+            print(line, end='', file=filehandles[seq_to_job[line.split('\t', maxsplit=1)[0]]])
+
+        pyfastaq.utils.close(f_in)
+        for f_out, outfile in zip(filehandles, outfiles):
+            pyfastaq.utils.close(f_out)
+            pysam.tabix_compress(outfile + '.tmp', outfile, force=True)
+            pysam.tabix_index(outfile, seq_col=0, start_col=1, end_col=1, force=True)
+            os.unlink(outfile + '.tmp')
+
+
+    def run(self):
+        try:
+            os.mkdir(self.working_dir)
+        except:
+            raise Error('Error mkdir ' + self.working_dir)
+
+        log_fh = pyfastaq.utils.open_file_write(self.logfile)
+        print('{:_^79}'.format(' LOG FILE START batch variant calling ' + self.working_dir + ' '), file=log_fh, flush=True)
+        seq_to_job = self._cat_refs()
+        cmd = ' '.join([self.samtools_exe, 'merge', '-f', self.bam] + [x[1] for x in self.jobs])
+        common.syscall(cmd, verbose=True, verbose_filehandle=log_fh)
+
+        merged_vars = samtools_variants.SamtoolsVariants(
+            self.refs_fa,
+            self.bam,
+            self.bam,
+            log_fh=log_fh,
+            samtools_exe=self.samtools_exe,
+            bcftools_exe=self.bcftools_exe,
+            bcf_min_dp=self.bcf_min_dp,
+            bcf_min_dv=self.bcf_min_dv,
+            bcf_min_dv_over_dp=self.bcf_min_dv_over_dp,
+            bcf_min_qual=self.bcf_min_qual,
+            regions=self.regions,
+        )
+        merged_vars.run()
+
+        outprefixes = [os.path.abspath(x[2]) for x in self.jobs]
+        self._split_vcf(merged_vars.vcf_file, [x + '.vcf' for x in outprefixes], seq_to_job)
+        self._split_read_depths(merged_vars.read_depths_file, [x + '.read_depths.gz' for x in outprefixes], seq_to_job)
+        print('Split variant calls into', len(self.jobs), 'clusters', file=log_fh)
+        print('{:_^79}'.format(' LOG FILE END batch variant calling ' + self.working_dir + ' '), file=log_fh, flush=True)
+        pyfastaq.utils.close(log_fh)
+
+        if self.clean:
+            shutil.rmtree(self.working_dir)
@@ -16,6 +16,7 @@ class BestSeqChooser:
         bowtie2_exe='bowtie2',
         bowtie2_preset='very-sensitive-local',
         threads=1,
+        read_counts=None,
     ):
         self.reads1 = reads1
         self.reads2 = reads2
@@ -25,9 +26,12 @@ class BestSeqChooser:
         self.bowtie2_exe = bowtie2_exe
         self.bowtie2_preset = bowtie2_preset
         self.threads = threads
+        self.read_counts = read_counts
 
 
-    def _total_alignment_score(self, seq_name):
+    def _total_alignment_score(self, seq_name, bam_out=None):
+        '''Maps the reads to the sequence seq_name and returns the total alignment score.
+           If bam_out is given, the (unsorted) BAM file is kept and renamed to bam_out'''
         tmpdir = tempfile.mkdtemp(prefix='tmp.get_total_aln_score.', dir=os.getcwd())
         tmp_bam = os.path.join(tmpdir, 'tmp.get_total_alignment_score.bam')
         tmp_fa = os.path.join(tmpdir, 'tmp.get_total_alignment_score.ref.fa')
@@ -54,12 +58,17 @@ class BestSeqChooser:
             verbose_filehandle=self.log_fh
         )
 
-        score = mapping.get_total_alignment_score(tmp_bam)
+        score = mapping.get_total_alignment_score(tmp_bam, read_counts=self.read_counts)
+        if bam_out is not None:
+            os.rename(tmp_bam, bam_out)
         shutil.rmtree(tmpdir)
         return score
 
 
-    def _get_best_seq_by_alignment_score(self):
+    def _get_best_seq_by_alignment_score(self, bam_out=None):
+        '''Returns the name of the sequence with the best total alignment score.
+           If bam_out is given, the (unsorted) BAM file of the reads mapped to the
+           best sequence is written to bam_out'''
         total_sequences = pyfastaq.tasks.count_sequences(self.references_fa)
         if total_sequences == 1:
             seqs = {}
@@ -67,29 +76,43 @@ class BestSeqChooser:
             assert len(seqs) == 1
             seq_name = list(seqs.values())[0].id
             print('No need to choose sequence for this cluster because only has one sequence:', seq_name, file=self.log_fh)
+            if bam_out is not None:
+                print('Mapping reads to', seq_name, file=self.log_fh)
+                self._total_alignment_score(seq_name, bam_out=bam_out)
             return seq_name
 
         print('\nChoosing best sequence from cluster of', total_sequences, 'sequences...', file=self.log_fh)
         file_reader = pyfastaq.sequences.file_reader(self.references_fa)
         best_score = 0
         best_seq_name = None
+        seq_bam = None if bam_out is None else bam_out + '.tmp.bam'
         for seq in file_reader:
-            score = self._total_alignment_score(seq.id)
+            score = self._total_alignment_score(seq.id, bam_out=seq_bam)
             print('Total alignment score for sequence', seq.id, 'is', score, file=self.log_fh)
             if score > best_score:
                 best_score = score
                 best_seq_name = seq.id
+                if bam_out is not None:
+                    os.rename(seq_bam, bam_out)
+            elif bam_out is not None:
+                os.unlink(seq_bam)
 
         print('\nBest sequence is', best_seq_name, 'with total alignment score of', best_score, file=self.log_fh)
         print(file=self.log_fh)
         return best_seq_name
 
 
-    def best_seq(self, outfile):
-        '''Finds the closest matchng sequence, writes it to a FASTA file, and returns it as a pyfastaq.sequences.Fasta object'''
-        seq_name = self._get_best_seq_by_alignment_score()
+    def best_seq(self, outfile, bam_out=None):
+        '''Finds the closest matchng sequence, writes it to a FASTA file, and returns it as a pyfastaq.sequences.Fasta object.
+           If bam_out is given, the reads mapped to the chosen sequence are written to the sorted and indexed
+           BAM file bam_out, so that they do not need to be mapped again'''
+        unsorted_bam = None if bam_out is None else bam_out + '.unsorted.bam'
+        seq_name = self._get_best_seq_by_alignment_score(bam_out=unsorted_bam)
         if seq_name is None:
             return None
+        if bam_out is not None:
+            mapping.sort_and_index_bam(unsorted_bam, bam_out, samtools=self.samtools_exe, verbose=True, verbose_filehandle=self.log_fh)
+            os.unlink(unsorted_bam)
         faidx.write_fa_subset([seq_name], self.references_fa, outfile, samtools_exe=self.samtools_exe, verbose=True, verbose_filehandle=self.log_fh)
         seqs = {}
         pyfastaq.tasks.file_to_dict(outfile, seqs)
@@ -6,7 +6,7 @@ import math
 import shutil
 import sys
 import pyfastaq
-from ariba import assembly, assembly_compare, assembly_variants, bam_parse, best_seq_chooser, external_progs, flag, mapping, report, samtools_variants
+from ariba import assembly, assembly_compare, assembly_variants, bam_parse, best_seq_chooser, consensus, external_progs, flag, mapping, pysam_variants, report, samtools_variants
 
 class Error (Exception): pass
 
@@ -47,6 +47,18 @@ class Cluster:
       clean=True,
       extern_progs=None,
       random_seed=42,
+      covered_bases=None,
+      triage=False,
+      remove_duplicates=False,
+      normalise_reads=False,
+      normalise_kmer=20,
+      consensus_min_id=None,
+      consensus_min_depth=10,
+      local_assembler_max_reads=None,
+      aligner='nucmer',
+      reuse_orientation_nucmer=False,
+      restrict_pileup=False,
+      pileup_engine='samtools',
     ):
         self.root_dir = os.path.abspath(root_dir)
         self.read_store = read_store
@@ -64,6 +76,15 @@ class Cluster:
 
         self.total_reads = total_reads
         self.total_reads_bases = total_reads_bases
+        self.covered_bases = covered_bases
+        self.triage = triage
+        self.remove_duplicates = remove_duplicates
+        self.duplicate_read_counts = None
+        self.normalise_reads = normalise_reads
+        self.normalise_kmer = normalise_kmer
+        self.consensus_min_id = consensus_min_id
+        self.consensus_min_depth = consensus_min_depth
+        self.local_assembler_max_reads = local_assembler_max_reads
         self.logfile = logfile
         self.assembly_coverage = assembly_coverage
         self.assembly_kmer = assembly_kmer
@@ -75,8 +96,24 @@ class Cluster:
 
         self.reads_for_assembly1 = os.path.join(self.root_dir, 'reads_for_assembly_1.fq')
         self.reads_for_assembly2 = os.path.join(self.root_dir, 'reads_for_assembly_2.fq')
+        self.deduplicated_reads1 = os.path.join(self.root_dir, 'reads_deduplicated_1.fq')
+        self.deduplicated_reads2 = os.path.join(self.root_dir, 'reads_deduplicated_2.fq')
+        self.consensus_bam = os.path.join(self.root_dir, 'reference.reads_mapped.bam')
+        self.consensus_fa = os.path.join(self.root_dir, 'consensus.fa')
 
         self.ref_sequence = None
+        self.prepared = False
+        self.ready_to_assemble = False
+        self.assembly_reads = None
+        self.assembly_reads_count = None
+        self.assembler_to_use = None
+        self.batch_contigs_fa = None
+        self.waiting_for_alignment = False
+        self.contigs_for_batch_alignment = None
+        self.batch_nucmer_coords = None
+        self.waiting_for_variant_calling = False
+        self.variants_called_in_batch = False
+        self.map_reads_in_batch = False
 
         self.max_insert = max_insert
         self.min_scaff_depth = min_scaff_depth
@@ -84,6 +121,10 @@ class Cluster:
         self.nucmer_min_id = nucmer_min_id
         self.nucmer_min_len = nucmer_min_len
         self.nucmer_breaklen = nucmer_breaklen
+        self.aligner = aligner
+        self.reuse_orientation_nucmer = reuse_orientation_nucmer
+        self.restrict_pileup = restrict_pileup
+        self.pileup_engine = pileup_engine
 
         self.bcf_min_dp = bcf_min_dp
         self.bcf_min_dv = bcf_min_dv
@@ -102,6 +143,7 @@ class Cluster:
         self.assembly_dir = os.path.join(self.root_dir, 'Assembly')
         self.final_assembly_fa = os.path.join(self.root_dir, 'assembly.fa')
         self.final_assembly_bam = os.path.join(self.root_dir, 'assembly.reads_mapped.bam')
+        self.scaffold_graph_bam = os.path.join(self.root_dir, 'assembly.reads_for_assembly_mapped.bam')
         self.final_assembly_read_depths = os.path.join(self.root_dir, 'assembly.reads_mapped.bam.read_depths.gz')
         self.final_assembly_vcf = os.path.join(self.root_dir, 'assembly.reads_mapped.bam.vcf')
         self.samtools_vars_prefix = self.final_assembly_bam
@@ -111,6 +153,7 @@ class Cluster:
         self.mummer_variants = {}
         self.variant_depths = {}
         self.percent_identities = {}
+        self.peak_memory = None
 
         # The log filehandle self.log_fh is set at the start of the run() method.
         # Lots of other methods use self.log_fh. But for unit testing, run() isn't
@@ -197,8 +240,15 @@ class Cluster:
             'assembly.reads_mapped.bam',
             'assembly.reads_mapped.bam.read_depths.gz',
             'assembly.reads_mapped.bam.read_depths.gz.tbi',
+            'assembly.reads_for_assembly_mapped.bam',
+            'assembly.reads_for_assembly_mapped.bam.bai',
+            'consensus.fa',
             'reads_1.fq',
             'reads_2.fq',
+            'reads_deduplicated_1.fq',
+            'reads_deduplicated_2.fq',
+            'reads_for_assembly_1.fq',
+            'reads_for_assembly_2.fq',
             'reference.fa',
         ]
 
@@ -209,6 +259,30 @@ class Cluster:
                 self._clean_file(filename)
 
 
+    @staticmethod
+    def _triage_fail_reason(ref_length, total_reads, total_reads_bases, covered_bases, assembled_threshold, max_gene_nt_extend):
+        '''Cheap check of whether a cluster could possibly get the assembled flag, which needs
+           (2 * max_gene_nt_extend + ref bases assembled) / ref_length >= assembled_threshold.
+           covered_bases = number of bases of the reference covered by mapped reads, or None if not known.
+           Returns None if the cluster could be assembled, otherwise a string saying why it cannot'''
+        needed_bases = assembled_threshold * ref_length - 2 * max_gene_nt_extend
+        if needed_bases <= 0:
+            return None
+
+        if total_reads < 2:
+            return 'Less than one read pair'
+
+        if total_reads_bases < needed_bases:
+            return 'Total bases in reads (' + str(total_reads_bases) + ') too low to assemble ' + str(needed_bases) + ' bases of the reference'
+
+        # Allow for soft-clipped ends of reads, which the assembler could still use
+        mean_read_length = total_reads_bases / total_reads
+        if covered_bases is not None and covered_bases + mean_read_length < needed_bases:
+            return 'Reads only cover ' + str(covered_bases) + ' bases of the reference, but ' + str(needed_bases) + ' bases are needed'
+
+        return None
+
+
     @staticmethod
     def _number_of_reads_for_assembly(reference_fa, insert_size, total_bases, total_reads, coverage):
         file_reader = pyfastaq.sequences.file_reader(reference_fa)
@@ -259,23 +333,110 @@ class Cluster:
             return total_reads
 
 
-    def run(self):
-        self._set_up_input_files()
+    @staticmethod
+    def _normalise_reads_for_assembly(target_coverage, reads_in1, reads_in2, reads_out1, reads_out2, kmer=20):
+        '''Digital normalisation of reads. Streams through the read pairs, counting the (canonical) kmers
+           of the pairs that are kept. A pair is kept only if the median count of its kmers is
+           less than target_coverage, so high coverage regions are thinned out but low coverage
+           regions keep all their reads. Returns total number of reads in output files.'''
+        revcomp_table = str.maketrans('ACGTacgt', 'TGCAtgca')
+        kmer_counts = {}
+        reads_written = 0
+        file_reader1 = pyfastaq.sequences.file_reader(reads_in1)
+        file_reader2 = pyfastaq.sequences.file_reader(reads_in2)
+        out1 = pyfastaq.utils.open_file_write(reads_out1)
+        out2 = pyfastaq.utils.open_file_write(reads_out2)
+
+        for read1 in file_reader1:
+            try:
+                read2 = next(file_reader2)
+            except StopIteration:
+                pyfastaq.utils.close(out1)
+                pyfastaq.utils.close(out2)
+                raise Error('Error normalising reads. No mate found for read ' + read1.id)
+
+            kmers = []
+            for seq in (read1.seq.upper(), read2.seq.upper()):
+                revcomp = seq[::-1].translate(revcomp_table)
+                for i in range(len(seq) - kmer + 1):
+                    kmers.append(min(seq[i:i + kmer], revcomp[len(seq) - i - kmer:len(seq) - i]))
+
+            if len(kmers) > 0:
+                counts = sorted([kmer_counts.get(x, 0) for x in kmers])
+                if counts[len(counts) // 2] >= target_coverage:
+                    continue
 
-        for fname in [self.all_reads1, self.all_reads2, self.references_fa]:
-            if not os.path.exists(fname):
-                raise Error('File ' + fname + ' not found. Cannot continue')
+                for x in kmers:
+                    kmer_counts[x] = kmer_counts.get(x, 0) + 1
 
+            print(read1, file=out1)
+            print(read2, file=out2)
+            reads_written += 2
+
+        pyfastaq.utils.close(out1)
+        pyfastaq.utils.close(out2)
+        return reads_written
+
+
+    @staticmethod
+    def _remove_duplicate_read_pairs(reads_in1, reads_in2, reads_out1, reads_out2):
+        '''Writes one copy of each read pair, where pairs are duplicates if both mates have
+           identical sequences. The first pair seen is the one that is kept.
+           Returns a tuple: (number of reads written, dict of read name (without the /1 or /2) -> number
+           of copies of that pair). The dict only has the pairs with more than one copy'''
+        file_reader1 = pyfastaq.sequences.file_reader(reads_in1)
+        file_reader2 = pyfastaq.sequences.file_reader(reads_in2)
+        out1 = pyfastaq.utils.open_file_write(reads_out1)
+        out2 = pyfastaq.utils.open_file_write(reads_out2)
+        first_seen = {} # (seq1, seq2) -> name of first pair with those sequences
+        counts = {}
+        reads_written = 0
+
+        for read1 in file_reader1:
+            try:
+                read2 = next(file_reader2)
+            except StopIteration:
+                pyfastaq.utils.close(out1)
+                pyfastaq.utils.close(out2)
+                raise Error('Error removing duplicate reads. No mate found for read ' + read1.id)
+
+            key = (read1.seq, read2.seq)
+            if key in first_seen:
+                counts[first_seen[key]] += 1
+            else:
+                name = read1.id[:-2] if read1.id.endswith('/1') else read1.id
+                first_seen[key] = name
+                counts[name] = 1
+                print(read1, file=out1)
+                print(read2, file=out2)
+                reads_written += 2
+
+        pyfastaq.utils.close(out1)
+        pyfastaq.utils.close(out2)
+        return reads_written, {x: counts[x] for x in counts if counts[x] > 1}
+
+
+    def _run_in_root_dir(self, method):
+        '''Calls method with the log file open and the working directory set to self.root_dir'''
         if self.logfile is None:
             self.logfile = os.path.join(self.root_dir, 'log.txt')
 
-        self.log_fh = pyfastaq.utils.open_file_write(self.logfile)
+        if self.prepared:
+            self.log_fh = open(self.logfile, 'a')
+        else:
+            self._set_up_input_files()
+
+            for fname in [self.all_reads1, self.all_reads2, self.references_fa]:
+                if not os.path.exists(fname):
+                    raise Error('File ' + fname + ' not found. Cannot continue')
+
+            self.log_fh = pyfastaq.utils.open_file_write(self.logfile)
 
         original_dir = os.getcwd()
         os.chdir(self.root_dir)
 
         try:
-            self._run()
+            method()
         except Error as err:
             os.chdir(original_dir)
             print('Error running cluster! Error was:', err, sep='\n', file=self.log_fh)
@@ -284,6 +445,49 @@ class Cluster:
             raise Error('Error running cluster ' + self.name + '!')
 
         os.chdir(original_dir)
+
+
+    def prepare_for_assembly(self):
+        '''Runs everything up to (but not including) the assembly. After this, the
+           cluster can be assembled as part of a batch with other clusters, by setting
+           self.batch_contigs_fa to the contigs for this cluster and then calling run()'''
+        self._run_in_root_dir(self._run_before_assembly)
+        self.prepared = True
+        pyfastaq.utils.close(self.log_fh)
+        self.log_fh = None
+
+
+    def assemble_for_batch_alignment(self):
+        '''Runs everything up to (but not including) aligning the assembly to the reference.
+           After this, self.contigs_for_batch_alignment is the fasta file of contigs to be aligned
+           to self.reference_fa, or None if there is nothing to align. The alignments can be made
+           for several clusters at once: write them to self.batch_nucmer_coords (and the snps to
+           self.batch_nucmer_coords + ".snps") and then call run()'''
+        self._run_in_root_dir(self._run_up_to_alignment)
+        self.prepared = True
+        self.waiting_for_alignment = True
+        pyfastaq.utils.close(self.log_fh)
+        self.log_fh = None
+
+
+    def run_up_to_variant_calling(self):
+        '''Runs everything up to (but not including) calling variants with samtools.
+           If self.map_reads_in_batch is True, then the reads are not mapped to the assembly.
+           Instead, the jobs returned by batch_mapping_jobs() must be run by
+           batch_mapping.BatchMapping (eg for several clusters at once).
+           If self.assembled_ok is True afterwards, then variants can be called for several
+           clusters at once, writing the files that SamtoolsVariants would make using
+           self.final_assembly_fa, self.final_assembly_bam and self.samtools_vars_prefix.
+           Then set self.variants_called_in_batch to True and call run()'''
+        self._run_in_root_dir(self._run_up_to_variant_calling)
+        self.prepared = True
+        self.waiting_for_variant_calling = True
+        pyfastaq.utils.close(self.log_fh)
+        self.log_fh = None
+
+
+    def run(self):
+        self._run_in_root_dir(self._run)
         print('Finished', file=self.log_fh, flush=True)
         print('{:_^79}'.format(' LOG FILE END ' + self.name + ' '), file=self.log_fh, flush=True)
 
@@ -293,21 +497,50 @@ class Cluster:
         self.log_fh = None
 
 
-    def _run(self):
-        print('{:_^79}'.format(' LOG FILE START ' + self.name + ' '), file=self.log_fh, flush=True)
+    def _make_consensus(self):
+        '''Tries to make a consensus sequence from the pileup of the reads mapped to the chosen
+           reference sequence by BestSeqChooser. Duplicate reads are counted using
+           self.duplicate_read_counts, so that the depth is the depth of all the reads.
+           Returns True iff the consensus was made and written to self.consensus_fa'''
+        print('\nTrying to make consensus of reads mapped to', self.ref_sequence.id, file=self.log_fh, flush=True)
+        consensus_maker = consensus.Consensus(
+            self.consensus_bam,
+            self.ref_sequence,
+            min_depth=self.consensus_min_depth,
+            min_identity=self.consensus_min_id,
+            log_fh=self.log_fh,
+            read_counts=self.duplicate_read_counts,
+        )
+        made_consensus = consensus_maker.run()
+        if made_consensus:
+            with open(self.consensus_fa, 'w') as f:
+                print(consensus_maker.sequence, file=f)
+
+        return made_consensus
+
+
+    def _choose_ref_and_make_assembly_reads(self):
+        if self.remove_duplicates:
+            reads1, reads2 = self.deduplicated_reads1, self.deduplicated_reads2
+            unique_reads, self.duplicate_read_counts = self._remove_duplicate_read_pairs(self.all_reads1, self.all_reads2, reads1, reads2)
+            print('Removed duplicate read pairs. Kept', unique_reads, 'reads from a total of', self.total_reads, file=self.log_fh, flush=True)
+        else:
+            reads1, reads2 = self.all_reads1, self.all_reads2
+            unique_reads = self.total_reads
 
         print('Choosing best reference sequence:', file=self.log_fh, flush=True)
         seq_chooser = best_seq_chooser.BestSeqChooser(
-            self.all_reads1,
-            self.all_reads2,
+            reads1,
+            reads2,
             self.references_fa,
             self.log_fh,
             samtools_exe=self.extern_progs.exe('samtools'),
             bowtie2_exe=self.extern_progs.exe('bowtie2'),
             bowtie2_preset=self.bowtie2_preset,
             threads=1,
+            read_counts=self.duplicate_read_counts,
         )
-        self.ref_sequence = seq_chooser.best_seq(self.reference_fa)
+        self.ref_sequence = seq_chooser.best_seq(self.reference_fa, bam_out=None if self.consensus_min_id is None else self.consensus_bam)
         self._clean_file(self.references_fa)
         self._clean_file(self.references_fa + '.fai')
 
@@ -315,63 +548,239 @@ class Cluster:
             self.status_flag.add('ref_seq_choose_fail')
             self.assembled_ok = False
         else:
-            wanted_reads = self._number_of_reads_for_assembly(self.reference_fa, self.reads_insert, self.total_reads_bases, self.total_reads, self.assembly_coverage)
-            made_reads = self._make_reads_for_assembly(wanted_reads, self.total_reads, self.all_reads1, self.all_reads2, self.reads_for_assembly1, self.reads_for_assembly2, random_seed=self.random_seed)
-            print('\nUsing', made_reads, 'from a total of', self.total_reads, 'for assembly.', file=self.log_fh, flush=True)
-            print('Assembling reads:', file=self.log_fh, flush=True)
             self.ref_sequence_type = self.refdata.sequence_type(self.ref_sequence.id)
             assert self.ref_sequence_type is not None
-            self.assembly = assembly.Assembly(
-              self.reads_for_assembly1,
-              self.reads_for_assembly2,
-              self.reference_fa,
-              self.assembly_dir,
-              self.final_assembly_fa,
-              self.final_assembly_bam,
-              self.log_fh,
-              scaff_name_prefix=self.ref_sequence.id,
-              kmer=self.assembly_kmer,
-              assembler=self.assembler,
-              spades_other_options=self.spades_other_options,
-              sspace_k=self.sspace_k,
-              sspace_sd=self.sspace_sd,
-              reads_insert=self.reads_insert,
-              extern_progs=self.extern_progs,
-              clean=self.clean
-            )
 
-            self.assembly.run()
-            self.assembled_ok = self.assembly.assembled_ok
+            if self.consensus_min_id is None:
+                made_consensus = False
+            else:
+                made_consensus = self._make_consensus()
+                self._clean_file(self.consensus_bam)
+                self._clean_file(self.consensus_bam + '.bai')
+
+            if made_consensus:
+                print('\nUsing consensus of reads mapped to', self.ref_sequence.id, 'instead of assembling reads', file=self.log_fh, flush=True)
+                self.status_flag.add('assembled_by_consensus')
+                self.assembly_reads = (reads1, reads2)
+                self.assembly_reads_count = unique_reads
+                self.assembler_to_use = self.assembler
+            else:
+                if self.normalise_reads:
+                    made_reads = self._normalise_reads_for_assembly(self.assembly_coverage, reads1, reads2, self.reads_for_assembly1, self.reads_for_assembly2, kmer=self.normalise_kmer)
+                else:
+                    wanted_reads = self._number_of_reads_for_assembly(self.reference_fa, self.reads_insert, self.total_reads_bases, self.total_reads, self.assembly_coverage)
+                    made_reads = self._make_reads_for_assembly(wanted_reads, unique_reads, reads1, reads2, self.reads_for_assembly1, self.reads_for_assembly2, random_seed=self.random_seed)
+                print('\nUsing', made_reads, 'from a total of', unique_reads, 'for assembly.', file=self.log_fh, flush=True)
+                self.assembly_reads = (self.reads_for_assembly1, self.reads_for_assembly2)
+                self.assembly_reads_count = made_reads
+                if self.local_assembler_max_reads is not None and made_reads <= self.local_assembler_max_reads:
+                    self.assembler_to_use = 'local'
+                else:
+                    self.assembler_to_use = self.assembler
+
+            self.ready_to_assemble = True
+
+
+    def _assemble(self, stop_before_orientation=False):
+        if self.batch_contigs_fa is None:
+            print('Assembling reads with assembler:', self.assembler_to_use, file=self.log_fh, flush=True)
+        else:
+            print('Using contigs from batch assembly:', self.batch_contigs_fa, file=self.log_fh, flush=True)
+
+        self.assembly = assembly.Assembly(
+          self.assembly_reads[0],
+          self.assembly_reads[1],
+          self.reference_fa,
+          self.assembly_dir,
+          self.final_assembly_fa,
+          self.final_assembly_bam,
+          self.log_fh,
+          scaff_name_prefix=self.ref_sequence.id,
+          kmer=self.assembly_kmer,
+          assembler=self.assembler_to_use,
+          spades_other_options=self.spades_other_options,
+          sspace_k=self.sspace_k,
+          sspace_sd=self.sspace_sd,
+          reads_insert=self.reads_insert,
+          extern_progs=self.extern_progs,
+          clean=self.clean,
+          contigs_fa=self.batch_contigs_fa,
+          nucmer_min_id=self.nucmer_min_id,
+          nucmer_min_len=self.nucmer_min_len,
+          nucmer_breaklen=self.nucmer_breaklen,
+          nucmer_coords_out=self.assembly_compare_prefix + '.nucmer.coords' if self.reuse_orientation_nucmer or stop_before_orientation else None,
+          aligner=self.aligner,
+          map_reads=not self.map_reads_in_batch,
+        )
+
+        if self.status_flag.has('assembled_by_consensus'):
+            self.assembly.run_with_consensus(self.consensus_fa)
+            self._clean_file(self.consensus_fa)
+        else:
+            self.assembly.run(stop_before_orientation=stop_before_orientation)
+            self._clean_reads_for_assembly()
+            if self.batch_contigs_fa is not None:
+                self._clean_file(self.batch_contigs_fa)
+
+        self.assembled_ok = self.assembly.assembled_ok
+        if not stop_before_orientation:
+            self._clean_assembly_files()
+
+
+    def _finish_assembly_after_alignment(self):
+        '''Finishes the assembly started by _assemble(stop_before_orientation=True), using
+           the nucmer files self.batch_nucmer_coords and self.batch_nucmer_coords.snps'''
+        print('Using alignment of assembly to reference from batch alignment:', self.batch_nucmer_coords, file=self.log_fh, flush=True)
+        if self.status_flag.has('assembled_by_consensus'):
+            os.rename(self.batch_nucmer_coords, self.assembly_compare_prefix + '.nucmer.coords')
+            os.rename(self.batch_nucmer_coords + '.snps', self.assembly_compare_prefix + '.nucmer.coords.snps')
+            self.assembly.nucmer_coords_made = True
+        else:
+            self.assembly.map_reads = not self.map_reads_in_batch
+            self.assembly.run_after_alignment(self.log_fh, self.batch_nucmer_coords)
+            self._clean_file(self.batch_nucmer_coords)
+            self._clean_file(self.batch_nucmer_coords + '.snps')
+            self._clean_reads_for_assembly()
+
+        self._clean_assembly_files()
+
+
+    def _clean_reads_for_assembly(self):
+        '''Deletes the reads made for the assembly, unless they are still needed to check
+           the scaffold graph. If they are, then they are deleted by _clean()'''
+        if self.assembly.scaff_graph_ok is not None:
             self._clean_file(self.reads_for_assembly1)
             self._clean_file(self.reads_for_assembly2)
-            if self.clean:
-                print('Deleting Assembly directory', self.assembly_dir, file=self.log_fh, flush=True)
-                shutil.rmtree(self.assembly_dir)
 
-        if self.assembled_ok:
-            print('\nAssembly was successful\n\nMapping reads to assembly:', file=self.log_fh, flush=True)
 
-            mapping.run_bowtie2(
-                self.all_reads1,
-                self.all_reads2,
-                self.final_assembly_fa,
-                self.final_assembly_bam[:-4],
-                threads=1,
-                sort=True,
-                samtools=self.extern_progs.exe('samtools'),
-                bowtie2=self.extern_progs.exe('bowtie2'),
-                bowtie2_preset=self.bowtie2_preset,
-                verbose=True,
-                verbose_filehandle=self.log_fh
+    def _clean_assembly_files(self):
+        if self.remove_duplicates and self.assembly.scaff_graph_ok is not None:
+            self._clean_file(self.deduplicated_reads1)
+            self._clean_file(self.deduplicated_reads2)
+        if self.clean:
+            print('Deleting Assembly directory', self.assembly_dir, file=self.log_fh, flush=True)
+            shutil.rmtree(self.assembly_dir)
+
+
+    def _run_before_assembly(self):
+        print('{:_^79}'.format(' LOG FILE START ' + self.name + ' '), file=self.log_fh, flush=True)
+
+        if self.triage:
+            # The cluster name is not necessarily a reference name (cd-hit renames
+            # clusters), so use the shortest reference in the cluster
+            if self.reference_names:
+                triage_ref_name = min(sorted(self.reference_names), key=self.refdata.sequence_length)
+            else:
+                triage_ref_name = self.name
+
+            triage_fail_reason = self._triage_fail_reason(
+                self.refdata.sequence_length(triage_ref_name),
+                self.total_reads,
+                self.total_reads_bases,
+                self.covered_bases,
+                self.assembled_threshold,
+                self.max_gene_nt_extend,
             )
+        else:
+            triage_fail_reason = None
+
+        if triage_fail_reason is None:
+            self._choose_ref_and_make_assembly_reads()
+        else:
+            print('Not assembling because cluster cannot pass the assembled threshold:', triage_fail_reason, file=self.log_fh, flush=True)
+            self.ref_sequence = self.refdata.sequence(triage_ref_name)
+            self.ref_sequence_type = self.refdata.sequence_type(triage_ref_name)
+            self._clean_file(self.references_fa)
+            self.assembled_ok = False
+
+
+    def _run_up_to_alignment(self):
+        if not self.prepared:
+            self._run_before_assembly()
+
+        if self.ready_to_assemble:
+            self._assemble(stop_before_orientation=True)
+
+        if self.assembled_ok:
+            if self.status_flag.has('assembled_by_consensus'):
+                self.contigs_for_batch_alignment = self.final_assembly_fa
+            else:
+                self.contigs_for_batch_alignment = self.assembly.gapfilled_length_filtered
+
+
+    def batch_mapping_jobs(self):
+        '''Returns the list of jobs (tuples (reads_1, reads_2, assembly_fa, bam_out)) for
+           batch_mapping.BatchMapping to run for this cluster, after calling
+           run_up_to_variant_calling() with self.map_reads_in_batch True. As well as all the
+           reads, the reads used for the assembly are mapped if the scaffold graph has not been
+           checked yet'''
+        if not self.assembled_ok:
+            return []
+
+        jobs = [(self.all_reads1, self.all_reads2, self.final_assembly_fa, self.final_assembly_bam)]
+        if self.assembly.scaff_graph_ok is None:
+            jobs.append((self.assembly.reads1, self.assembly.reads2, self.final_assembly_fa, self.scaffold_graph_bam))
+        return jobs
+
+
+    def _check_scaffold_graph_from_batch_mapping(self):
+        print('\nChecking scaffold graph using reads mapped in batch mapping', file=self.log_fh, flush=True)
+        self.assembly.check_scaffold_graph(self.log_fh, self.scaffold_graph_bam)
+        if not self.assembly.scaff_graph_ok:
+            self.status_flag.add('scaffold_graph_bad')
+        self._clean_file(self.scaffold_graph_bam)
+        self._clean_file(self.scaffold_graph_bam + '.bai')
+
+
+    def _run(self):
+        if not self.waiting_for_variant_calling:
+            self._run_up_to_variant_calling()
+        elif self.assembled_ok and self.assembly.scaff_graph_ok is None:
+            self._check_scaffold_graph_from_batch_mapping()
+
+        self._call_variants_and_make_report()
+
+
+    def _run_up_to_variant_calling(self):
+        if not self.prepared:
+            self._run_before_assembly()
+
+        if self.waiting_for_alignment:
+            if self.assembled_ok:
+                self._finish_assembly_after_alignment()
+        elif self.ready_to_assemble:
+            self._assemble()
+
+        if self.assembled_ok:
+            print('\nAssembly was successful', file=self.log_fh, flush=True)
+
+            if self.map_reads_in_batch:
+                print('\nReads will be mapped to assembly in batch mapping', file=self.log_fh, flush=True)
+            else:
+                print('\nMapping reads to assembly:', file=self.log_fh, flush=True)
+                mapping.run_bowtie2(
+                    self.all_reads1,
+                    self.all_reads2,
+                    self.final_assembly_fa,
+                    self.final_assembly_bam[:-4],
+                    threads=1,
+                    sort=True,
+                    samtools=self.extern_progs.exe('samtools'),
+                    bowtie2=self.extern_progs.exe('bowtie2'),
+                    bowtie2_preset=self.bowtie2_preset,
+                    verbose=True,
+                    verbose_filehandle=self.log_fh
+                )
 
             if self.assembly.has_contigs_on_both_strands:
                 self.status_flag.add('hit_both_strands')
 
-            print('\nMaking and checking scaffold graph', file=self.log_fh, flush=True)
-
-            if not self.assembly.scaff_graph_ok:
-                self.status_flag.add('scaffold_graph_bad')
+            if self.assembly.scaff_graph_ok is None:
+                print('\nScaffold graph will be checked using reads mapped in batch mapping', file=self.log_fh, flush=True)
+            else:
+                print('\nMaking and checking scaffold graph', file=self.log_fh, flush=True)
+                if not self.assembly.scaff_graph_ok:
+                    self.status_flag.add('scaffold_graph_bad')
 
             print('Comparing assembly against reference sequence', file=self.log_fh, flush=True)
             self.assembly_compare = assembly_compare.AssemblyCompare(
@@ -387,12 +796,14 @@ class Cluster:
               assembled_threshold=self.assembled_threshold,
               unique_threshold=self.unique_threshold,
               max_gene_nt_extend=self.max_gene_nt_extend,
+              nucmer_already_run=self.assembly.nucmer_coords_made,
+              aligner=self.aligner,
             )
             self.assembly_compare.run()
             self.status_flag = self.assembly_compare.update_flag(self.status_flag)
 
             nucmer_hits_to_ref = assembly_compare.AssemblyCompare.nucmer_hits_to_ref_coords(self.assembly_compare.nucmer_hits)
-            assembly_variants_obj = assembly_variants.AssemblyVariants(self.refdata, self.assembly_compare.nucmer_snps_file)
+            assembly_variants_obj = assembly_variants.AssemblyVariants(self.refdata, self.assembly_compare.nucmer_snps_file, nucmer_variants=self.assembly_compare.nucmer_variants_by_contig())
             self.assembly_variants = assembly_variants_obj.get_variants(self.ref_sequence.id, nucmer_hits_to_ref)
 
             for var_list in self.assembly_variants.values():
@@ -403,34 +814,52 @@ class Cluster:
 
                 if self.status_flag.has('has_nonsynonymous_variants'):
                     break
+        else:
+            print('\nAssembly failed\n', file=self.log_fh, flush=True)
+            self.status_flag.add('assembly_fail')
 
 
-            print('\nCalling variants with samtools:', file=self.log_fh, flush=True)
-
-            self.samtools_vars = samtools_variants.SamtoolsVariants(
+    def _call_variants_and_make_report(self):
+        if self.assembled_ok:
+            if self.variants_called_in_batch:
+                print('\nUsing variants called by samtools in batch variant calling', file=self.log_fh, flush=True)
+            elif self.pileup_engine == 'pysam':
+                print('\nCalling variants from pileup made with pysam', file=self.log_fh, flush=True)
+            else:
+                print('\nCalling variants with samtools:', file=self.log_fh, flush=True)
+
+            variants_class = pysam_variants.PysamVariants if self.pileup_engine == 'pysam' else samtools_variants.SamtoolsVariants
+            self.samtools_vars = variants_class(
                 self.final_assembly_fa,
                 self.final_assembly_bam,
                 self.samtools_vars_prefix,
-                log_fh=self.log_fh,
+                log_fh=None if self.variants_called_in_batch else self.log_fh,
                 samtools_exe=self.extern_progs.exe('samtools'),
                 bcftools_exe=self.extern_progs.exe('bcftools'),
                 bcf_min_dp=self.bcf_min_dp,
                 bcf_min_dv=self.bcf_min_dv,
                 bcf_min_dv_over_dp=self.bcf_min_dv_over_dp,
                 bcf_min_qual=self.bcf_min_qual,
+                regions=self.assembly_compare.assembly_match_coords() if self.restrict_pileup else None,
             )
-            self.samtools_vars.run()
+            if not self.variants_called_in_batch:
+                self.samtools_vars.run()
 
-            self.total_contig_depths = self.samtools_vars.total_depth_per_contig(self.samtools_vars.read_depths_file)
+            if self.restrict_pileup:
+                self.total_contig_depths = self.samtools_vars.total_depth_per_contig_from_bam()
+            else:
+                self.total_contig_depths = self.samtools_vars.total_depth_per_contig_from_index()
 
             if self.samtools_vars.variants_in_coords(self.assembly_compare.assembly_match_coords(), self.samtools_vars.vcf_file):
                 self.status_flag.add('variants_suggest_collapsed_repeat')
-        else:
-            print('\nAssembly failed\n', file=self.log_fh, flush=True)
-            self.status_flag.add('assembly_fail')
-
 
         print('\nMaking report lines', file=self.log_fh, flush=True)
-        self.report_lines = report.report_lines(self)
+        report_rows = report.report_rows(self)
+        if report_rows is None:
+            self.report_records = None
+        else:
+            self.report_records = [report.ReportRecord(x) for x in report_rows]
+        if self.assembled_ok:
+            self.samtools_vars.read_depths_index = None # only needed for making the report lines
         self._clean()
         atexit.unregister(self._atexit)
@@ -8,15 +8,23 @@ import pickle
 import itertools
 import sys
 import shutil
-import openpyxl
+import queue
+import resource
+import traceback
 import multiprocessing
 import pysam
 import pyfastaq
-from ariba import cluster, common, mapping, histogram, read_store, report, report_filter, reference_data
+from ariba import batch_assembly, batch_mapping, batch_nucmer, batch_samtools_variants, cluster, common, mapping, histogram, memory_scheduler, read_store, report, report_filter, report_xls, reference_data, results_db
 
 class Error (Exception): pass
 
 
+def _peak_child_memory():
+    '''Returns peak memory in MB of the biggest external program (eg the assembler)
+       run by this process. ru_maxrss is in kilobytes on Linux'''
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
 def _run_cluster(obj, verbose, clean, fails_dir):
     failed_clusters = os.listdir(fails_dir)
 
@@ -33,6 +41,8 @@ def _run_cluster(obj, verbose, clean, fails_dir):
         with open(os.path.join(fails_dir, obj.name), 'w'):
             pass
 
+    obj.peak_memory = _peak_child_memory()
+
     if verbose:
         print('Finished running cluster', obj.name, 'in directory', obj.root_dir, flush=True)
 
@@ -45,6 +55,32 @@ def _run_cluster(obj, verbose, clean, fails_dir):
     return obj
 
 
+def _run_cluster_stage(obj, method_name, verbose, fails_dir):
+    '''Calls the method of the cluster obj called method_name, which
+       runs the cluster up to some stage (eg prepare_for_assembly)'''
+    if len(os.listdir(fails_dir)) > 0:
+        print('Other clusters failed. Will not run', method_name, 'on cluster', obj.name, file=sys.stderr)
+        return obj
+
+    if verbose:
+        print('Start', method_name, 'on cluster', obj.name, 'in directory', obj.root_dir, flush=True)
+    try:
+        getattr(obj, method_name)()
+    except:
+        print('Failed cluster:', obj.name, file=sys.stderr)
+        with open(os.path.join(fails_dir, obj.name), 'w'):
+            pass
+
+    obj.peak_memory = _peak_child_memory()
+    return obj
+
+
+def _run_batch_assembly(obj):
+    obj.run()
+    obj.peak_memory = _peak_child_memory()
+    return obj
+
+
 class Clusters:
     def __init__(self,
       refdata_dir,
@@ -70,6 +106,24 @@ class Clusters:
       bowtie2_preset='very-sensitive-local',
       clean=True,
       tmp_dir=None,
+      max_memory=None,
+      triage=False,
+      remove_duplicates=False,
+      normalise_reads=False,
+      consensus_min_id=None,
+      consensus_min_depth=10,
+      local_assembler_max_reads=None,
+      assembly_batch_size=1,
+      assembly_batch_max_reads=2000,
+      aligner='nucmer',
+      reuse_orientation_nucmer=False,
+      batch_nucmer=False,
+      batch_variant_calling=False,
+      batch_mapping=False,
+      restrict_pileup=False,
+      pileup_engine='samtools',
+      results_db_sample=None,
+      write_xls=False,
     ):
         self.refdata_dir = os.path.abspath(refdata_dir)
         self.refdata, self.cluster_ids = self._load_reference_data_from_dir(refdata_dir)
@@ -99,9 +153,12 @@ class Clusters:
         self.report_file_all_tsv = os.path.join(self.outdir, 'report.all.tsv')
         self.report_file_all_xls = os.path.join(self.outdir, 'report.all.xls')
         self.report_file_filtered_prefix = os.path.join(self.outdir, 'report')
+        self.report_file_filtered_xls = self.report_file_filtered_prefix + '.xls'
+        self.results_db_file = os.path.join(self.outdir, 'results.db')
         self.catted_assembled_seqs_fasta = os.path.join(self.outdir, 'assembled_seqs.fa.gz')
         self.catted_genes_matching_refs_fasta = os.path.join(self.outdir, 'assembled_genes.fa.gz')
         self.threads = threads
+        self.max_memory = max_memory
         self.verbose = verbose
 
         self.max_insert = max_insert
@@ -117,18 +174,37 @@ class Clusters:
         self.nucmer_min_id = nucmer_min_id
         self.nucmer_min_len = nucmer_min_len
         self.nucmer_breaklen = nucmer_breaklen
+        self.aligner = aligner
+        self.reuse_orientation_nucmer = reuse_orientation_nucmer
+        self.batch_nucmer = batch_nucmer
+        self.batch_variant_calling = batch_variant_calling
+        self.batch_mapping = batch_mapping
+        self.restrict_pileup = restrict_pileup
+        self.pileup_engine = pileup_engine
+        self.results_db_sample = results_db_sample
+        self.write_xls = write_xls
 
         self.assembled_threshold = assembled_threshold
         self.unique_threshold = unique_threshold
         self.max_gene_nt_extend = max_gene_nt_extend
+        self.triage = triage
+        self.remove_duplicates = remove_duplicates
+        self.normalise_reads = normalise_reads
+        self.consensus_min_id = consensus_min_id
+        self.consensus_min_depth = consensus_min_depth
+        self.local_assembler_max_reads = local_assembler_max_reads
+        self.assembly_batch_size = assembly_batch_size
+        self.assembly_batch_max_reads = assembly_batch_max_reads
 
         self.cluster_to_dir = {}  # gene name -> abs path of cluster directory
         self.clusters = {}        # gene name -> Cluster object
         self.cluster_read_counts = {} # gene name -> number of reads
         self.cluster_base_counts = {} # gene name -> number of bases
+        self.cluster_covered_bases = {} # gene name -> number of bases of the gene covered by mapped reads
         self.pool = None
         self.fails_dir = os.path.join(self.outdir ,'.fails')
         self.clusters_all_ran_ok = True
+        self.stage_times = [] # list of tuples (stage name, seconds), in the order they were run
 
         for d in [self.outdir, self.logs_dir, self.fails_dir]:
             try:
@@ -230,6 +306,7 @@ class Clusters:
             metadata_tsv=metadata_tsv if os.path.exists(metadata_tsv) else None,
             genetic_code=params['genetic_code'],
         )
+        refdata.make_variant_indexes()
 
         with open(clusters_file, 'rb') as f:
             cluster_ids = pickle.load(f)
@@ -260,6 +337,7 @@ class Clusters:
         sam_reader = pysam.Samfile(self.bam, "rb")
         sam1 = None
         self.proper_pairs = 0
+        covered = {} # ref id -> bytearray, with 1 at each position covered by a read
 
         for s in sam_reader.fetch(until_eof=True):
             if sam1 is None:
@@ -272,6 +350,12 @@ class Clusters:
             if not sam1.is_unmapped:
                 ref_seqs.add(sam_reader.getrname(sam1.tid))
 
+            for sam in (sam1, s):
+                if not sam.is_unmapped:
+                    if sam.tid not in covered:
+                        covered[sam.tid] = bytearray(sam_reader.lengths[sam.tid])
+                    covered[sam.tid][sam.reference_start:sam.reference_end] = b'\x01' * (sam.reference_end - sam.reference_start)
+
             read1 = mapping.sam_to_fastq(sam1)
             read2 = mapping.sam_to_fastq(s)
             if read1.id.endswith('/2'):
@@ -297,6 +381,7 @@ class Clusters:
             sam1 = None
 
         pyfastaq.utils.close(f_out)
+        self.cluster_covered_bases = {sam_reader.getrname(x): covered[x].count(1) for x in covered}
 
         if len(self.cluster_read_counts):
             if self.verbose:
@@ -360,6 +445,13 @@ class Clusters:
                     self.refdata,
                     self.cluster_read_counts[seq_name],
                     self.cluster_base_counts[seq_name],
+                    covered_bases=self.cluster_covered_bases.get(seq_name, 0),
+                    triage=self.triage,
+                    remove_duplicates=self.remove_duplicates,
+                    normalise_reads=self.normalise_reads,
+                    consensus_min_id=self.consensus_min_id,
+                    consensus_min_depth=self.consensus_min_depth,
+                    local_assembler_max_reads=self.local_assembler_max_reads,
                     fail_file=os.path.join(self.fails_dir, seq_name),
                     read_store=self.read_store,
                     reference_names=self.cluster_ids[seq_type][seq_name],
@@ -372,6 +464,10 @@ class Clusters:
                     nucmer_min_id=self.nucmer_min_id,
                     nucmer_min_len=self.nucmer_min_len,
                     nucmer_breaklen=self.nucmer_breaklen,
+                    aligner=self.aligner,
+                    reuse_orientation_nucmer=self.reuse_orientation_nucmer,
+                    restrict_pileup=self.restrict_pileup,
+                    pileup_engine=self.pileup_engine,
                     reads_insert=self.insert_size,
                     sspace_k=self.min_scaff_depth,
                     sspace_sd=self.insert_sspace_sd,
@@ -389,8 +485,26 @@ class Clusters:
                     extern_progs=self.extern_progs,
                 ))
 
+        if self.assembly_batch_size > 1:
+            cluster_list = self._run_batch_stage('batch_assembly', self._batch_assemble_clusters, cluster_list)
+
+        if self.batch_nucmer:
+            cluster_list = self._run_batch_stage('batch_nucmer', self._batch_align_clusters, cluster_list)
+
+        batch_variant_calling = self.batch_variant_calling and self.pileup_engine == 'samtools'
+        if (self.batch_mapping or batch_variant_calling) and len(os.listdir(self.fails_dir)) == 0:
+            for c in cluster_list:
+                c.map_reads_in_batch = self.batch_mapping
+            cluster_list = self._run_clusters_stage(cluster_list, 'run_up_to_variant_calling')
+            if self.batch_mapping:
+                cluster_list = self._run_batch_stage('batch_mapping', self._batch_map_reads, cluster_list)
+            if batch_variant_calling:
+                cluster_list = self._run_batch_stage('batch_variant_calling', self._batch_call_variants, cluster_list)
+
         try:
-            if self.threads > 1:
+            if self.threads > 1 and self.max_memory is not None:
+                cluster_list = self._run_clusters_with_memory_limit(cluster_list)
+            elif self.threads > 1:
                 self.pool = multiprocessing.Pool(self.threads)
                 cluster_list = self.pool.starmap(_run_cluster, zip(cluster_list, itertools.repeat(self.verbose), itertools.repeat(self.clean), itertools.repeat(self.fails_dir)))
             else:
@@ -405,6 +519,266 @@ class Clusters:
         self.clusters = {c.name: c for c in cluster_list}
 
 
+    def _run_batch_stage(self, stage_name, function, cluster_list):
+        '''Runs function(cluster_list), which is one of the stages run on several clusters
+           at once (eg batch assembly). Does nothing if any cluster has already failed.
+           If the stage raises an exception, the error is printed to stderr and written
+           to the file batch_stage.<stage_name> in self.fails_dir, so that no more clusters
+           are run. Returns the list of clusters'''
+        if len(os.listdir(self.fails_dir)) > 0:
+            return cluster_list
+
+        try:
+            new_cluster_list = function(cluster_list)
+        except Exception:
+            error = traceback.format_exc()
+            print('Failed', stage_name, 'stage. Error was:', file=sys.stderr)
+            print(error, file=sys.stderr)
+            with open(os.path.join(self.fails_dir, 'batch_stage.' + stage_name), 'w') as f:
+                print(error, file=f)
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool = None
+            return cluster_list
+
+        return cluster_list if new_cluster_list is None else new_cluster_list
+
+
+    def _run_clusters_stage(self, cluster_list, method_name):
+        '''Runs each cluster up to a stage, by calling its method method_name.
+           Returns the list of clusters'''
+        if self.threads > 1 and self.max_memory is not None:
+            cluster_list = self._run_clusters_with_memory_limit(cluster_list, method_name=method_name)
+        elif self.threads > 1:
+            self.pool = multiprocessing.Pool(self.threads)
+            cluster_list = self.pool.starmap(_run_cluster_stage, zip(cluster_list, itertools.repeat(method_name), itertools.repeat(self.verbose), itertools.repeat(self.fails_dir)))
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        else:
+            for c in cluster_list:
+                _run_cluster_stage(c, method_name, self.verbose, self.fails_dir)
+
+        return cluster_list
+
+
+    def _batch_assemble_clusters(self, cluster_list):
+        '''Runs each cluster up to the assembly stage. Then the clusters with at most
+           self.assembly_batch_max_reads reads for assembly are put into batches of size
+           self.assembly_batch_size, and each batch is assembled with one run of SPAdes.
+           Returns the list of (prepared) clusters, ready to be run to completion'''
+        cluster_list = self._run_clusters_stage(cluster_list, 'prepare_for_assembly')
+        if len(os.listdir(self.fails_dir)) > 0:
+            return cluster_list
+
+        to_batch = [c for c in cluster_list if c.ready_to_assemble and c.assembler_to_use == 'spades' and not c.status_flag.has('assembled_by_consensus') and c.assembly_reads_count <= self.assembly_batch_max_reads]
+        batches = []
+        batch_sizes = []
+
+        for i in range(0, len(to_batch), self.assembly_batch_size):
+            batch_clusters = to_batch[i:i + self.assembly_batch_size]
+            if len(batch_clusters) < 2:
+                continue
+
+            batch_number = len(batches) + 1
+            self.log_files.append(os.path.join(self.logs_dir, 'batch_assembly.' + str(batch_number) + '.log'))
+            for c in batch_clusters:
+                c.batch_contigs_fa = os.path.join(c.root_dir, 'batch_assembly_contigs.fa')
+
+            if self.verbose:
+                print('Batch assembly', batch_number, 'has clusters:', ', '.join([c.name for c in batch_clusters]), flush=True)
+
+            batches.append(batch_assembly.BatchAssembly(
+                [(c.assembly_reads[0], c.assembly_reads[1], c.reference_fa, c.batch_contigs_fa) for c in batch_clusters],
+                os.path.join(self.tmp_dir, 'batch_assembly.' + str(batch_number)),
+                self.log_files[-1],
+                kmer=self.assembly_kmer,
+                spades_other_options=self.spades_other,
+                nucmer_min_id=self.nucmer_min_id,
+                nucmer_min_len=self.nucmer_min_len,
+                nucmer_breaklen=self.nucmer_breaklen,
+                aligner=self.aligner,
+                extern_progs=self.extern_progs,
+                clean=self.clean,
+            ))
+            batch_sizes.append((sum([c.assembly_reads_count for c in batch_clusters]), sum([self._cluster_ref_length(c.name) for c in batch_clusters])))
+
+        if self.threads > 1 and len(batches) > 1 and self.max_memory is not None:
+            jobs = [('batch_assembly.' + str(i + 1), batch, reads, ref_length) for i, (batch, (reads, ref_length)) in enumerate(zip(batches, batch_sizes))]
+            self._run_jobs_with_memory_limit(jobs, _run_batch_assembly, ())
+        elif self.threads > 1 and len(batches) > 1:
+            self.pool = multiprocessing.Pool(self.threads)
+            self.pool.map(_run_batch_assembly, batches)
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        else:
+            for batch in batches:
+                _run_batch_assembly(batch)
+
+        return cluster_list
+
+
+    def _batch_align_clusters(self, cluster_list):
+        '''Runs each cluster up to the stage of aligning its assembly to its reference.
+           Then aligns the assemblies of all the clusters to their references with one run
+           of nucmer, and gives each cluster its own part of the nucmer output.
+           Returns the list of clusters, ready to be run to completion'''
+        cluster_list = self._run_clusters_stage(cluster_list, 'assemble_for_batch_alignment')
+        if len(os.listdir(self.fails_dir)) > 0:
+            return cluster_list
+
+        to_align = [c for c in cluster_list if c.contigs_for_batch_alignment is not None]
+        for c in to_align:
+            c.batch_nucmer_coords = os.path.join(c.root_dir, 'batch_nucmer.coords')
+
+        if len(to_align) > 0:
+            if self.verbose:
+                print('Aligning assemblies of', len(to_align), 'clusters to their references with one run of nucmer', flush=True)
+
+            batch_nucmer.BatchNucmer(
+                [(c.reference_fa, c.contigs_for_batch_alignment, c.batch_nucmer_coords) for c in to_align],
+                os.path.join(self.tmp_dir, 'batch_nucmer'),
+                min_id=self.nucmer_min_id,
+                min_length=self.nucmer_min_len,
+                breaklen=self.nucmer_breaklen,
+                aligner=self.aligner,
+                extern_progs=self.extern_progs,
+                clean=self.clean,
+            ).run()
+
+        return cluster_list
+
+
+    def _batch_map_reads(self, cluster_list):
+        '''Clusters must have been run up to the variant calling stage. Maps the reads
+           of all the clusters to their assemblies with one bowtie2 index and one run of bowtie2'''
+        jobs = [job for c in cluster_list for job in c.batch_mapping_jobs()]
+        if len(jobs) == 0:
+            return
+
+        if self.verbose:
+            print('Mapping reads to assemblies of', len([c for c in cluster_list if c.assembled_ok]), 'clusters with one run of bowtie2', flush=True)
+
+        self.log_files.append(os.path.join(self.logs_dir, 'batch_mapping.log'))
+        batch_mapping.BatchMapping(
+            jobs,
+            os.path.join(self.tmp_dir, 'batch_mapping'),
+            self.log_files[-1],
+            threads=self.threads,
+            samtools_exe=self.extern_progs.exe('samtools'),
+            bowtie2_exe=self.extern_progs.exe('bowtie2'),
+            bowtie2_preset=self.bowtie2_preset,
+            clean=self.clean,
+        ).run()
+
+
+    def _batch_call_variants(self, cluster_list):
+        '''Clusters must have been run up to the variant calling stage. Calls variants in
+           the assemblies of all the clusters with one run of samtools and bcftools'''
+        to_call = [c for c in cluster_list if c.assembled_ok]
+        if len(to_call) == 0:
+            return
+
+        if self.verbose:
+            print('Calling variants in assemblies of', len(to_call), 'clusters with one run of samtools', flush=True)
+
+        if self.restrict_pileup:
+            regions = {}
+            for c in to_call:
+                regions.update(c.assembly_compare.assembly_match_coords())
+        else:
+            regions = None
+
+        self.log_files.append(os.path.join(self.logs_dir, 'batch_variant_calling.log'))
+        batch_samtools_variants.BatchSamtoolsVariants(
+            [(c.final_assembly_fa, c.final_assembly_bam, c.samtools_vars_prefix) for c in to_call],
+            os.path.join(self.tmp_dir, 'batch_variant_calling'),
+            self.log_files[-1],
+            samtools_exe=self.extern_progs.exe('samtools'),
+            bcftools_exe=self.extern_progs.exe('bcftools'),
+            regions=regions,
+            clean=self.clean,
+        ).run()
+
+        for c in to_call:
+            c.variants_called_in_batch = True
+
+
+    def _cluster_ref_length(self, cluster_name):
+        '''Returns length of the longest reference sequence in the cluster'''
+        for seq_type in self.cluster_ids:
+            if self.cluster_ids[seq_type] is not None and cluster_name in self.cluster_ids[seq_type]:
+                return max([self.refdata.sequence_length(x) for x in self.cluster_ids[seq_type][cluster_name]])
+
+        return self.refdata.sequence_length(cluster_name)
+
+
+    def _run_clusters_with_memory_limit(self, cluster_list, method_name=None):
+        '''Runs clusters in parallel, but only starts a cluster when its estimated
+           memory fits in what is left of self.max_memory (in GB). If method_name is given,
+           then each cluster is only run up to that stage (see _run_cluster_stage).
+           Returns the list of clusters'''
+        jobs = [(c.name, c, c.total_reads, self._cluster_ref_length(c.name)) for c in cluster_list]
+        if method_name is None:
+            return self._run_jobs_with_memory_limit(jobs, _run_cluster, (self.verbose, self.clean, self.fails_dir))
+        else:
+            return self._run_jobs_with_memory_limit(jobs, _run_cluster_stage, (method_name, self.verbose, self.fails_dir))
+
+
+    def _run_jobs_with_memory_limit(self, jobs, function, function_args):
+        '''jobs = list of tuples (name, object, number of reads, reference length).
+           Runs function(object, *function_args) for each job in parallel, but only starts
+           a job when its estimated memory fits in what is left of self.max_memory (in GB).
+           function must return the object, with its peak_memory set. Each job runs
+           in a new process, so that the peak memory of its external programs can be
+           measured and fed back into the estimates of the jobs still waiting.
+           Returns list of the returned objects, in the same order as jobs. If a job
+           failed, then a file is written in self.fails_dir and its original object is used'''
+        scheduler = memory_scheduler.MemoryScheduler(1024 * self.max_memory, self.threads)
+        pending = list(jobs)
+        job_sizes = {name: (reads, ref_length) for name, obj, reads, ref_length in jobs}
+        finished = queue.Queue()
+        results = {}
+        self.pool = multiprocessing.Pool(self.threads, maxtasksperchild=1)
+
+        while len(pending) > 0 or len(scheduler.running) > 0:
+            i = scheduler.next_job([(reads, ref_length) for name, obj, reads, ref_length in pending])
+
+            while i is not None:
+                name, obj, reads, ref_length = pending.pop(i)
+                estimate = scheduler.start(name, reads, ref_length)
+                if self.verbose:
+                    print('Starting', name, 'with estimated memory', round(estimate), 'MB. Estimated total memory in use:', round(scheduler.memory_in_use()), 'MB', flush=True)
+                self.pool.apply_async(
+                    function,
+                    (obj,) + tuple(function_args),
+                    callback=lambda obj, name=name: finished.put((name, obj)),
+                    error_callback=lambda err, name=name: finished.put((name, None)),
+                )
+                i = scheduler.next_job([(reads, ref_length) for name, obj, reads, ref_length in pending])
+
+            name, obj = finished.get()
+
+            if obj is None:
+                print('Failed:', name, file=sys.stderr)
+                with open(os.path.join(self.fails_dir, name), 'w'):
+                    pass
+                peak_memory = None
+            else:
+                results[name] = obj
+                peak_memory = obj.peak_memory
+                if self.verbose:
+                    print(name, 'finished. Peak memory', round(peak_memory), 'MB', flush=True)
+
+            scheduler.finish(name, *job_sizes[name], peak_memory_mb=peak_memory)
+
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        return [results.get(name, obj) for name, obj, reads, ref_length in jobs]
+
+
     @staticmethod
     def _write_reports(clusters_in, tsv_out, xls_out=None):
         columns = copy.copy(report.columns)
@@ -413,23 +787,44 @@ class Clusters:
         f = pyfastaq.utils.open_file_write(tsv_out)
         print('\t'.join(columns), file=f)
 
-        columns[0] = columns[0][1:]
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.worksheets[0]
-        worksheet.title = 'ARIBA_report'
-        worksheet.append(columns)
-
         for seq_name in sorted(clusters_in):
-            if clusters_in[seq_name].report_lines is None:
+            if clusters_in[seq_name].report_records is None:
                 continue
 
-            for line in clusters_in[seq_name].report_lines:
-                print(line, file=f)
-                worksheet.append(line.split('\t'))
+            for record in clusters_in[seq_name].report_records:
+                print(record.to_line(), file=f)
 
         pyfastaq.utils.close(f)
         if xls_out is not None:
-            workbook.save(xls_out)
+            report_xls.write_xls_from_tsv(tsv_out, xls_out)
+
+
+    @staticmethod
+    def _report_records(clusters_in):
+        '''Returns list of all the report records of the clusters, in the same order as _write_reports'''
+        records = []
+        for seq_name in sorted(clusters_in):
+            if clusters_in[seq_name].report_records is not None:
+                records.extend(clusters_in[seq_name].report_records)
+        return records
+
+
+    def _cluster_stats(self):
+        '''Returns list of tuples (cluster name, ref name, flag, number of reads, number of read bases)'''
+        stats = []
+        for name in sorted(self.clusters):
+            c = self.clusters[name]
+            ref_name = None if c.ref_sequence is None else c.ref_sequence.id
+            stats.append((name, ref_name, c.status_flag, c.total_reads, self.cluster_base_counts.get(name, None)))
+        return stats
+
+
+    def _write_results_db(self, all_records, filtered_records):
+        if os.path.exists(self.results_db_file):
+            os.unlink(self.results_db_file)
+        db = results_db.ResultsDb(self.results_db_file)
+        db.add_sample(self.results_db_sample, all_records, filtered_records, cluster_stats=self._cluster_stats(), timings=self.stage_times)
+        db.close()
 
 
     def _write_catted_assembled_seqs_fasta(self, outfile):
@@ -514,12 +909,16 @@ class Clusters:
 
         if self.verbose:
             print('{:_^79}'.format(' Mapping reads to clustered genes '), flush=True)
+        start_time = time.time()
         self._map_reads_to_clustered_genes()
+        self.stage_times.append(('map_reads_to_clustered_genes', time.time() - start_time))
 
         if self.verbose:
             print('Finished mapping\n')
             print('{:_^79}'.format(' Generating clusters '), flush=True)
+        start_time = time.time()
         self._bam_to_clusters_reads()
+        self.stage_times.append(('bam_to_clusters_reads', time.time() - start_time))
         if self.clean:
             if self.verbose:
                 print('Deleting BAM', self.bam, flush=True)
@@ -536,7 +935,9 @@ class Clusters:
                 if self.verbose:
                     print('{:_^79}'.format(' Assembling each cluster '))
                     print('Will run', self.threads, 'cluster(s) in parallel', flush=True)
+                start_time = time.time()
                 self._init_and_run_clusters()
+                self.stage_times.append(('run_clusters', time.time() - start_time))
                 if self.verbose:
                     print('Finished assembling clusters\n')
         else:
@@ -550,12 +951,27 @@ class Clusters:
         if self.verbose:
             print('{:_^79}'.format(' Writing reports '), flush=True)
             print('Making', self.report_file_all_tsv)
+        start_time = time.time()
         self._write_reports(self.clusters, self.report_file_all_tsv)
 
         if self.verbose:
             print('Making', self.report_file_filtered_prefix + '.tsv')
-        rf = report_filter.ReportFilter(infile=self.report_file_all_tsv)
+        all_records = self._report_records(self.clusters)
+        rf = report_filter.ReportFilter(records=all_records)
         rf.run(self.report_file_filtered_prefix)
+        self.stage_times.append(('write_reports', time.time() - start_time))
+
+        xls_processes = []
+        if self.write_xls:
+            if self.verbose:
+                print('Making', self.report_file_all_xls, 'and', self.report_file_filtered_xls, 'in the background', flush=True)
+            for tsv_file, xls_file in [(self.report_file_all_tsv, self.report_file_all_xls), (self.report_file_filtered_prefix + '.tsv', self.report_file_filtered_xls)]:
+                xls_processes.append(report_xls.start_xls_from_tsv(tsv_file, xls_file))
+
+        if self.results_db_sample is not None:
+            if self.verbose:
+                print('Making', self.results_db_file)
+            self._write_results_db(all_records, rf.report_dicts())
 
         if self.verbose:
             print()
@@ -571,6 +987,9 @@ class Clusters:
             print('Writing file', clusters_log_file, flush=True)
         common.cat_files(self.log_files, clusters_log_file)
 
+        for process in xls_processes:
+            report_xls.wait_for_xls(process)
+
         if self.verbose:
             print()
             print('{:_^79}'.format(' Cleaning files '), flush=True)
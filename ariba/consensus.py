@@ -0,0 +1,91 @@
+import pysam
+import pyfastaq
+
+class Error (Exception): pass
+
+
+class Consensus:
+    def __init__(self, bam, ref_seq, min_depth=10, min_identity=99, log_fh=None, read_counts=None):
+        '''Makes a consensus sequence from reads mapped to ref_seq (a pyfastaq.sequences.Fasta object).
+           The bam must be sorted and indexed. A consensus is only made if every position of
+           the reference has depth >= min_depth, the percent identity of the mapped bases to
+           the reference is >= min_identity, and there are no indels in the consensus.
+           read_counts = optional dict of read name -> number of copies of that read (used when
+           duplicate reads were removed). Each read in the dict is counted that many times'''
+        self.bam = bam
+        self.ref_seq = ref_seq
+        self.min_depth = min_depth
+        self.min_identity = min_identity
+        self.log_fh = log_fh
+        self.read_counts = {} if read_counts is None else read_counts
+        self.sequence = None
+
+
+    def _pileup_counts(self):
+        '''Returns a list with one dict per position of the reference. Each dict is
+           base -> count, where a deletion is "-" and an insertion after the position is "+"'''
+        counts = [{} for i in range(len(self.ref_seq))]
+        sam_reader = pysam.Samfile(self.bam, "rb")
+
+        for column in sam_reader.pileup(self.ref_seq.id, 0, len(self.ref_seq)):
+            if not 0 <= column.reference_pos < len(self.ref_seq):
+                continue
+
+            position_counts = counts[column.reference_pos]
+            for pileupread in column.pileups:
+                if pileupread.is_del:
+                    base = '-'
+                else:
+                    base = pileupread.alignment.seq[pileupread.query_position].upper()
+
+                copies = self.read_counts.get(pileupread.alignment.qname, 1)
+                position_counts[base] = position_counts.get(base, 0) + copies
+
+                if pileupread.indel > 0:
+                    position_counts['+'] = position_counts.get('+', 0) + copies
+
+        sam_reader.close()
+        return counts
+
+
+    @staticmethod
+    def _consensus_from_counts(ref_seq, counts, min_depth, min_identity):
+        '''Returns tuple (consensus string or None, message). ref_seq is a string.
+           counts = list made by _pileup_counts()'''
+        assert len(ref_seq) == len(counts)
+        consensus = []
+        matches = 0
+        total = 0
+
+        for i in range(len(ref_seq)):
+            insertions = counts[i].get('+', 0)
+            depth = sum(counts[i].values()) - insertions
+            if depth < min_depth:
+                return None, 'Depth ' + str(depth) + ' at position ' + str(i + 1) + ' is less than ' + str(min_depth)
+
+            base, base_count = max(counts[i].items(), key=lambda x: (x[1] if x[0] != '+' else -1, x[0]))
+            if base == '-' or 2 * insertions > depth:
+                return None, 'Consensus has an indel at position ' + str(i + 1)
+
+            consensus.append(base)
+            matches += counts[i].get(ref_seq[i].upper(), 0)
+            total += depth + insertions
+
+        identity = 100 * matches / total
+        if identity < min_identity:
+            return None, 'Percent identity of reads to reference ' + str(round(identity, 2)) + ' is less than ' + str(min_identity)
+
+        return ''.join(consensus), 'Consensus made. Percent identity of reads to reference is ' + str(round(identity, 2))
+
+
+    def run(self):
+        '''Returns True if consensus was made, and sets self.sequence to the consensus.
+           Otherwise returns False'''
+        counts = self._pileup_counts()
+        consensus, message = self._consensus_from_counts(self.ref_seq.seq, counts, self.min_depth, self.min_identity)
+        print(message, file=self.log_fh)
+        if consensus is None:
+            return False
+        else:
+            self.sequence = pyfastaq.sequences.Fasta(self.ref_seq.id, consensus)
+            return True
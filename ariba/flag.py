@@ -13,6 +13,7 @@ flags_in_order = [
     'hit_both_strands',
     'has_nonsynonymous_variants',
     'ref_seq_choose_fail',
+    'assembled_by_consensus',
 ]
 
 
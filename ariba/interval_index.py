@@ -0,0 +1,53 @@
+import bisect
+import array
+
+class Error (Exception): pass
+
+
+class IntervalIndex:
+    def __init__(self, intervals):
+        '''Index of intervals, for finding the intervals that contain a point.
+           intervals = list of tuples (start, end, value), where start and end
+           are both included in the interval.
+           The intervals are stored sorted by start position, with the maximum end position of
+           all the intervals up to each one, so that a search only looks at intervals that
+           start before the point and stops as soon as no earlier interval can reach it'''
+        intervals = sorted(intervals, key=lambda x: (x[0], x[1]))
+        self.starts = array.array('l', [x[0] for x in intervals])
+        self.ends = array.array('l', [x[1] for x in intervals])
+        self.values = [x[2] for x in intervals]
+        self.max_ends = array.array('l')
+        for end in self.ends:
+            self.max_ends.append(end if len(self.max_ends) == 0 else max(end, self.max_ends[-1]))
+
+        for start, end in zip(self.starts, self.ends):
+            if start > end:
+                raise Error('Start of interval ' + str(start) + ' is after end ' + str(end) + '. Cannot continue')
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def containing(self, position):
+        '''Returns list of the values of the intervals that contain position,
+           in decreasing order of start position'''
+        values = []
+        i = bisect.bisect_right(self.starts, position) - 1
+        while i >= 0 and self.max_ends[i] >= position:
+            if self.ends[i] >= position:
+                values.append(self.values[i])
+            i -= 1
+        return values
+
+
+    def contains(self, position):
+        '''Returns True iff at least one interval contains position'''
+        i = bisect.bisect_right(self.starts, position) - 1
+        return i >= 0 and self.max_ends[i] >= position
+
+
+    def overlaps(self, start, end):
+        '''Returns True iff at least one interval overlaps the interval start to end (inclusive)'''
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i >= 0 and self.max_ends[i] >= start
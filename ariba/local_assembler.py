@@ -0,0 +1,110 @@
+import pyfastaq
+
+class Error (Exception): pass
+
+
+class LocalAssembler:
+    def __init__(self,
+      reads1,
+      reads2,
+      ref_fasta,
+      outfile,
+      kmer=21,
+      min_kmer_count=2,
+      max_branch_ratio=0.1,
+      min_contig_length=50,
+      log_fh=None,
+    ):
+        '''Simple reference-seeded kmer extension assembler, for small clusters.
+           Kmers of the reference that are also in the reads are used as seeds.
+           Each seed is extended using kmers from the reads (not the reference), for
+           as long as there is an unambiguous next kmer'''
+        self.reads1 = reads1
+        self.reads2 = reads2
+        self.ref_fasta = ref_fasta
+        self.outfile = outfile
+        self.kmer = kmer
+        self.min_kmer_count = min_kmer_count
+        self.max_branch_ratio = max_branch_ratio
+        self.min_contig_length = min_contig_length
+        self.log_fh = log_fh
+        self.revcomp_table = str.maketrans('ACGT', 'TGCA')
+
+
+    def _revcomp(self, seq):
+        return seq[::-1].translate(self.revcomp_table)
+
+
+    def _count_kmers(self):
+        '''Returns dict of kmer -> count, from the reads and their reverse complements'''
+        counts = {}
+        for filename in [self.reads1, self.reads2]:
+            for read in pyfastaq.sequences.file_reader(filename):
+                seq = read.seq.upper()
+                for s in (seq, self._revcomp(seq)):
+                    for i in range(len(s) - self.kmer + 1):
+                        kmer = s[i:i + self.kmer]
+                        if 'N' not in kmer:
+                            counts[kmer] = counts.get(kmer, 0) + 1
+
+        return {x: counts[x] for x in counts if counts[x] >= self.min_kmer_count}
+
+
+    def _next_base(self, kmer, counts):
+        '''Returns the base that extends kmer to the right, or None if there is no
+           next kmer or the choice is ambiguous'''
+        options = sorted([(counts.get(kmer[1:] + base, 0), base) for base in 'ACGT'], reverse=True)
+        best_count, best_base = options[0]
+        if best_count == 0 or options[1][0] > self.max_branch_ratio * best_count:
+            return None
+        return best_base
+
+
+    def _extend_right(self, seq, counts, used):
+        '''Extends seq to the right. Adds the kmers used (and their reverse complements) to used'''
+        new_bases = []
+        kmer = seq[-self.kmer:]
+        while True:
+            base = self._next_base(kmer, counts)
+            if base is None:
+                break
+            kmer = kmer[1:] + base
+            if kmer in used:
+                break
+            used.add(kmer)
+            used.add(self._revcomp(kmer))
+            new_bases.append(base)
+
+        return seq + ''.join(new_bases)
+
+
+    def _contig_from_seed(self, seed, counts, used):
+        used.add(seed)
+        used.add(self._revcomp(seed))
+        contig = self._extend_right(seed, counts, used)
+        contig = self._extend_right(self._revcomp(contig), counts, used)
+        return self._revcomp(contig)
+
+
+    def run(self):
+        '''Writes contigs to self.outfile. Returns number of contigs written'''
+        counts = self._count_kmers()
+        print('Local assembler: kmer', self.kmer, 'found', len(counts), 'kmers with count at least', self.min_kmer_count, file=self.log_fh)
+        used = set()
+        contigs = []
+
+        for ref in pyfastaq.sequences.file_reader(self.ref_fasta):
+            ref_seq = ref.seq.upper()
+            for i in range(len(ref_seq) - self.kmer + 1):
+                seed = ref_seq[i:i + self.kmer]
+                if seed in counts and seed not in used:
+                    contig = self._contig_from_seed(seed, counts, used)
+                    if len(contig) >= self.min_contig_length:
+                        contigs.append(contig)
+
+        f = pyfastaq.utils.open_file_write(self.outfile)
+        for i, contig in enumerate(contigs):
+            print(pyfastaq.sequences.Fasta('contig.' + str(i + 1), contig), file=f)
+        pyfastaq.utils.close(f)
+        print('Local assembler: made', len(contigs), 'contigs', file=self.log_fh)
+        return len(contigs)
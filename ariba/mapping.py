@@ -97,36 +97,48 @@ def run_bowtie2(
     common.syscall(map_cmd, verbose=verbose, verbose_filehandle=verbose_filehandle)
 
     if sort:
-        threads = min(4, threads)
-        thread_mem = int(500 / threads)
-        sort_cmd = ' '.join([
-            samtools,
-            'sort',
-            '-@' + str(threads),
-            '-m' + str(thread_mem) + 'M',
-            '-o', final_bam,
-            '-O bam',
-            '-T', out_prefix + '.tmp.samtool_sort',
-            intermediate_bam,
-        ])
-        index_cmd = samtools + ' index ' + final_bam
-        common.syscall(sort_cmd, verbose=verbose, verbose_filehandle=verbose_filehandle)
-        common.syscall(index_cmd, verbose=verbose, verbose_filehandle=verbose_filehandle)
+        sort_and_index_bam(intermediate_bam, final_bam, threads=threads, samtools=samtools, verbose=verbose, verbose_filehandle=verbose_filehandle)
         clean_files.append(intermediate_bam)
 
     for fname in clean_files:
         os.unlink(fname)
 
 
-def get_total_alignment_score(bam):
-    '''Returns total of AS: tags in the input BAM'''
+def sort_and_index_bam(infile, outfile, threads=1, samtools='samtools', verbose=False, verbose_filehandle=sys.stdout):
+    '''Sorts the BAM file infile, writing outfile, and indexes outfile'''
+    threads = min(4, threads)
+    thread_mem = int(500 / threads)
+    sort_cmd = ' '.join([
+        samtools,
+        'sort',
+        '-@' + str(threads),
+        '-m' + str(thread_mem) + 'M',
+        '-o', outfile,
+        '-O bam',
+        '-T', outfile + '.tmp.samtool_sort',
+        infile,
+    ])
+    index_cmd = samtools + ' index ' + outfile
+    common.syscall(sort_cmd, verbose=verbose, verbose_filehandle=verbose_filehandle)
+    common.syscall(index_cmd, verbose=verbose, verbose_filehandle=verbose_filehandle)
+
+
+def get_total_alignment_score(bam, read_counts=None):
+    '''Returns total of AS: tags in the input BAM.
+       read_counts = optional dict of read name -> number of copies of that read (used when duplicate
+       reads were removed). The score of each read in the dict is multiplied by its count'''
     sam_reader = pysam.Samfile(bam, "rb")
     total = 0
     for sam in sam_reader.fetch(until_eof=True):
         try:
-            total += sam.opt('AS')
+            score = sam.opt('AS')
         except:
-            pass
+            continue
+
+        if read_counts is not None:
+            score *= read_counts.get(sam.qname, 1)
+
+        total += score
     return total
 
 
@@ -0,0 +1,86 @@
+class Error (Exception): pass
+
+
+# Very rough model of the peak memory (in MB) needed to run one cluster. This
+# is dominated by the assembler, which scales with the number of reads and
+# the number of distinct kmers (ie the length of the reference sequence).
+# The model only needs to get the relative sizes about right, because it is
+# rescaled using the memory actually used by finished clusters.
+base_memory_mb = 150
+memory_mb_per_read = 0.002
+memory_mb_per_ref_base = 0.02
+
+
+class MemoryScheduler:
+    def __init__(self, max_memory_mb, max_jobs):
+        '''Decides which clusters can be started, so that the sum of the estimated
+           memory of all running clusters stays within max_memory_mb, and that no
+           more than max_jobs clusters run at the same time'''
+        if max_memory_mb <= 0:
+            raise Error('Maximum memory must be > 0. Got ' + str(max_memory_mb))
+        if max_jobs < 1:
+            raise Error('Maximum number of jobs must be at least 1. Got ' + str(max_jobs))
+
+        self.max_memory_mb = max_memory_mb
+        self.max_jobs = max_jobs
+        self.running = {}   # job name -> estimated memory in MB
+        self.scale = None   # mean over finished jobs of (observed peak memory) / (predicted memory)
+        self.measured_jobs = 0
+        self.sum_of_ratios = 0
+
+
+    @staticmethod
+    def _predicted_memory(reads, ref_length):
+        return base_memory_mb + memory_mb_per_read * reads + memory_mb_per_ref_base * ref_length
+
+
+    def estimate(self, reads, ref_length):
+        '''Returns estimated peak memory in MB of running a cluster'''
+        predicted = self._predicted_memory(reads, ref_length)
+        return predicted if self.scale is None else self.scale * predicted
+
+
+    def memory_in_use(self):
+        return sum(self.running.values())
+
+
+    def can_start(self, estimate):
+        if len(self.running) >= self.max_jobs:
+            return False
+        elif len(self.running) == 0:
+            # Always allow one job, even if it looks too big. Otherwise it would never run
+            return True
+        else:
+            return self.memory_in_use() + estimate <= self.max_memory_mb
+
+
+    def next_job(self, pending):
+        '''pending = list of tuples (reads, ref_length), in the order they should be run.
+           Returns index of the first one that can be started now, or None if none can be started'''
+        for i, (reads, ref_length) in enumerate(pending):
+            if self.can_start(self.estimate(reads, ref_length)):
+                return i
+
+        return None
+
+
+    def start(self, name, reads, ref_length):
+        if name in self.running:
+            raise Error('Cannot start job "' + name + '" because it is already running')
+        self.running[name] = self.estimate(reads, ref_length)
+        return self.running[name]
+
+
+    def finish(self, name, reads, ref_length, peak_memory_mb=None):
+        '''Frees the memory of a finished job. If its peak memory was measured, then it is
+           used to rescale the memory estimates of the jobs that have not started yet.
+           The scale is the mean ratio of measured to predicted memory of all the measured jobs,
+           so that one unusual job does not change the estimates of all the later jobs for good'''
+        if name not in self.running:
+            raise Error('Cannot finish job "' + name + '" because it is not running')
+        del self.running[name]
+
+        if peak_memory_mb is not None and peak_memory_mb > 0:
+            self.measured_jobs += 1
+            self.sum_of_ratios += peak_memory_mb / self._predicted_memory(reads, ref_length)
+            self.scale = self.sum_of_ratios / self.measured_jobs
@@ -0,0 +1,358 @@
+import os
+import copy
+import bisect
+import pyfastaq
+
+class Error (Exception): pass
+
+match_score = 3
+mismatch_score = -7
+gap_score = -7
+
+coords_header = ['[S1]', '[E1]', '[S2]', '[E2]', '[LEN 1]', '[LEN 2]', '[% IDY]', '[LEN R]', '[LEN Q]', '[FRM]', '[TAGS]']
+snps_header = ['[P1]', '[SUB]', '[SUB]', '[P2]', '[BUFF]', '[DIST]', '[LEN R]', '[LEN Q]', '[FRM]', '[TAGS]']
+
+
+class Hit:
+    def __init__(self, ref, qry, reverse, columns):
+        '''One alignment between a reference and a query sequence.
+           columns = list of (ref position, query position) tuples, zero-based, with
+           None for a gap. Query positions are on the strand that was aligned, ie of the
+           reverse complement of the query when reverse is True'''
+        self.ref = ref
+        self.qry = qry
+        self.reverse = reverse
+        self.columns = columns
+        self.ref_start = columns[0][0]
+        self.ref_end = columns[-1][0]
+        self.qry_start = self._qry_coord(columns[0][1])
+        self.qry_end = self._qry_coord(columns[-1][1])
+        # Same as show-coords: errors (mismatches and indel bases) as a
+        # proportion of the length of the hit in the reference
+        errors = len([x for x in columns if None in x or ref[x[0]] != qry[x[1]]])
+        self.percent_identity = 100 * (self.hit_length_ref() - errors) / self.hit_length_ref()
+
+
+    def _qry_coord(self, position):
+        '''Returns position in the forward strand coordinates of the query'''
+        return len(self.qry) - position - 1 if self.reverse else position
+
+
+    def hit_length_ref(self):
+        return self.ref_end - self.ref_start + 1
+
+
+    def hit_length_qry(self):
+        return abs(self.qry_end - self.qry_start) + 1
+
+
+    def coords_line(self):
+        '''Returns the hit as a line in the same format as show-coords -dTlr'''
+        return '\t'.join([str(x) for x in [
+            self.ref_start + 1,
+            self.ref_end + 1,
+            self.qry_start + 1,
+            self.qry_end + 1,
+            self.hit_length_ref(),
+            self.hit_length_qry(),
+            '{:.2f}'.format(self.percent_identity),
+            len(self.ref),
+            len(self.qry),
+            1,
+            -1 if self.reverse else 1,
+            self.ref.id,
+            self.qry.id,
+        ]])
+
+
+    def variants(self):
+        '''Returns list of tuples (ref position, ref base, query base, query position), in the
+           same style as show-snps. Positions are zero-based, and the query position is in the
+           forward strand coordinates. An indel is reported one base at a time, with "." as the
+           missing base and the position of the previous aligned base of the other sequence'''
+        variants = []
+        last_ref = last_qry = None
+
+        for ref_pos, qry_pos in self.columns:
+            if ref_pos is None:
+                variants.append((last_ref, '.', self.qry[qry_pos], self._qry_coord(qry_pos)))
+            elif qry_pos is None:
+                variants.append((ref_pos, self.ref[ref_pos], '.', self._qry_coord(last_qry)))
+            elif self.ref[ref_pos] != self.qry[qry_pos]:
+                variants.append((ref_pos, self.ref[ref_pos], self.qry[qry_pos], self._qry_coord(qry_pos)))
+
+            if ref_pos is not None:
+                last_ref = ref_pos
+            if qry_pos is not None:
+                last_qry = qry_pos
+
+        return variants
+
+
+class Runner:
+    def __init__(self,
+      ref,
+      query,
+      outfile,
+      min_id=None,
+      min_length=None,
+      breaklen=None,
+      maxmatch=False,
+      show_snps=False,
+      kmer=15,
+      band=20,
+      max_gap=90,
+      min_cluster=65,
+      max_kmer_hits=10,
+      seq_groups=None,
+    ):
+        '''In-process alternative to pymummer.nucmer.Runner, taking the same main options.
+           Writes a coords file, and optionally a snps file (outfile.snps), in the formats made
+           by show-coords -dTlro and show-snps -TClr, so that they can be parsed by pymummer.
+           Kmer matches between each query and reference are chained along diagonals
+           (like nucmer clusters), and then each chain is extended by a banded Smith-Waterman
+           alignment, using the same match/mismatch/gap scores as nucmer.
+           breaklen is how far the alignment can extend past the ends of a chain.
+           maxmatch is accepted for compatibility only. Kmers that occur more than max_kmer_hits
+           times in a reference (eg in low complexity sequence) are not used to make chains,
+           but the alignments can still extend through them.
+           seq_groups = optional dict of sequence name -> group (eg the cluster of each
+           sequence). If given, each query is only aligned to the references in the same
+           group, so the snps of each group are the same as when it is aligned on its own'''
+        self.ref = ref
+        self.query = query
+        self.outfile = outfile
+        self.min_id = min_id
+        self.min_length = min_length
+        self.breaklen = 200 if breaklen is None else breaklen
+        self.show_snps = show_snps
+        self.kmer = kmer
+        self.band = band
+        self.max_gap = max_gap
+        self.min_cluster = min_cluster
+        self.max_kmer_hits = max_kmer_hits
+        self.seq_groups = seq_groups
+
+
+    def _kmer_index(self, seq):
+        '''Returns dict of kmer -> list of positions in seq. Kmers that occur
+           more than self.max_kmer_hits times are not included'''
+        index = {}
+        for i in range(len(seq) - self.kmer + 1):
+            index.setdefault(seq[i:i + self.kmer], []).append(i)
+        return {kmer: positions for kmer, positions in index.items() if len(positions) <= self.max_kmer_hits}
+
+
+    def _seed_chains(self, ref_index, qry_seq):
+        '''Returns list of chains of kmer matches. Each chain is a list of (query position, ref position)
+           tuples, with increasing positions in both sequences and diagonals that differ by at
+           most self.band. Chains covering less than self.min_cluster bases of the query are removed'''
+        chains = []
+        open_chains = [] # the chains that can still be extended, ie last match within self.max_gap
+
+        for qry_pos in range(len(qry_seq) - self.kmer + 1):
+            ref_positions = ref_index.get(qry_seq[qry_pos:qry_pos + self.kmer], [])
+            if len(ref_positions) == 0:
+                continue
+
+            open_chains = [x for x in open_chains if qry_pos - x[-1][0] <= self.max_gap]
+
+            for ref_pos in ref_positions:
+                for chain in reversed(open_chains):
+                    last_qry, last_ref = chain[-1]
+                    if ref_pos > last_ref and abs(ref_pos - qry_pos - last_ref + last_qry) <= self.band:
+                        chain.append((qry_pos, ref_pos))
+                        break
+                else:
+                    chains.append([(qry_pos, ref_pos)])
+                    open_chains.append(chains[-1])
+
+        long_chains = []
+        for chain in chains:
+            covered = 0
+            end = 0
+            for qry_pos, ref_pos in chain:
+                covered += qry_pos + self.kmer - max(qry_pos, end)
+                end = qry_pos + self.kmer
+            if covered >= self.min_cluster:
+                long_chains.append(chain)
+
+        return long_chains
+
+
+    @staticmethod
+    def _banded_local_alignment(ref_seq, qry_seq, qry_start, qry_end, diag_min, diag_max):
+        '''Smith-Waterman alignment of qry_seq[qry_start:qry_end] to ref_seq, only using the cells
+           where (ref position - query position) is in the range diag_min to diag_max.
+           Returns list of (ref position, query position) tuples for the best
+           local alignment (None means a gap), or an empty list if there is no alignment'''
+        width = diag_max - diag_min + 1
+        prev = [0] * (width + 2)
+        trace = []
+        best_score, best_i, best_x = 0, None, None
+
+        for i in range(qry_start + 1, qry_end + 1):
+            cur = [0] * (width + 2)
+            row_trace = bytearray(width + 2)
+            qry_base = qry_seq[i - 1]
+            for x in range(max(1, 1 - i - diag_min + 1), min(width, len(ref_seq) - i - diag_min + 1) + 1):
+                j = i + diag_min + x - 1
+                score = prev[x] + (match_score if ref_seq[j - 1] == qry_base else mismatch_score)
+                direction = 1
+                if prev[x + 1] + gap_score > score:
+                    score = prev[x + 1] + gap_score
+                    direction = 2
+                if cur[x - 1] + gap_score > score:
+                    score = cur[x - 1] + gap_score
+                    direction = 3
+                if score > 0:
+                    cur[x] = score
+                    row_trace[x] = direction
+                    if score > best_score:
+                        best_score, best_i, best_x = score, i, x
+
+            trace.append(row_trace)
+            prev = cur
+
+        columns = []
+        i, x = best_i, best_x
+        while best_score > 0 and i > qry_start:
+            direction = trace[i - qry_start - 1][x]
+            j = i + diag_min + x - 1
+            if direction == 0:
+                break
+            elif direction == 1:
+                columns.append((j - 1, i - 1))
+                i -= 1
+            elif direction == 2:
+                columns.append((None, i - 1))
+                i -= 1
+                x += 1
+            else:
+                columns.append((j - 1, None))
+                x -= 1
+
+        columns.reverse()
+        return columns
+
+
+    def _align_pair(self, ref, ref_index, qry):
+        '''Returns list of Hit objects of qry (on both strands) to ref that pass the identity and length cutoffs'''
+        hits = []
+        seen = set()
+        ref_seq = ref.seq.upper()
+
+        for reverse in [False, True]:
+            qry_seq = qry.seq.upper()
+            if reverse:
+                qry_seq = qry_seq[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+            aligned_qry = pyfastaq.sequences.Fasta(qry.id, qry_seq)
+
+            for chain in self._seed_chains(ref_index, qry_seq):
+                diagonals = [ref_pos - qry_pos for qry_pos, ref_pos in chain]
+                columns = self._banded_local_alignment(
+                    ref_seq,
+                    qry_seq,
+                    max(0, chain[0][0] - self.breaklen),
+                    min(len(qry_seq), chain[-1][0] + self.kmer + self.breaklen),
+                    min(diagonals) - self.band,
+                    max(diagonals) + self.band,
+                )
+                if len(columns) == 0:
+                    continue
+
+                hit = Hit(pyfastaq.sequences.Fasta(ref.id, ref_seq), aligned_qry, reverse, columns)
+                key = (hit.ref_start, hit.ref_end, hit.qry_start, hit.qry_end)
+                if key in seen \
+                  or (self.min_id is not None and hit.percent_identity < self.min_id) \
+                  or (self.min_length is not None and hit.hit_length_ref() < self.min_length):
+                    continue
+
+                seen.add(key)
+                hits.append(hit)
+
+        return hits
+
+
+    @staticmethod
+    def _snps_lines(hits):
+        '''Returns list of lines of the snps file, in the same format as show-snps -TClr.
+           Like the -C option of show-snps, variants at positions covered by more than one
+           of the hits (in the reference or the query) are not reported. With seq_groups,
+           there are only hits within each group, so this is done per group'''
+        ref_depth = {}
+        qry_depth = {}
+        for hit in hits:
+            ref_depth.setdefault(hit.ref.id, [0] * len(hit.ref))
+            qry_depth.setdefault(hit.qry.id, [0] * len(hit.qry))
+            for i in range(hit.ref_start, hit.ref_end + 1):
+                ref_depth[hit.ref.id][i] += 1
+            for i in range(min(hit.qry_start, hit.qry_end), max(hit.qry_start, hit.qry_end) + 1):
+                qry_depth[hit.qry.id][i] += 1
+
+        lines = []
+        for hit in hits:
+            variants = hit.variants()
+            positions = [x[0] for x in variants] # sorted, because variants are in alignment order
+            for ref_pos, ref_base, qry_base, qry_pos in variants:
+                if ref_depth[hit.ref.id][ref_pos] > 1 or qry_depth[hit.qry.id][qry_pos] > 1:
+                    continue
+
+                # distance to the nearest end of the hit, or other variant at a different position
+                buff = min(ref_pos - hit.ref_start + 1, hit.ref_end - ref_pos + 1)
+                i = bisect.bisect_left(positions, ref_pos)
+                if i > 0:
+                    buff = min(buff, ref_pos - positions[i - 1])
+                i = bisect.bisect_right(positions, ref_pos)
+                if i < len(positions):
+                    buff = min(buff, positions[i] - ref_pos)
+                dist = min(ref_pos + 1, len(hit.ref) - ref_pos, qry_pos + 1, len(hit.qry) - qry_pos)
+                lines.append((hit.ref.id, ref_pos, qry_pos, hit.qry.id, '\t'.join([str(x) for x in [
+                    ref_pos + 1,
+                    ref_base,
+                    qry_base,
+                    qry_pos + 1,
+                    buff,
+                    dist,
+                    len(hit.ref),
+                    len(hit.qry),
+                    1,
+                    -1 if hit.reverse else 1,
+                    hit.ref.id,
+                    hit.qry.id,
+                ]])))
+
+        return lines
+
+
+    def run(self):
+        refs = [copy.copy(x) for x in pyfastaq.sequences.file_reader(self.ref)]
+        queries = [copy.copy(x) for x in pyfastaq.sequences.file_reader(self.query)]
+        ref_order = {ref.id: i for i, ref in enumerate(refs)}
+        hits = []
+
+        for ref in refs:
+            ref_index = self._kmer_index(ref.seq.upper())
+            for qry in queries:
+                if self.seq_groups is None or self.seq_groups[ref.id] == self.seq_groups[qry.id]:
+                    hits.extend(self._align_pair(ref, ref_index, qry))
+
+        hits.sort(key=lambda x: (ref_order[x.ref.id], x.ref_start, x.ref_end, x.qry.id, x.qry_start))
+        header = os.path.abspath(self.ref) + ' ' + os.path.abspath(self.query) + '\nNUCMER\n'
+
+        f = pyfastaq.utils.open_file_write(self.outfile)
+        print(header, file=f)
+        print(*coords_header, sep='\t', file=f)
+        for hit in hits:
+            print(hit.coords_line(), file=f)
+        pyfastaq.utils.close(f)
+
+        if self.show_snps:
+            lines = self._snps_lines(hits)
+            lines.sort(key=lambda x: (ref_order[x[0]], x[1], x[2], x[3]))
+            f = pyfastaq.utils.open_file_write(self.outfile + '.snps')
+            print(header, file=f)
+            print(*snps_header, sep='\t', file=f)
+            for line in lines:
+                print(line[-1], file=f)
+            pyfastaq.utils.close(f)
@@ -0,0 +1,156 @@
+import os
+import copy
+import pysam
+import pyfastaq
+from ariba import samtools_variants
+
+class Error (Exception): pass
+
+min_base_qual = 13 # same as the default of samtools mpileup -Q
+max_qual = 999
+
+
+class PysamVariants(samtools_variants.SamtoolsVariants):
+    '''In-process alternative to SamtoolsVariants, which makes the pileup with pysam instead of
+       running samtools mpileup and bcftools. It writes the VCF and read depths files in the same
+       formats, so that all the other methods of SamtoolsVariants can be used on the results.
+       The calls are simpler than those of bcftools, so the files are not the same:
+       At each position, the depth is the number of bases with quality >= min_base_qual,
+       and every base seen that is not the reference is reported as an alternative allele.
+       Indels are called from the reads that have an insertion or deletion straight after the
+       position (no realignment around indels), and are written as an extra row of the read depths
+       file and VCF file at that position, like bcftools does. The quality of a variant is the sum
+       of the base qualities of the reads supporting the alternative alleles (capped at max_qual).
+       The variant is written to the VCF file if it passes the bcf_min_dp, bcf_min_dv,
+       bcf_min_dv_over_dp and bcf_min_qual cutoffs, in the same way as the bcftools filter'''
+
+    @staticmethod
+    def _pileup_counts(sam_reader, seq_name, start, end):
+        '''Generator of (position, base counts, base quality sums, indel counts, indel quality sums)
+           for each covered position of the sequence seq_name in the (zero-based) range start to end,
+           using the open BAM file sam_reader. The counts and quality sums are dictionaries of
+           base -> value, only using bases with quality >= min_base_qual. The indel dictionaries
+           have keys "+" plus the inserted bases, or "-" plus the number of deleted bases, for the
+           indels straight after the position'''
+        for column in sam_reader.pileup(seq_name, start, end + 1):
+            if not start <= column.reference_pos <= end:
+                continue
+
+            counts = {}
+            qual_sums = {}
+            indel_counts = {}
+            indel_qual_sums = {}
+            for pileupread in column.pileups:
+                if pileupread.is_del or pileupread.is_refskip:
+                    continue
+
+                qual = ord(pileupread.alignment.qual[pileupread.query_position]) - 33
+                if qual < min_base_qual:
+                    continue
+
+                base = pileupread.alignment.seq[pileupread.query_position].upper()
+                counts[base] = counts.get(base, 0) + 1
+                qual_sums[base] = qual_sums.get(base, 0) + qual
+
+                if pileupread.indel > 0:
+                    indel = '+' + pileupread.alignment.seq[pileupread.query_position + 1:pileupread.query_position + 1 + pileupread.indel].upper()
+                elif pileupread.indel < 0:
+                    indel = '-' + str(-pileupread.indel)
+                else:
+                    continue
+
+                indel_counts[indel] = indel_counts.get(indel, 0) + 1
+                indel_qual_sums[indel] = indel_qual_sums.get(indel, 0) + qual
+
+            if len(counts) > 0:
+                yield column.reference_pos, counts, qual_sums, indel_counts, indel_qual_sums
+
+
+    @staticmethod
+    def _call_position(ref_base, counts, qual_sums):
+        '''Returns tuple (alt alleles, depth, allele depths, number of reads supporting
+           the alt alleles, quality). The alt alleles are sorted by decreasing count'''
+        alts = sorted([x for x in counts if x != ref_base], key=lambda x: (-counts[x], x))
+        depth = sum(counts.values())
+        allele_depths = [counts.get(ref_base, 0)] + [counts[x] for x in alts]
+        alt_depth = depth - allele_depths[0]
+        qual = min(max_qual, sum([qual_sums[x] for x in alts]))
+        return alts, depth, allele_depths, alt_depth, qual
+
+
+    @staticmethod
+    def _call_indels(ref_seq, position, depth, indel_counts, indel_qual_sums):
+        '''ref_seq = sequence of the contig, depth = depth at the (zero-based) position.
+           Returns tuple (ref allele, alt alleles, allele depths, number of reads
+           supporting the alt alleles, quality), with alleles written the same way as
+           in a VCF file. The alt alleles are sorted by decreasing count'''
+        indels = sorted(indel_counts, key=lambda x: (-indel_counts[x], x))
+        ref_end = position + 1 + max([int(x[1:]) for x in indels if x.startswith('-')], default=0)
+        ref_allele = ref_seq[position:ref_end]
+        alts = []
+        for indel in indels:
+            if indel.startswith('+'):
+                alts.append(ref_seq[position] + indel[1:] + ref_seq[position + 1:ref_end])
+            else:
+                alts.append(ref_seq[position] + ref_seq[position + 1 + int(indel[1:]):ref_end])
+
+        alt_depth = sum(indel_counts.values())
+        allele_depths = [depth - alt_depth] + [indel_counts[x] for x in indels]
+        qual = min(max_qual, sum(indel_qual_sums.values()))
+        return ref_allele, alts, allele_depths, alt_depth, qual
+
+
+    def _passes_filters(self, depth, alt_depth, qual):
+        return alt_depth > 0 \
+          and depth >= self.bcf_min_dp \
+          and alt_depth >= self.bcf_min_dv \
+          and alt_depth / depth >= self.bcf_min_dv_over_dp \
+          and qual >= self.bcf_min_qual
+
+
+    def _make_vcf_and_read_depths_files(self):
+        refs = [copy.copy(x) for x in pyfastaq.sequences.file_reader(self.ref_fa)]
+        vcf_out = pyfastaq.utils.open_file_write(self.vcf_file)
+        print('##fileformat=VCFv4.2', file=vcf_out)
+        print('##source=ariba_pysam_variants', file=vcf_out)
+        for ref in refs:
+            print('##contig=<ID=', ref.id, ',length=', len(ref), '>', sep='', file=vcf_out)
+        print('##INFO=<ID=INDEL,Number=0,Type=Flag,Description="Indicates that the variant is an INDEL.">', file=vcf_out)
+        print('##INFO=<ID=DP,Number=1,Type=Integer,Description="Number of high-quality bases">', file=vcf_out)
+        print('##INFO=<ID=DV,Number=1,Type=Integer,Description="Number of high-quality non-reference bases">', file=vcf_out)
+        print('##INFO=<ID=DPR,Number=R,Type=Integer,Description="Number of high-quality bases observed for each allele">', file=vcf_out)
+        print('#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', sep='\t', file=vcf_out)
+        depths_out = pyfastaq.utils.open_file_write(self.read_depths_file + '.tmp')
+        sam_reader = pysam.Samfile(self.bam, "rb")
+
+        for ref in refs:
+            ref_seq = ref.seq.upper()
+            if self.regions is None:
+                intervals = [pyfastaq.intervals.Interval(0, len(ref) - 1)]
+            else:
+                intervals = sorted(self.regions.get(ref.id, []))
+
+            for interval in intervals:
+                for position, counts, qual_sums, indel_counts, indel_qual_sums in self._pileup_counts(sam_reader, ref.id, interval.start, interval.end):
+                    ref_base = ref_seq[position]
+                    alts, depth, allele_depths, alt_depth, qual = self._call_position(ref_base, counts, qual_sums)
+                    calls = [('', ref_base, alts, allele_depths, alt_depth, qual)]
+                    if len(indel_counts):
+                        ref_allele, alts, allele_depths, alt_depth, qual = self._call_indels(ref_seq, position, depth, indel_counts, indel_qual_sums)
+                        calls.append(('INDEL;', ref_allele, alts, allele_depths, alt_depth, qual))
+
+                    for info_prefix, ref_allele, alts, allele_depths, alt_depth, qual in calls:
+                        alt_column = ','.join(alts) if len(alts) else '.'
+                        allele_depths = ','.join([str(x) for x in allele_depths])
+                        print(ref.id, position + 1, ref_allele, alt_column, depth, allele_depths, sep='\t', file=depths_out)
+
+                        if self._passes_filters(depth, alt_depth, qual):
+                            info = info_prefix + 'DP=' + str(depth) + ';DV=' + str(alt_depth) + ';DPR=' + allele_depths
+                            print(ref.id, position + 1, '.', ref_allele, alt_column, qual, 'PASS', info, sep='\t', file=vcf_out)
+
+        sam_reader.close()
+        pyfastaq.utils.close(vcf_out)
+        pyfastaq.utils.close(depths_out)
+        pysam.tabix_compress(self.read_depths_file + '.tmp', self.read_depths_file)
+        pysam.tabix_index(self.read_depths_file, seq_col=0, start_col=1, end_col=1)
+        os.unlink(self.read_depths_file + '.tmp')
@@ -3,7 +3,7 @@ import sys
 import re
 import copy
 import pyfastaq
-from ariba import sequence_metadata, cdhit
+from ariba import sequence_metadata, cdhit, variant_index
 
 
 class Error (Exception): pass
@@ -40,6 +40,7 @@ class ReferenceData:
             raise Error('Error! No sequences found in input file(s). Maybe they were empty? Cannot continue.')
 
         self.metadata = self._load_metadata_tsv(metadata_tsv)
+        self.variant_indexes = {}
         self.genetic_code = genetic_code
         pyfastaq.sequences.genetic_code = self.genetic_code
         common_names = self._dict_keys_intersection(list(self.seq_dicts.values()))
@@ -422,22 +423,33 @@ class ReferenceData:
         return len(seq)
 
 
-    def all_non_wild_type_variants(self, ref_name):
-        ref_seq = self.sequence(ref_name)
-        variants = {'n': {}, 'p': {}}
+    def variant_index(self, ref_name):
+        '''Returns the variant_index.VariantIndex of the reference sequence ref_name
+           (or None if there is no such sequence). It is made the first time this is called.
+           The metadata must not be changed after the index is made'''
+        if ref_name not in self.variant_indexes:
+            ref_seq = self.sequence(ref_name)
+            if ref_seq is None:
+                return None
+            self.variant_indexes[ref_name] = variant_index.VariantIndex(ref_seq, self.metadata.get(ref_name, None))
+
+        return self.variant_indexes[ref_name]
 
-        if ref_seq is None or ref_name not in self.metadata:
-            return variants
 
-        for variant_type in ['n', 'p']:
-            for position, metadata_set in self.metadata[ref_name][variant_type].items():
-                for metadata in metadata_set:
-                    if position not in variants[variant_type]:
-                        variants[variant_type][position] = set()
+    def make_variant_indexes(self):
+        '''Makes the variant index of every reference sequence that has metadata. Call this once
+           after loading the data, so that the indexes are shared by everything that uses this object'''
+        for ref_name in self.metadata:
+            self.variant_index(ref_name)
 
-                    variants[variant_type][position].add(metadata)
 
-        return variants
+    def all_non_wild_type_variants(self, ref_name):
+        '''Returns dictionary of variant type ('n' or 'p') -> dictionary of position -> set of
+           known variants at that position. This comes from the variant index, so must not be changed'''
+        if self.sequence(ref_name) is None or ref_name not in self.metadata:
+            return {'n': {}, 'p': {}}
+
+        return self.variant_index(ref_name).variants
 
 
     @staticmethod
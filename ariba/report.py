@@ -1,5 +1,5 @@
 import sys
-import pymummer
+from ariba import flag
 
 class Error (Exception): pass
 
@@ -78,6 +78,60 @@ def header_line():
     return '\t'.join(columns)
 
 
+class ReportRecord:
+    '''One line of the report, with one attribute per column. Values of the int and float
+       columns are converted to numbers (unless they are '.'), and the flag is a flag.Flag.
+       Items can also be got and set like a dictionary, with the column names as keys'''
+    __slots__ = columns
+
+    def __init__(self, values):
+        if len(values) != len(columns):
+            raise Error('Error making report record. Expected ' + str(len(columns)) + ' columns but got ' + str(len(values)))
+
+        for key, value in zip(columns, values):
+            setattr(self, key, value)
+
+        for key in int_columns:
+            if getattr(self, key) != '.':
+                setattr(self, key, int(getattr(self, key)))
+
+        for key in float_columns:
+            if getattr(self, key) != '.':
+                setattr(self, key, float(getattr(self, key)))
+
+        self.flag = flag.Flag(int(self.flag))
+
+
+    @classmethod
+    def from_line(cls, line):
+        return cls(line.rstrip('\n').split('\t'))
+
+
+    def __eq__(self, other):
+        return type(other) is type(self) and all([getattr(self, x) == getattr(other, x) for x in columns])
+
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+
+    def __setitem__(self, key, value):
+        if key not in columns:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in columns else default
+
+
+    def to_line(self):
+        return '\t'.join([str(getattr(self, x)) for x in columns])
+
+
 def _samtools_depths_at_known_snps_all_wild(sequence_meta, contig_name, cluster, variant_list):
     '''Input is a known variants, as sequence_metadata object. The
        assumption is that both the reference and the assembly have the
@@ -97,7 +151,7 @@ def _samtools_depths_at_known_snps_all_wild(sequence_meta, contig_name, cluster,
     contig_positions = []
 
     for ref_position in range(ref_nuc_range[0], ref_nuc_range[1]+1, 1):
-        nucmer_match = cluster.assembly_compare.nucmer_hit_containing_reference_position(cluster.assembly_compare.nucmer_hits, cluster.ref_sequence.id, ref_position)
+        nucmer_match = cluster.assembly_compare.hit_containing_reference_position(cluster.ref_sequence.id, ref_position)
 
         if nucmer_match is not None:
             # work out contig position. Needs indels variants to correct the position
@@ -131,8 +185,8 @@ def _samtools_depths_at_known_snps_all_wild(sequence_meta, contig_name, cluster,
     ]]
 
 
-def _report_lines_for_one_contig(cluster, contig_name, ref_cov_per_contig, pymummer_variants):
-    lines = []
+def _report_rows_for_one_contig(cluster, contig_name, ref_cov_per_contig, pymummer_variants):
+    rows = []
     contig_length = len(cluster.assembly.sequences[contig_name])
     assert contig_length != 0
 
@@ -215,7 +269,7 @@ def _report_lines_for_one_contig(cluster, contig_name, ref_cov_per_contig, pymum
                         samtools_columns = _samtools_depths_at_known_snps_all_wild(matching_var, contig_name, cluster, pymummer_variants)
                     variant_columns[3] = str(matching_var.variant)
 
-                    if matching_var.has_variant(cluster.ref_sequence) == (ref_ctg_change is not None):
+                    if cluster.refdata.variant_index(cluster.ref_sequence.id).has_variant(matching_var) == (ref_ctg_change is not None):
                         variant_columns[4] = '0'
                     else:
                         variant_columns[4] = '1'
@@ -223,46 +277,51 @@ def _report_lines_for_one_contig(cluster, contig_name, ref_cov_per_contig, pymum
                     if samtools_columns is None:
                         samtools_columns = [['.'] * 9]
 
-                    lines.append('\t'.join(common_first_columns + variant_columns + samtools_columns + [matching_vars_column] + [free_text_column]))
+                    rows.append(common_first_columns + variant_columns + samtools_columns + [matching_vars_column] + [free_text_column])
             else:
-                lines.append('\t'.join(
+                rows.append(
                     common_first_columns + variant_columns + \
                     samtools_columns + \
                     [matching_vars_column] + [free_text_column]
-                ))
+                )
     else:
-        lines.append('\t'.join(common_first_columns + ['.'] * (len(columns) - len(common_first_columns) - 1) + [free_text_column]))
+        rows.append(common_first_columns + ['.'] * (len(columns) - len(common_first_columns) - 1) + [free_text_column])
 
-    return lines
+    return rows
 
 
-def report_lines(cluster):
+def report_rows(cluster):
+    '''Returns list of the rows of the report for the cluster, where each row is
+       a list of the (string) values of the columns. Returns None if there are no rows'''
     if cluster.status_flag.has('ref_seq_choose_fail'):
-        return ['\t'.join(['.', '.', str(cluster.status_flag), str(cluster.total_reads), cluster.name] + ['.'] * (len(columns) - 5))]
+        return [['.', '.', str(cluster.status_flag), str(cluster.total_reads), cluster.name] + ['.'] * (len(columns) - 5)]
     elif cluster.status_flag.has('assembly_fail'):
-        return ['\t'.join([cluster.ref_sequence.id, cluster.ref_sequence_type, str(cluster.status_flag), str(cluster.total_reads), cluster.name] + ['.'] * (len(columns) - 5))]
+        return [[cluster.ref_sequence.id, cluster.ref_sequence_type, str(cluster.status_flag), str(cluster.total_reads), cluster.name] + ['.'] * (len(columns) - 5)]
 
 
     ref_cov_per_contig = cluster.assembly_compare.ref_cov_per_contig(cluster.assembly_compare.nucmer_hits)
-    lines = []
-    pymummer_variants = pymummer.snp_file.get_all_variants(cluster.assembly_compare.nucmer_snps_file)
+    rows = []
+    pymummer_variants = cluster.assembly_compare.nucmer_variants_by_contig()
 
     for contig_name in sorted(cluster.assembly.sequences):
-        contig_pymummer_variants = [x for x in pymummer_variants if x.qry_name == contig_name]
-        lines.extend(_report_lines_for_one_contig(cluster, contig_name, ref_cov_per_contig, contig_pymummer_variants))
+        contig_pymummer_variants = pymummer_variants.get(contig_name, [])
+        rows.extend(_report_rows_for_one_contig(cluster, contig_name, ref_cov_per_contig, contig_pymummer_variants))
 
-    lines_ok = True
+    rows_ok = True
 
-    for line in lines:
-        if len(line.split('\t')) != len(columns):
-            cols = line.split('\t')
-            print('Error making report - wrong number of columns. Expected', len(columns), 'but got', len(cols), file=sys.stderr)
-            for i in range(len(cols)):
-                print(i, cols[i], sep='\t', file=sys.stderr)
-            lines_ok = False
+    for row in rows:
+        if len(row) != len(columns):
+            print('Error making report - wrong number of columns. Expected', len(columns), 'but got', len(row), file=sys.stderr)
+            for i in range(len(row)):
+                print(i, row[i], sep='\t', file=sys.stderr)
+            rows_ok = False
 
-    if not lines_ok:
+    if not rows_ok:
         raise Error('Error making report. Cannot continue')
 
-    return lines if len(lines) > 0 else None
+    return rows if len(rows) > 0 else None
 
+
+def report_lines(cluster):
+    rows = report_rows(cluster)
+    return None if rows is None else ['\t'.join(x) for x in rows]
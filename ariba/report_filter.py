@@ -1,12 +1,17 @@
-import openpyxl
+import copy
 import pyfastaq
-from ariba import report, flag
+from ariba import report, report_xls, flag
 
 class Error (Exception): pass
 
+flag_index = report.columns.index('flag')
+pc_ident_index = report.columns.index('pc_ident')
+ref_base_assembled_index = report.columns.index('ref_base_assembled')
+
 class ReportFilter:
     def __init__(self,
             infile=None,
+            records=None,
             min_pc_ident=90,
             min_ref_base_assembled=1,
             ignore_not_has_known_variant=False,
@@ -14,11 +19,8 @@ class ReportFilter:
             exclude_flags=None,
         ):
 
-        if infile is not None:
-            self.report = self._load_report(infile)
-        else:
-            self.report = {}
-
+        '''infile = report file made by Clusters. Alternatively, records = list of
+           report.ReportRecord objects, which are used instead of reading a file'''
         self.min_pc_ident = min_pc_ident
         self.min_ref_base_assembled = min_ref_base_assembled
         self.ignore_not_has_known_variant = ignore_not_has_known_variant
@@ -29,6 +31,17 @@ class ReportFilter:
         else:
             self.exclude_flags = exclude_flags
 
+        if infile is not None and records is not None:
+            raise Error('Cannot use both infile and records in ReportFilter. Cannot continue')
+        elif infile is not None:
+            self.report = self._load_report(infile)
+        elif records is not None:
+            self.lines_in = len(records)
+            self.report = self._load_records(records)
+        else:
+            self.lines_in = 0
+            self.report = {}
+
 
     @classmethod
     def _report_line_to_dict(cls, line):
@@ -37,6 +50,12 @@ class ReportFilter:
         if len(data) != len(report.columns):
             return None
 
+        return cls._report_values_to_dict(data)
+
+
+    @classmethod
+    def _report_values_to_dict(cls, data):
+        '''Same as _report_line_to_dict, but takes the list of values of the line'''
         d = dict(zip(report.columns, data))
         for key in report.int_columns:
             try:
@@ -60,11 +79,31 @@ class ReportFilter:
         return '\t'.join([str(report_dict[x]) for x in report.columns])
 
 
-    @staticmethod
-    def _load_report(infile):
+    def _values_pass_essential_filters(self, values, exclude_bits):
+        '''Same as _report_dict_passes_essential_filters, but using the list of values of one line
+        of a report file, so that no dict is made. exclude_bits = bits of self.exclude_flags'''
+        if int(values[flag_index]) & exclude_bits:
+            return False
+
+        try:
+            return float(values[pc_ident_index]) >= self.min_pc_ident \
+                and int(values[ref_base_assembled_index]) >= self.min_ref_base_assembled
+        except ValueError:
+            # the value is '.', which cannot pass the cutoff
+            return False
+
+
+    def _load_report(self, infile):
         '''Loads report file into a dictionary. Key=refrence name.
-        Value = list of report lines for that reference'''
+        Value = list of report lines for that reference.
+        Lines that fail the essential filters are never written by run(), so
+        they are not loaded. Sets self.lines_in to the number of lines in infile'''
         report_dict = {}
+        exclude_bits = 0
+        for f in self.exclude_flags:
+            exclude_bits |= flag.flag_bits[f]
+
+        self.lines_in = 0
         f = pyfastaq.utils.open_file_read(infile)
         first_line = True
 
@@ -77,24 +116,48 @@ class ReportFilter:
                     pyfastaq.utils.close(f)
                     raise Error('Error reading report file. Expected first line of file is\n' + expected_first_line + '\nbut got:\n' + line)
                 first_line = False
-            else:
-                line_dict = ReportFilter._report_line_to_dict(line)
-                if line_dict is None:
-                    pyfastaq.utils.close(f)
-                    raise Error('Error reading report file at this line:\n' + line)
-                ref_name = line_dict['ref_name']
-                ctg_name = line_dict['ctg']
-                if ref_name not in report_dict:
-                    report_dict[ref_name] = {}
-                if ctg_name not in report_dict[ref_name]:
-                    report_dict[ref_name][ctg_name] = []
+                continue
 
-                report_dict[ref_name][ctg_name].append(line_dict)
+            self.lines_in += 1
+            values = line.split('\t')
+            if len(values) != len(report.columns):
+                pyfastaq.utils.close(f)
+                raise Error('Error reading report file at this line:\n' + line)
+
+            if not self._values_pass_essential_filters(values, exclude_bits):
+                continue
+
+            line_dict = ReportFilter._report_values_to_dict(values)
+            ref_name = line_dict['ref_name']
+            ctg_name = line_dict['ctg']
+            if ref_name not in report_dict:
+                report_dict[ref_name] = {}
+            if ctg_name not in report_dict[ref_name]:
+                report_dict[ref_name][ctg_name] = []
+
+            report_dict[ref_name][ctg_name].append(line_dict)
 
         pyfastaq.utils.close(f)
         return report_dict
 
 
+    @staticmethod
+    def _load_records(records):
+        '''Same as _load_report, but using a list of report.ReportRecord objects
+        instead of a report file. The dictionary values are lists of records'''
+        report_dict = {}
+
+        for record in records:
+            if record.ref_name not in report_dict:
+                report_dict[record.ref_name] = {}
+            if record.ctg not in report_dict[record.ref_name]:
+                report_dict[record.ref_name][record.ctg] = []
+
+            report_dict[record.ref_name][record.ctg].append(record)
+
+        return report_dict
+
+
     @staticmethod
     def _flag_passes_filter(flag, exclude_flags):
         for f in exclude_flags:
@@ -143,7 +206,7 @@ class ReportFilter:
         if len(pass_dicts) == 0:
             assert len(fail_dicts) + len(essential_dicts) > 0
             if len(essential_dicts) > 0:
-                new_d = essential_dicts[0]
+                new_d = copy.copy(essential_dicts[0])
                 for key in report.var_columns:
                     new_d[key] = '.'
                 pass_dicts.append(new_d)
@@ -184,30 +247,86 @@ class ReportFilter:
             del self.report[ref_name]
 
 
+    def report_dicts(self):
+        '''Returns list of all the report dicts (or records), in the order they are written to the report file'''
+        dicts = []
+        for ref_name in sorted(self.report):
+            for ctg_name, report_dicts in sorted(self.report[ref_name].items()):
+                dicts.extend(report_dicts)
+        return dicts
+
+
     def _write_report_tsv(self, outfile):
         f = pyfastaq.utils.open_file_write(outfile)
         print('#' + '\t'.join(report.columns), file=f)
 
-        for ref_name in sorted(self.report):
-            for ctg_name, report_dicts in sorted(self.report[ref_name].items()):
-                for d in report_dicts:
-                    print(ReportFilter._dict_to_report_line(d), file=f)
+        for d in self.report_dicts():
+            print(ReportFilter._dict_to_report_line(d), file=f)
 
         pyfastaq.utils.close(f)
 
 
     def _write_report_xls(self, outfile):
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.worksheets[0]
-        worksheet.title = 'ARIBA_report'
-        worksheet.append(report.columns)
+        report_xls.write_xls(([str(d[x]) for x in report.columns] for d in self.report_dicts()), outfile)
 
-        for ref_name in sorted(self.report):
-            for ctg_name, report_dicts in sorted(self.report[ref_name].items()):
-                for d in report_dicts:
-                    worksheet.append([str(d[x]) for x in report.columns])
 
-        workbook.save(outfile)
+    @staticmethod
+    def _report_groups(infile):
+        '''Generator of lists of report dicts from the report file infile, one list for each
+           group of consecutive lines with the same ref_name and ctg. Only one group is held in memory
+           at a time, and only the ref_name and ctg of the current group are remembered.
+           The lines of each group must be next to each other in the file. This is not checked:
+           a ref_name and ctg that comes back later in the file is yielded as a new group'''
+        f = pyfastaq.utils.open_file_read(infile)
+        expected_first_line = '#' + '\t'.join(report.columns)
+        first_line = f.readline().rstrip()
+        if first_line != expected_first_line:
+            pyfastaq.utils.close(f)
+            raise Error('Error reading report file. Expected first line of file is\n' + expected_first_line + '\nbut got:\n' + first_line)
+
+        group = []
+
+        for line in f:
+            line_dict = ReportFilter._report_line_to_dict(line.rstrip())
+            if line_dict is None:
+                pyfastaq.utils.close(f)
+                raise Error('Error reading report file at this line:\n' + line)
+
+            key = (line_dict['ref_name'], line_dict['ctg'])
+            if len(group) > 0 and key != (group[0]['ref_name'], group[0]['ctg']):
+                yield group
+                group = []
+
+            group.append(line_dict)
+
+        pyfastaq.utils.close(f)
+        if len(group) > 0:
+            yield group
+
+
+    def run_streaming(self, infile, outprefix):
+        '''Same as making a ReportFilter with infile and then running it, but only holds one
+           group of lines (with the same ref_name and ctg) in memory at a time. The lines of each group
+           must be next to each other in infile, as they are in report.all.tsv made by ariba run.
+           This is not checked (see _report_groups). If the lines of a group are split up, each
+           part is filtered on its own, so the output can differ from run().
+           Groups are written in the same order as infile, not sorted by ref_name and ctg as run() does.
+           Returns tuple (number of lines read, number of lines written), not including the header'''
+        f = pyfastaq.utils.open_file_write(outprefix + '.tsv')
+        print('#' + '\t'.join(report.columns), file=f)
+        lines_in = 0
+        lines_out = 0
+
+        try:
+            for group in self._report_groups(infile):
+                lines_in += len(group)
+                for d in self._filter_list_of_dicts(group):
+                    print(ReportFilter._dict_to_report_line(d), file=f)
+                    lines_out += 1
+        finally:
+            pyfastaq.utils.close(f)
+
+        return lines_in, lines_out
 
 
     def run(self, outprefix):
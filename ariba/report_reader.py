@@ -0,0 +1,111 @@
+import sys
+import array
+import itertools
+import pyfastaq
+from ariba import flag, report
+
+class Error (Exception): pass
+
+
+def _convert_column(values, convert, typecode):
+    '''Returns the values converted with convert. This is an array if none of the values
+       are '.', otherwise a list where the '.' values are kept as they are'''
+    try:
+        return array.array(typecode, map(convert, values))
+    except ValueError:
+        pass
+
+    try:
+        return [x if x == '.' else convert(x) for x in values]
+    except ValueError as e:
+        raise Error('Error converting value in report column. ' + str(e))
+
+
+class ReportTable:
+    def __init__(self, columns, number_of_rows):
+        '''Report stored by column. columns = dict of column name -> list or array
+           of the values of that column, with one value per row'''
+        self.columns = columns
+        self.number_of_rows = number_of_rows
+
+
+    def __len__(self):
+        return self.number_of_rows
+
+
+    def rows(self, indexes=None):
+        '''Generator of tuples of values, one tuple per row, in the same order as report.columns.
+           indexes = optional list of row indexes (counting from 0), to only get those rows'''
+        if indexes is None:
+            return zip(*[self.columns[x] for x in report.columns])
+        else:
+            return zip(*[[self.columns[x][i] for i in indexes] for x in report.columns])
+
+
+    def dicts(self, indexes=None):
+        '''Generator of dictionaries of column name -> value, one per row (or one per row
+           in indexes, if given). The flag is a flag.Flag object. Rows with the same flag
+           share the same flag.Flag object'''
+        flags = {}
+        flag_index = report.columns.index('flag')
+
+        for row in self.rows(indexes=indexes):
+            d = dict(zip(report.columns, row))
+            if row[flag_index] not in flags:
+                flags[row[flag_index]] = flag.Flag(row[flag_index])
+            d['flag'] = flags[row[flag_index]]
+            yield d
+
+
+def load_report(filename, int_columns=None, float_columns=None):
+    '''Loads a report file made by ariba run (eg report.tsv) into a ReportTable.
+       The columns in int_columns and float_columns (default report.int_columns and report.float_columns)
+       are converted to numbers, apart from '.' values. The flag column is converted to ints.
+       All other columns are kept as strings, which are interned because most values are repeated many times'''
+    if int_columns is None:
+        int_columns = report.int_columns
+    if float_columns is None:
+        float_columns = report.float_columns
+
+    f = pyfastaq.utils.open_file_read(filename)
+    text = f.read().replace('\r', '').rstrip('\n')
+    pyfastaq.utils.close(f)
+
+    if len(text) == 0:
+        return ReportTable({x: [] for x in report.columns}, 0)
+
+    first_line, _, text = text.partition('\n')
+    expected_first_line = '#' + '\t'.join(report.columns)
+    if first_line.rstrip() != expected_first_line:
+        raise Error('Error reading report file ' + filename + '. Expected first line of file is\n' + expected_first_line + '\nbut got:\n' + first_line.rstrip())
+
+    if len(text) == 0:
+        return ReportTable({x: [] for x in report.columns}, 0)
+
+    # Split the whole file at once, then take every nth value to get each column.
+    # This needs every line to have the right number of columns
+    lines = text.split('\n')
+    if set(map(str.count, lines, itertools.repeat('\t'))) != {len(report.columns) - 1}:
+        for line in lines:
+            if line.count('\t') != len(report.columns) - 1:
+                raise Error('Error reading report file ' + filename + '. Wrong number of columns. Expected ' + str(len(report.columns)) + ' but got ' + str(line.count('\t') + 1) + ' at this line:\n' + line)
+
+    values = text.replace('\n', '\t').split('\t')
+    number_of_columns = len(report.columns)
+
+    columns = {}
+    for i, name in enumerate(report.columns):
+        column_values = values[i::number_of_columns]
+        if name == 'flag':
+            try:
+                columns[name] = array.array('l', map(int, column_values))
+            except ValueError as e:
+                raise Error('Error getting flag in report file ' + filename + '. ' + str(e))
+        elif name in int_columns:
+            columns[name] = _convert_column(column_values, int, 'l')
+        elif name in float_columns:
+            columns[name] = _convert_column(column_values, float, 'd')
+        else:
+            columns[name] = list(map(sys.intern, column_values))
+
+    return ReportTable(columns, len(lines))
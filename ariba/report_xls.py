@@ -0,0 +1,50 @@
+import multiprocessing
+import openpyxl
+import pyfastaq
+from ariba import report
+
+class Error (Exception): pass
+
+
+def write_xls(rows, outfile):
+    '''Writes a spreadsheet of the report to outfile. rows = iterable of lists of
+       column values (not including the header). The workbook is made in write-only
+       mode, so each row is written to the file as it is appended instead of being
+       kept in memory. This means rows can be a generator'''
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title='ARIBA_report')
+    worksheet.append(report.columns)
+
+    for row in rows:
+        worksheet.append(row)
+
+    workbook.save(outfile)
+
+
+def _tsv_rows(tsv_file):
+    f = pyfastaq.utils.open_file_read(tsv_file)
+    for line in f:
+        if not line.startswith('#'):
+            yield line.rstrip('\n').split('\t')
+    pyfastaq.utils.close(f)
+
+
+def write_xls_from_tsv(tsv_file, outfile):
+    '''Writes a spreadsheet of the report tsv_file, reading it one line at a time'''
+    write_xls(_tsv_rows(tsv_file), outfile)
+
+
+def start_xls_from_tsv(tsv_file, outfile):
+    '''Starts writing a spreadsheet of the report tsv_file in a new process, so that it does not
+       hold up anything else. Returns the multiprocessing.Process. Use wait_for_xls() on it to
+       wait for it to finish'''
+    process = multiprocessing.Process(target=write_xls_from_tsv, args=(tsv_file, outfile))
+    process.start()
+    return process
+
+
+def wait_for_xls(process):
+    '''Waits for a process started by start_xls_from_tsv() to finish. Raises Error if it failed'''
+    process.join()
+    if process.exitcode != 0:
+        raise Error('Error writing spreadsheet of report. Exit code: ' + str(process.exitcode))
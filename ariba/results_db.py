@@ -0,0 +1,141 @@
+import os
+import sqlite3
+from ariba import report
+
+class Error (Exception): pass
+
+
+def _column_type(column):
+    if column in report.int_columns or column == 'flag':
+        return 'INTEGER'
+    elif column in report.float_columns:
+        return 'REAL'
+    else:
+        return 'TEXT'
+
+
+class ResultsDb:
+    def __init__(self, filename):
+        '''SQLite database of the results of one or more runs of ARIBA, one sample per run.
+           For each sample it has the report records (both all and filtered, ie report.all.tsv
+           and report.tsv), the flag and read counts of each cluster, and the time taken by
+           each stage of the run. The file is made if it does not exist'''
+        self.filename = os.path.abspath(filename)
+        self.connection = sqlite3.connect(self.filename)
+        self._create_tables()
+
+
+    def _create_tables(self):
+        report_columns = ',\n'.join([x + ' ' + _column_type(x) for x in report.columns])
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS samples (
+                sample_id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS report (
+                sample_id INTEGER NOT NULL,
+                filtered INTEGER NOT NULL,
+                line_number INTEGER NOT NULL,
+                ''' + report_columns + '''
+            );
+            CREATE INDEX IF NOT EXISTS report_sample ON report (sample_id, filtered, line_number);
+            CREATE TABLE IF NOT EXISTS clusters (
+                sample_id INTEGER NOT NULL,
+                cluster TEXT NOT NULL,
+                ref_name TEXT,
+                flag INTEGER NOT NULL,
+                reads INTEGER NOT NULL,
+                read_bases INTEGER,
+                PRIMARY KEY (sample_id, cluster)
+            );
+            CREATE TABLE IF NOT EXISTS timings (
+                sample_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                PRIMARY KEY (sample_id, stage)
+            );
+        ''')
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def sample_names(self):
+        '''Returns list of sample names, in the order they were added'''
+        return [x[0] for x in self.connection.execute('SELECT name FROM samples ORDER BY sample_id')]
+
+
+    def _sample_id(self, sample_name):
+        row = self.connection.execute('SELECT sample_id FROM samples WHERE name = ?', (sample_name,)).fetchone()
+        if row is None:
+            raise Error('Sample "' + sample_name + '" not found in results database ' + self.filename)
+        return row[0]
+
+
+    def add_sample(self, sample_name, all_records, filtered_records, cluster_stats=None, timings=None):
+        '''Adds all the results of one sample.
+           all_records, filtered_records = lists of report.ReportRecord objects.
+           cluster_stats = list of tuples (cluster name, ref name, flag.Flag, number of reads, number of read bases).
+           timings = list of tuples (stage name, seconds)'''
+        with self.connection:
+            try:
+                cursor = self.connection.execute('INSERT INTO samples (name) VALUES (?)', (sample_name,))
+            except sqlite3.IntegrityError:
+                raise Error('Sample "' + sample_name + '" already in results database ' + self.filename + '. Cannot continue')
+
+            sample_id = cursor.lastrowid
+            insert_report = 'INSERT INTO report VALUES (' + ','.join(['?'] * (len(report.columns) + 3)) + ')'
+            for filtered, records in [(0, all_records), (1, filtered_records)]:
+                self.connection.executemany(insert_report, [
+                    [sample_id, filtered, i] + [x.flag.to_number() if column == 'flag' else x[column] for column in report.columns]
+                    for i, x in enumerate(records)
+                ])
+
+            if cluster_stats is not None:
+                self.connection.executemany('INSERT INTO clusters VALUES (?,?,?,?,?,?)',
+                    [(sample_id, name, ref_name, cluster_flag.to_number(), reads, bases) for name, ref_name, cluster_flag, reads, bases in cluster_stats])
+
+            if timings is not None:
+                self.connection.executemany('INSERT INTO timings VALUES (?,?,?)', [(sample_id, stage, seconds) for stage, seconds in timings])
+
+
+    def report_records(self, sample_name, filtered=True):
+        '''Returns list of report.ReportRecord objects of the sample, in the same
+           order as the report file (report.tsv if filtered, otherwise report.all.tsv)'''
+        sample_id = self._sample_id(sample_name)
+        cursor = self.connection.execute('SELECT ' + ','.join(report.columns) + ' FROM report WHERE sample_id = ? AND filtered = ? ORDER BY line_number', (sample_id, int(filtered)))
+        return [report.ReportRecord(x) for x in cursor]
+
+
+    def cluster_stats(self, sample_name):
+        '''Returns dict of cluster name -> tuple (ref name, flag number, number of reads, number of read bases)'''
+        sample_id = self._sample_id(sample_name)
+        cursor = self.connection.execute('SELECT cluster, ref_name, flag, reads, read_bases FROM clusters WHERE sample_id = ?', (sample_id,))
+        return {x[0]: tuple(x[1:]) for x in cursor}
+
+
+    def timings(self, sample_name):
+        '''Returns dict of stage name -> seconds'''
+        sample_id = self._sample_id(sample_name)
+        return dict(self.connection.execute('SELECT stage, seconds FROM timings WHERE sample_id = ?', (sample_id,)))
+
+
+    def merge(self, filename):
+        '''Adds all the samples in the results database filename to this database.
+           Sample names must not already be in this database'''
+        self.connection.execute('ATTACH DATABASE ? AS other', (os.path.abspath(filename),))
+
+        try:
+            with self.connection:
+                for old_id, name in self.connection.execute('SELECT sample_id, name FROM other.samples ORDER BY sample_id').fetchall():
+                    try:
+                        new_id = self.connection.execute('INSERT INTO samples (name) VALUES (?)', (name,)).lastrowid
+                    except sqlite3.IntegrityError:
+                        raise Error('Sample "' + name + '" from ' + filename + ' already in results database ' + self.filename + '. Cannot continue')
+
+                    for table in ['report', 'clusters', 'timings']:
+                        columns = [x[1] for x in self.connection.execute('PRAGMA other.table_info(' + table + ')')][1:]
+                        self.connection.execute('INSERT INTO main.' + table + ' SELECT ?,' + ','.join(columns) + ' FROM other.' + table + ' WHERE sample_id = ?', (new_id, old_id))
+        finally:
+            self.connection.execute('DETACH DATABASE other')
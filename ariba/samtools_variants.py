@@ -1,11 +1,15 @@
 import os
 import sys
+import bisect
+import array
 import pysam
 import pyfastaq
-from ariba import common
+from ariba import common, interval_index
 
 class Error (Exception): pass
 
+mpileup_max_depth = 250 # default of samtools mpileup -d
+
 
 class SamtoolsVariants:
     def __init__(self,
@@ -19,7 +23,11 @@ class SamtoolsVariants:
       bcf_min_dv=5,
       bcf_min_dv_over_dp=0.3,
       bcf_min_qual=20,
+      regions=None,
     ):
+        '''regions = dictionary of sequence name -> list of pyfastaq.intervals.Interval
+           objects (zero-based, eg made by assembly_compare.assembly_match_coords()).
+           If given, the pileup, variant calls and read depths file only cover these regions'''
         self.ref_fa = os.path.abspath(ref_fa)
         self.bam = os.path.abspath(bam)
         self.outprefix = os.path.abspath(outprefix)
@@ -30,17 +38,37 @@ class SamtoolsVariants:
         self.bcf_min_dv = bcf_min_dv
         self.bcf_min_dv_over_dp = bcf_min_dv_over_dp
         self.bcf_min_qual = bcf_min_qual
+        self.regions = regions
 
         self.vcf_file = self.outprefix + '.vcf'
         self.read_depths_file = self.outprefix + '.read_depths.gz'
+        self.regions_bed = self.outprefix + '.regions.bed'
+        self.read_depths_index = None
+
+
+    @staticmethod
+    def _write_regions_bed(regions, outfile):
+        '''Writes regions (see __init__) to a BED file, sorted by sequence name and position'''
+        f = pyfastaq.utils.open_file_write(outfile)
+        for name in sorted(regions):
+            for interval in sorted(regions[name]):
+                print(name, interval.start, interval.end + 1, sep='\t', file=f)
+        pyfastaq.utils.close(f)
 
 
     def _make_vcf_and_read_depths_files(self):
         tmp_vcf = self.vcf_file + '.tmp'
+        if self.regions is None:
+            regions_option = ''
+        else:
+            self._write_regions_bed(self.regions, self.regions_bed)
+            regions_option = '-l ' + self.regions_bed
+
         cmd = ' '.join([
             self.samtools_exe, 'mpileup',
             '-t INFO/DPR,DV',
             '-A',
+            regions_option,
             '-f', self.ref_fa,
             '-u',
             '-v',
@@ -50,6 +78,8 @@ class SamtoolsVariants:
         ])
 
         common.syscall(cmd, verbose=True, verbose_filehandle=self.log_fh)
+        if self.regions is not None:
+            os.unlink(self.regions_bed)
 
         cmd = ' '.join([
             self.bcftools_exe, 'call -m',
@@ -93,20 +123,56 @@ class SamtoolsVariants:
         except:
             return None
 
+        rows = [x.rstrip().split()[2:] for x in rows]
+        return SamtoolsVariants._choose_read_depths_row([(x[0], x[1], int(x[2]), x[3]) for x in rows])
+
+
+    @staticmethod
+    def _choose_read_depths_row(rows):
+        '''rows = list of (ref base, alt base, depth, alt depths) tuples at one position.
+           Returns the one to use, or None if there are no rows'''
         if len(rows) > 1: # which happens with indels, mutiple lines for same base of reference
-            test_rows = [x for x in rows if x.rstrip().split()[3] != '.']
+            test_rows = [x for x in rows if x[1] != '.']
             if len(test_rows) != 1:
                 rows = [rows[-1]]
             else:
                 rows = test_rows
 
         if len(rows) == 1:
-            r, p, ref_base, alt_base, ref_counts, alt_counts = rows[0].rstrip().split()
-            return ref_base, alt_base, int(ref_counts), alt_counts
+            return rows[0]
         else:
             return None
 
 
+    @staticmethod
+    def _load_read_depths(read_depths_file):
+        '''Reads the whole read depths file into memory. Returns dictionary of
+           sequence name -> (array of zero-based positions, list of (ref base, alt base, depth, alt depths)).
+           The positions are sorted, and the nth row is at the nth position'''
+        index = {}
+        f = pyfastaq.utils.open_file_read(read_depths_file)
+        for line in f:
+            name, pos, ref_base, alt_base, depth, alt_counts = line.rstrip().split('\t')
+            if name not in index:
+                index[name] = (array.array('l'), [])
+            index[name][0].append(int(pos) - 1)
+            index[name][1].append((ref_base, alt_base, int(depth), alt_counts))
+
+        pyfastaq.utils.close(f)
+        return index
+
+
+    @staticmethod
+    def _get_read_depths_from_index(index, sequence_name, position):
+        '''Same as _get_read_depths, but using an index made by _load_read_depths'''
+        if sequence_name not in index:
+            return None
+        positions, rows = index[sequence_name]
+        start = bisect.bisect_left(positions, position)
+        end = bisect.bisect_right(positions, position, lo=start)
+        return SamtoolsVariants._choose_read_depths_row(rows[start:end])
+
+
     @classmethod
     def _get_variant_positions_from_vcf(cls, vcf_file):
         if not os.path.exists(vcf_file):
@@ -156,11 +222,40 @@ class SamtoolsVariants:
         return depths
 
 
+    def total_depth_per_contig_from_index(self):
+        '''Returns same as total_depth_per_contig(self.read_depths_file), using
+           the read depths loaded into memory instead of reading the file again'''
+        return {name: sum(x[2] for x in rows) for name, (positions, rows) in self._get_read_depths_index().items()}
+
+
+    def total_depth_per_contig_from_bam(self):
+        '''Returns the same as total_depth_per_contig_from_index(), for when the read depths file
+           was made using self.regions, so does not have every position of each contig. The depth
+           at each position outside the regions is counted from a pileup of self.bam made by pysam,
+           with the same read filters as samtools mpileup (-A, so orphan reads are used) and the same
+           maximum depth of 250 reads. The only difference from a run without regions is
+           that the depth of indel calls outside the regions is not added on'''
+        depths = self.total_depth_per_contig_from_index()
+        sam_reader = pysam.Samfile(self.bam, 'rb')
+
+        for name, length in zip(sam_reader.references, sam_reader.lengths):
+            start = 0
+            for interval in sorted(self.regions.get(name, [])) + [pyfastaq.intervals.Interval(length, length)]:
+                if start < interval.start:
+                    for column in sam_reader.pileup(name, start, interval.start, truncate=True, max_depth=mpileup_max_depth, ignore_orphans=False):
+                        depths[name] = depths.get(name, 0) + column.nsegments
+                start = max(start, interval.end + 1)
+
+        sam_reader.close()
+        return depths
+
+
     @staticmethod
     def variants_in_coords(nucmer_matches, vcf_file):
         '''nucmer_matches = made by assembly_compare.assembly_match_coords().
            Returns number of variants that lie in nucmer_matches'''
         vcf_variant_counts = {}
+        indexes = {scaff: interval_index.IntervalIndex([(x.start, x.end, None) for x in nucmer_matches[scaff]]) for scaff in nucmer_matches}
         f = pyfastaq.utils.open_file_read(vcf_file)
         for line in f:
             if line.startswith('#'):
@@ -169,23 +264,28 @@ class SamtoolsVariants:
             data = line.rstrip().split('\t')
             scaff = data[0]
 
-            if scaff in nucmer_matches:
-                position = int(data[1]) - 1
-                i = pyfastaq.intervals.Interval(position, position)
-                intersects = len([x for x in nucmer_matches[scaff] if x.intersects(i)]) > 0
-                if intersects:
-                    vcf_variant_counts[scaff] = vcf_variant_counts.get(scaff, 0) + 1
+            if scaff in indexes and indexes[scaff].contains(int(data[1]) - 1):
+                vcf_variant_counts[scaff] = vcf_variant_counts.get(scaff, 0) + 1
 
         pyfastaq.utils.close(f)
         return sum(list(vcf_variant_counts.values()))
 
 
+    def _get_read_depths_index(self):
+        '''Returns the read depths index (see _load_read_depths), loading it from
+           self.read_depths_file the first time this is called'''
+        if self.read_depths_index is None:
+            self.read_depths_index = self._load_read_depths(self.read_depths_file)
+        return self.read_depths_index
+
+
     def get_depths_at_position(self, seq_name, position):
-        d = self._get_variants(self.vcf_file, self.read_depths_file, [(seq_name, position)])
-        if seq_name in d and position in d[seq_name]:
-            return d[seq_name][position]
-        else:
-            return 'ND', 'ND', 'ND', 'ND'
+        if self.read_depths_index is not None or (os.path.exists(self.vcf_file) and os.path.exists(self.read_depths_file)):
+            depths = self._get_read_depths_from_index(self._get_read_depths_index(), seq_name, position)
+            if depths is not None:
+                return depths
+
+        return 'ND', 'ND', 'ND', 'ND'
 
 
     def run(self):
@@ -4,7 +4,7 @@ import re
 import sys
 import openpyxl
 import pyfastaq
-from ariba import flag, common, report, summary_cluster, summary_sample
+from ariba import flag, common, report, results_db, summary_cluster, summary_sample
 
 class Error (Exception): pass
 
@@ -22,9 +22,10 @@ class Summary:
       cluster_cols='assembled,has_res,ref_seq,pct_id,known_var,novel_var',
       variant_cols='groups,grouped,ungrouped,novel',
       verbose=False,
+      results_dbs=None,
     ):
-        if filenames is None and fofn is None:
-            raise Error('Error! Must supply filenames or fofn to Summary(). Cannot continue')
+        if filenames is None and fofn is None and results_dbs is None:
+            raise Error('Error! Must supply filenames or fofn or results_dbs to Summary(). Cannot continue')
 
         if filenames is None:
             self.filenames = []
@@ -34,6 +35,11 @@ class Summary:
         if fofn is not None:
             self.filenames.extend(self._load_fofn(fofn))
 
+        self.results_db_samples = {} # sample name -> results database file it is in
+        if results_dbs is not None:
+            self.results_db_samples = self._load_results_db_samples(results_dbs, self.filenames)
+            self.filenames.extend(sorted(self.results_db_samples))
+
         self.cluster_columns = self._determine_cluster_cols(cluster_cols)
         self.var_columns = self._determine_var_cols(variant_cols)
         self.filter_rows = filter_rows
@@ -72,17 +78,40 @@ class Summary:
         return filenames
 
 
+    @staticmethod
+    def _load_results_db_samples(results_dbs, filenames):
+        '''Returns dict of sample name -> results database file, for all the samples
+           in the results database files results_dbs'''
+        samples = {}
+        for db_file in results_dbs:
+            if not os.path.exists(db_file):
+                raise Error('File not found: "' + db_file + '". Cannot continue')
+            db = results_db.ResultsDb(db_file)
+            names = db.sample_names()
+            db.close()
+
+            for name in names:
+                if name in samples or name in filenames:
+                    raise Error('Sample "' + name + '" found more than once in the input. Cannot continue')
+                samples[name] = db_file
+
+        return samples
+
+
     def _check_files_exist(self):
         for fname in self.filenames:
-            if not os.path.exists(fname):
+            if fname not in self.results_db_samples and not os.path.exists(fname):
                 raise Error('File not found: "' + fname + '". Cannot continue')
 
 
     @classmethod
-    def _load_input_files(cls, filenames, min_id, verbose=False):
+    def _load_input_files(cls, filenames, min_id, verbose=False, results_db_samples=None):
         samples = {}
+        if results_db_samples is None:
+            results_db_samples = {}
+
         for filename in filenames:
-            samples[filename] = summary_sample.SummarySample(filename, min_pc_id=min_id)
+            samples[filename] = summary_sample.SummarySample(filename, min_pc_id=min_id, results_db_file=results_db_samples.get(filename, None))
             samples[filename].run()
             if verbose:
                 print('Loaded file', filename, flush=True)
@@ -350,7 +379,7 @@ class Summary:
         if self.verbose:
             print('Loading input files...', flush=True)
         self._check_files_exist()
-        self.samples = self._load_input_files(self.filenames, self.min_id, verbose=self.verbose)
+        self.samples = self._load_input_files(self.filenames, self.min_id, verbose=self.verbose, results_db_samples=self.results_db_samples)
         if self.verbose:
             print('Generating output rows', flush=True)
         self.rows = self._gather_output_rows()
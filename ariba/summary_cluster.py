@@ -52,15 +52,29 @@ class SummaryCluster:
             except:
                 assert d[key] == '.'
 
+        cls.add_var_group(d)
+        return d
+
+
+    @classmethod
+    def record2dict(cls, record):
+        '''Same as line2dict, but using a report.ReportRecord instead of a line of a report file'''
+        d = {x: record[x] for x in report.columns}
+
+        cls.add_var_group(d)
+        return d
+
+
+    @staticmethod
+    def add_var_group(d):
+        '''Adds the variant group (from var_description) to a dict made from a line of a report'''
         if d['var_description'] == '.':
             d['var_group'] = '.'
         else:
             try:
                 d['var_group'] = d['var_description'].split(':')[3]
             except:
-                raise Error('Error getting variant group from the following line:\n' + line)
-
-        return d
+                raise Error('Error getting variant group from the following line:\n' + '\t'.join([str(d[x]) for x in report.columns]))
 
 
     def add_data_dict(self, data_dict):
@@ -1,12 +1,15 @@
-import pyfastaq
-from ariba import report, summary_cluster
+from ariba import report_reader, results_db, summary_cluster
 
 class Error (Exception): pass
 
 class SummarySample:
-    def __init__(self, report_tsv, min_pc_id=90):
+    def __init__(self, report_tsv, min_pc_id=90, results_db_file=None):
+        '''report_tsv = report file made by ariba run. If results_db_file is given, then the
+           filtered report records are loaded from that results database instead, and
+           report_tsv is the name of the sample in the database'''
         self.report_tsv = report_tsv
         self.min_pc_id = min_pc_id
+        self.results_db_file = results_db_file
         self.clusters = {}
 
 
@@ -16,23 +19,43 @@ class SummarySample:
 
     @staticmethod
     def _load_file(filename, min_pc_id):
-        f = pyfastaq.utils.open_file_read(filename)
-        clusters = {}
+        try:
+            table = report_reader.load_report(filename, int_columns=summary_cluster.int_columns, float_columns=summary_cluster.float_columns)
+        except report_reader.Error as e:
+            raise Error(str(e))
+
+        # Lines with pc_ident below min_pc_id are ignored by SummaryCluster.add_data_dict,
+        # so only make dicts of the other lines. Every cluster is still added, as before
+        clusters = {x: summary_cluster.SummaryCluster(min_pc_id=min_pc_id) for x in table.columns['cluster']}
+        pc_ident = table.columns['pc_ident']
+        keep_rows = [i for i in range(len(table)) if pc_ident[i] != '.' and pc_ident[i] >= min_pc_id]
+
+        for data_dict in table.dicts(indexes=keep_rows):
+            summary_cluster.SummaryCluster.add_var_group(data_dict)
+            SummarySample._add_data_dict(clusters, data_dict, min_pc_id)
+
+        return clusters
+
 
-        for line in f:
-            if line.startswith('#'):
-                if line.rstrip()[1:].split('\t') != report.columns:
-                    pyfastaq.utils.close(f)
-                    raise Error('Error parsing the following line.\n' + line)
-                continue
+    @staticmethod
+    def _add_data_dict(clusters, data_dict, min_pc_id):
+        cluster = data_dict['cluster']
+        if cluster not in clusters:
+            clusters[cluster] = summary_cluster.SummaryCluster(min_pc_id=min_pc_id)
+        clusters[cluster].add_data_dict(data_dict)
+
+
+    @staticmethod
+    def _load_results_db(db_file, sample_name, min_pc_id):
+        '''Same as _load_file, but gets the filtered report records of the sample from a results database'''
+        db = results_db.ResultsDb(db_file)
+        records = db.report_records(sample_name, filtered=True)
+        db.close()
+        clusters = {}
 
-            data_dict = summary_cluster.SummaryCluster.line2dict(line)
-            cluster = data_dict['cluster']
-            if cluster not in clusters:
-                clusters[cluster] = summary_cluster.SummaryCluster(min_pc_id=min_pc_id)
-            clusters[cluster].add_data_dict(data_dict)
+        for record in records:
+            SummarySample._add_data_dict(clusters, summary_cluster.SummaryCluster.record2dict(record), min_pc_id)
 
-        pyfastaq.utils.close(f)
         return clusters
 
 
@@ -54,7 +77,10 @@ class SummarySample:
 
 
     def run(self):
-        self.clusters = self._load_file(self.report_tsv, self.min_pc_id)
+        if self.results_db_file is None:
+            self.clusters = self._load_file(self.report_tsv, self.min_pc_id)
+        else:
+            self.clusters = self._load_results_db(self.results_db_file, self.report_tsv, self.min_pc_id)
         self.column_summary_data = self._column_summary_data()
         self.variant_column_names_tuples = self._variant_column_names_tuples()
         self.var_groups = self._var_groups()
@@ -0,0 +1,22 @@
+import argparse
+import os
+import sys
+import ariba
+
+def run():
+    parser = argparse.ArgumentParser(
+        description = 'Merges results databases made by "ariba run --results_db" into one database. Sample names must be unique across all the databases',
+        usage = 'ariba mergedbs <outfile> <infile1> [<infile2> ...]')
+    parser.add_argument('outfile', help='Name of output database. If it already exists, the samples from the input databases are added to it')
+    parser.add_argument('infiles', nargs='+', help='Results databases to be merged', metavar='infile')
+    options = parser.parse_args()
+
+    for filename in options.infiles:
+        if not os.path.exists(filename):
+            print('Error! Results database not found:', filename, file=sys.stderr)
+            sys.exit(1)
+
+    db = ariba.results_db.ResultsDb(options.outfile)
+    for filename in options.infiles:
+        db.merge(filename)
+    db.close()
@@ -1,21 +1,31 @@
 import argparse
+import os
 import sys
 import ariba
 
 def run():
     parser = argparse.ArgumentParser(
         description = 'Filters an ARIBA report tsv file',
-        usage = 'ariba reportfilter [options] <infile> <outprefix>'
+        usage = 'ariba reportfilter [options] <infile> <outprefix>\n       ariba reportfilter [options] --fofn <fofn> <outdir>\n       ariba reportfilter [options] --results_db --sample <name> --sample <name> <infile> <outdir>'
     )
-    parser.add_argument('--exclude_flags', help='Comma-separated list of flags to exclude. [%(default)s]', default='assembly_fail,ref_seq_choose_fail')
+    parser.add_argument('--exclude_flags', help='Comma-separated list of flags to exclude. Lines whose flag has any of these set are removed. Applies to every input file or sample [%(default)s]', default='assembly_fail,ref_seq_choose_fail')
     parser.add_argument('--min_pc_id', type=float, help='Minimum percent identity of nucmer match between contig and reference [%(default)s]', default=90.0, metavar='FLOAT')
     parser.add_argument('--min_ref_base_asm', type=int, help='Minimum number of reference bases matching assembly [%(default)s]', default=1, metavar='INT')
     parser.add_argument('--keep_syn', action='store_true', help='Keep synonymous variants (by default they are removed')
     parser.add_argument('--discard_without_known_var', action='store_true', help='Applies to variant only genes. Filter out where there is a known variant, but the assembly has the wild type. By default these rows are kept.')
-    parser.add_argument('infile', help='Name of input tsv file')
+    parser.add_argument('--streaming', action='store_true', help='Read the input file one reference/contig at a time, instead of loading it all into memory. The lines of each reference/contig must be next to each other in the input file, as in report.all.tsv made by ariba run. This is not checked. Output is in the same order as the input, instead of sorted by reference and contig name. Cannot be used with --results_db')
+    parser.add_argument('--results_db', action='store_true', help='The input file (or the files in --fofn) are results databases made by "ariba run --results_db", instead of tsv files. The unfiltered report records of the samples (see --sample) are used')
+    parser.add_argument('--sample', action='append', help='Name of sample in the results database(s). With one database, only needed when it has more than one sample. Can be used more than once, in which case the second argument is the name of the output directory, as for --fofn. With --fofn, only these samples are filtered (by default all samples in all the databases are filtered)', metavar='NAME')
+    parser.add_argument('--fofn', help='File of filenames of report tsv files (or results databases, with --results_db) to be filtered, one per line. Use this instead of <infile>. The second argument is then the name of the output directory, which must not already exist', metavar='FILENAME')
+    parser.add_argument('--threads', type=int, help='Number of files (or samples) to filter in parallel. Only used with --fofn, or --sample more than once [%(default)s]', default=1, metavar='INT')
+    parser.add_argument('infile', help='Name of input tsv file', nargs='?')
     parser.add_argument('outprefix', help='Prefix of output files. outprefix.tsv and outprefix.xls will be made')
     options = parser.parse_args()
 
+    if (options.fofn is None) == (options.infile is None):
+        print('Error! Must use exactly one of <infile> or --fofn', file=sys.stderr)
+        sys.exit(1)
+
     flags_to_exclude = options.exclude_flags.split(',')
     allowed_flags = set(ariba.flag.flags_in_order)
     bad_flags = [x for x in flags_to_exclude if x not in allowed_flags]
@@ -24,12 +34,68 @@ def run():
         print('Must choose from:', ','.join(ariba.flag.flags_in_order), file=sys.stderr)
         sys.exit(1)
 
+    if options.streaming and options.results_db:
+        print('Error! Cannot use --streaming with --results_db', file=sys.stderr)
+        sys.exit(1)
+
+    filter_options = {
+        'min_pc_ident': options.min_pc_id,
+        'min_ref_base_assembled': options.min_ref_base_asm,
+        'ignore_not_has_known_variant': options.discard_without_known_var,
+        'remove_synonymous_snps': not options.keep_syn,
+        'exclude_flags': flags_to_exclude,
+    }
+
+    if options.sample is not None and not options.results_db:
+        print('Error! --sample can only be used with --results_db', file=sys.stderr)
+        sys.exit(1)
+
+    if options.fofn is not None or (options.sample is not None and len(options.sample) > 1):
+        if options.fofn is None:
+            infiles = [options.infile]
+        else:
+            infiles = ariba.batch_report_filter.BatchReportFilter.load_fofn(options.fofn)
+
+        batch_filter = ariba.batch_report_filter.BatchReportFilter(
+            infiles,
+            options.outprefix,
+            threads=options.threads,
+            streaming=options.streaming,
+            results_dbs=options.results_db,
+            samples=options.sample,
+            verbose=True,
+            **filter_options
+        )
+        batch_filter.run()
+        return
+
+    if options.results_db:
+        if not os.path.exists(options.infile):
+            print('Error! Results database not found:', options.infile, file=sys.stderr)
+            sys.exit(1)
+        db = ariba.results_db.ResultsDb(options.infile)
+        if options.sample is None:
+            samples = db.sample_names()
+            if len(samples) != 1:
+                print('Error! Found', len(samples), 'samples in results database. Please use --sample', file=sys.stderr)
+                sys.exit(1)
+        else:
+            samples = options.sample
+        records = db.report_records(samples[0], filtered=False)
+        db.close()
+        infile = None
+    else:
+        records = None
+        infile = None if options.streaming else options.infile
+
     rf = ariba.report_filter.ReportFilter(
-        infile=options.infile,
-        min_pc_ident=options.min_pc_id,
-        min_ref_base_assembled=options.min_ref_base_asm,
-        ignore_not_has_known_variant=options.discard_without_known_var,
-        remove_synonymous_snps=not options.keep_syn,
+        infile=infile,
+        records=records,
+        **filter_options
     )
-    rf.run(options.outprefix)
+
+    if options.streaming:
+        rf.run_streaming(options.infile, options.outprefix)
+    else:
+        rf.run(options.outprefix)
 
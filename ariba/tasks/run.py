@@ -17,16 +17,34 @@ def run():
     nucmer_group.add_argument('--nucmer_min_id', type=int, help='Minimum alignment identity (delta-filter -i) [%(default)s]', default=90, metavar='INT')
     nucmer_group.add_argument('--nucmer_min_len', type=int, help='Minimum alignment length (delta-filter -i) [%(default)s]', default=20, metavar='INT')
     nucmer_group.add_argument('--nucmer_breaklen', type=int, help='Value to use for -breaklen when running nucmer [%(default)s]', default=200, metavar='INT')
+    nucmer_group.add_argument('--aligner', choices=['nucmer', 'internal'], help='Program used to align assembled contigs to the reference. "internal" uses a built-in aligner instead of running nucmer, which saves starting the MUMmer programs for every cluster. It uses the nucmer options above, and writes the same output files [%(default)s]', default='nucmer')
+    nucmer_group.add_argument('--reuse_orientation_nucmer', action='store_true', help='Align each assembly to its reference only once, instead of twice. The alignment made to choose the orientation of the contigs is reused to compare the assembly with the reference, with the coordinates of reversed contigs flipped. This is not always the same as aligning the reversed contigs again: an indel in a homopolymer can be placed at a different position, which can change the report')
+    nucmer_group.add_argument('--batch_nucmer', action='store_true', help='Align the assemblies of all clusters to their references with one run of nucmer (or the internal aligner, see --aligner), instead of one run per cluster. This saves the start-up time of the MUMmer programs on samples with many clusters. The alignment is always reused as described for --reuse_orientation_nucmer')
 
     assembly_group = parser.add_argument_group('Assembly options')
     assembly_group.add_argument('--assembly_cov', type=int, help='Target read coverage when sampling reads for assembly [%(default)s]', default=50, metavar='INT')
     assembly_group.add_argument('--assembler_k', type=int, help='kmer size to use with assembler. You can use 0 to set kmer to 2/3 of the read length. Warning - lower kmers are usually better. [%(default)s]', metavar='INT', default=21)
     assembly_group.add_argument('--spades_other', help='Put options string to be used with spades in quotes. This will NOT be sanity checked. Do not use -k (see --assembler_k), --untrusted-contigs (it is always used), or -t [%(default)s]', default="--only-assembler -m 4", metavar="OPTIONS")
+    assembly_group.add_argument('--remove_duplicates', action='store_true', help='Remove duplicate read pairs (both mates have identical sequences) before choosing the reference sequence and sampling reads for assembly. All reads are still used for mapping and variant calling')
+    assembly_group.add_argument('--normalise_reads', action='store_true', help='Instead of randomly sampling reads for assembly, use digital normalisation: keep a read pair only if the median count of its kmers in the pairs already kept is less than --assembly_cov')
+    assembly_group.add_argument('--consensus_min_id', type=float, help='After choosing the reference sequence, map reads to it. If the reads have at least this percent identity to the reference and cover all of it with depth at least --consensus_min_depth, then use their consensus sequence instead of assembling. These clusters get the assembled_by_consensus flag [not used]', metavar='FLOAT')
+    assembly_group.add_argument('--consensus_min_depth', type=int, help='Minimum read depth at every position of the reference to use the consensus instead of assembling. Only used with --consensus_min_id [%(default)s]', default=10, metavar='INT')
+    assembly_group.add_argument('--local_assembler_max_reads', type=int, help='Use the built-in kmer extension assembler instead of SPAdes when at most this many reads are used for assembly. This avoids the start-up time of SPAdes on small clusters [not used]', metavar='INT')
+    assembly_group.add_argument('--assembly_batch_size', type=int, help='Assemble reads from up to this many small clusters together in one run of SPAdes, to save the start-up time of SPAdes. Contigs are assigned back to clusters by aligning them to the reference of each cluster. Use 1 to assemble each cluster separately [%(default)s]', default=1, metavar='INT')
+    assembly_group.add_argument('--assembly_batch_max_reads', type=int, help='Only clusters with at most this many reads for assembly are assembled in batches. Only used when --assembly_batch_size > 1 [%(default)s]', default=2000, metavar='INT')
     assembly_group.add_argument('--min_scaff_depth', type=int, help='Minimum number of read pairs needed as evidence for scaffold link between two contigs. This is also the value used for sspace -k when scaffolding [%(default)s]', default=10, metavar='INT')
 
     other_group = parser.add_argument_group('Other options')
     other_group.add_argument('--threads', type=int, help='Number of threads [%(default)s]', default=1, metavar='INT')
+    other_group.add_argument('--max_memory', type=float, help='Maximum total memory in GB to be used by clusters running in parallel. A cluster is only started when its estimated memory fits. Estimates are made from the number of reads and reference length, and updated using the memory used by finished clusters. Also applies to the assemblies run by the batch options (eg --assembly_batch_size, --batch_nucmer). Only used when --threads > 1 [no limit]', metavar='FLOAT')
     bowtie2_presets = ['very-fast-local', 'fast-local', 'sensitive-local', 'very-sensitive-local']
+    other_group.add_argument('--triage', action='store_true', help='Before assembling a cluster, check its number of reads and how much of the reference they cover. Do not assemble clusters that cannot pass --assembled_threshold, and report them as assembly_fail')
+    other_group.add_argument('--batch_mapping', action='store_true', help='Map the reads of all clusters to their assemblies with one bowtie2 index and one run of bowtie2 (using --threads), instead of one per cluster. This includes the mapping used to check the scaffold graph. The reads of a cluster are mapped again on their own if any of them also hit the assembly of another cluster, so the results are the same as without this option')
+    other_group.add_argument('--batch_variant_calling', action='store_true', help='Call variants in the assemblies of all clusters with one run of samtools mpileup and bcftools (on the merged BAM files), instead of one run per cluster')
+    other_group.add_argument('--restrict_pileup', action='store_true', help='Only run samtools mpileup and bcftools on the parts of the assembly that match the reference, instead of every position. Outside those parts, the read depths used for the mean read depth of each contig (ctg_cov column) are counted from the BAM file with the same read filters as mpileup. The only difference from a run without this option is that indel calls outside those parts are not counted in ctg_cov')
+    other_group.add_argument('--pileup_engine', choices=['samtools', 'pysam'], help='How to make the pileup used to call variants and get read depths in the assemblies. "pysam" makes it in-process instead of running samtools mpileup and bcftools. Its calls are simpler than those of bcftools, so the VCF and smtls_* columns can differ: the depth (DP) only counts bases with quality >= 13, QUAL is the sum of the base qualities of the reads supporting the variant (capped at 999), and indels are taken from the reads with an indel after each position, without realignment. --batch_variant_calling is ignored when using pysam [%(default)s]', default='samtools')
+    other_group.add_argument('--xls', action='store_true', help='Also write spreadsheets report.all.xls and report.xls of the reports. They are made from the tsv files in the background, while the rest of the output files are written')
+    other_group.add_argument('--results_db', action='store_true', help='Also write the report records, cluster flags and read counts, and the time taken by each stage to an SQLite database outdir/results.db, with outdir as the sample name. These can be used by "ariba summary --results_db" and "ariba reportfilter --results_db"')
     other_group.add_argument('--bowtie2_preset', choices=bowtie2_presets, help='Preset option for bowtie2 mapping [%(default)s]', default='very-sensitive-local', metavar='|'.join(bowtie2_presets))
     other_group.add_argument('--assembled_threshold', type=float, help='If proportion of gene assembled (regardless of into how many contigs) is at least this value then the flag gene_assembled is set [%(default)s]', default=0.95, metavar='FLOAT (between 0 and 1)')
     other_group.add_argument('--gene_nt_extend', type=int, help='Max number of nucleotides to extend ends of gene matches to look for start/stop codons [%(default)s]', default=30, metavar='INT')
@@ -70,11 +88,29 @@ def run():
           assembly_coverage=options.assembly_cov,
           assembler='spades',
           threads=options.threads,
+          max_memory=options.max_memory,
+          triage=options.triage,
+          remove_duplicates=options.remove_duplicates,
+          normalise_reads=options.normalise_reads,
+          consensus_min_id=options.consensus_min_id,
+          consensus_min_depth=options.consensus_min_depth,
+          local_assembler_max_reads=options.local_assembler_max_reads,
+          assembly_batch_size=options.assembly_batch_size,
+          assembly_batch_max_reads=options.assembly_batch_max_reads,
           verbose=options.verbose,
           min_scaff_depth=options.min_scaff_depth,
           nucmer_min_id=options.nucmer_min_id,
           nucmer_min_len=options.nucmer_min_len,
           nucmer_breaklen=options.nucmer_breaklen,
+          aligner=options.aligner,
+          reuse_orientation_nucmer=options.reuse_orientation_nucmer,
+          batch_nucmer=options.batch_nucmer,
+          batch_variant_calling=options.batch_variant_calling,
+          batch_mapping=options.batch_mapping,
+          restrict_pileup=options.restrict_pileup,
+          pileup_engine=options.pileup_engine,
+          results_db_sample=options.outdir if options.results_db else None,
+          write_xls=options.xls,
           spades_other=options.spades_other,
           assembled_threshold=options.assembled_threshold,
           unique_threshold=options.unique_threshold,
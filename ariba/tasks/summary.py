@@ -86,8 +86,9 @@ def run():
     parser = argparse.ArgumentParser(
         description = 'Make a summary of ARIBA report files, and Phandango files',
         usage = 'ariba summary [options] <outprefix> [report1.tsv report2.tsv ...]',
-        epilog = 'Files must be listed after the output file and/or the option --fofn must be used. If both used, all files in the filename specified by --fofn AND the files listed after the output file will be used as input.')
+        epilog = 'Files must be listed after the output file and/or the options --fofn or --results_db must be used. If more than one of these is used, all files in the filename specified by --fofn, the files listed after the output file, and the samples in the results databases will be used as input.')
     parser.add_argument('-f', '--fofn', help='File of filenames of ariba reports in tsv format (not xls) to be summarised. Must be used if no input files listed after the outfile.', metavar='FILENAME')
+    parser.add_argument('--results_db', action='append', help='Results database made by "ariba run --results_db" (or several of them merged with "ariba mergedbs"). All the samples in the database are summarised. Can be used more than once', metavar='FILENAME')
     parser.add_argument('--preset', choices=presets, help='Shorthand for setting --cluster_cols,--col_filter,--row_filter,--known_vars,--novel_vars. Using this overrides those options', metavar='|'.join(presets))
     parser.add_argument('--cluster_cols', help='Comma separated list of cluster columns to include. Choose from: assembled, has_res, ref_seq, pct_id, known_var, novel_var [%(default)s]', default='has_res', metavar='col1,col2,...')
     parser.add_argument('--col_filter', choices=['y', 'n'], default='y', help='Choose whether columns where all values are "no" or "NA" are removed [%(default)s]', metavar='y|n')
@@ -112,6 +113,7 @@ def run():
         min_id=options.min_id,
         cluster_cols=options.cluster_cols,
         variant_cols=options.var_cols,
-        verbose=options.verbose
+        verbose=options.verbose,
+        results_dbs=options.results_db,
     )
     s.run()
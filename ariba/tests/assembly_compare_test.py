@@ -28,6 +28,21 @@ class TestAssemblyCompare(unittest.TestCase):
         self.assertEqual(expected, got)
 
 
+    def test_parse_nucmer_snps_file(self):
+        '''test _parse_nucmer_snps_file'''
+        snps_file = os.path.join(data_dir, 'assembly_variants_test_get_mummer_variants.snp.snps')
+        got = assembly_compare.AssemblyCompare._parse_nucmer_snps_file(snps_file)
+        v1 = pymummer.variant.Variant(pymummer.snp.Snp('42\tA\tG\t42\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        v2 = pymummer.variant.Variant(pymummer.snp.Snp('42\tA\tG\t42\t42\t42\t500\t500\t1\t1\tgene\tcontig2'))
+        v3 = pymummer.variant.Variant(pymummer.snp.Snp('40\tT\tC\t40\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        v4 = pymummer.variant.Variant(pymummer.snp.Snp('2\tC\tG\t2\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        expected = {
+            'contig1': [v1, v3, v4],
+            'contig2': [v2],
+        }
+        self.assertEqual(expected, got)
+
+
     def test_nucmer_hits_to_percent_identity(self):
         '''test _nucmer_hits_to_percent_identity'''
         hits = [
@@ -376,6 +391,9 @@ class TestAssemblyCompare(unittest.TestCase):
             ('ref', 500, None),
         ]
 
+        index = assembly_compare.AssemblyCompare._make_ref_coords_index(nucmer_hits)
         for ref_name, ref_pos, expected in tests:
             got = assembly_compare.AssemblyCompare.nucmer_hit_containing_reference_position(nucmer_hits, ref_name, ref_pos)
             self.assertEqual(expected, got)
+            got = assembly_compare.AssemblyCompare._hit_containing_position_from_index(index, ref_name, ref_pos)
+            self.assertEqual(expected, got)
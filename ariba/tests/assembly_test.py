@@ -4,7 +4,7 @@ import os
 import shutil
 import filecmp
 import pyfastaq
-from ariba import assembly
+from ariba import assembly, pairwise_aligner
 
 modules_dir = os.path.dirname(os.path.abspath(assembly.__file__))
 data_dir = os.path.join(modules_dir, 'tests', 'data')
@@ -109,6 +109,17 @@ class TestAssembly(unittest.TestCase):
         shutil.rmtree(tmp_dir)
 
 
+    def test_write_nucmer_file_with_reversed_contigs(self):
+        '''test _write_nucmer_file_with_reversed_contigs'''
+        prefix = os.path.join(data_dir, 'assembly_test_write_nucmer_file_with_reversed_contigs')
+        tmp_out = 'tmp.assembly_test_write_nucmer_file_with_reversed_contigs.coords'
+        assembly.Assembly._write_nucmer_file_with_reversed_contigs(prefix + '.in.coords', tmp_out, {'contig2'})
+        self.assertTrue(filecmp.cmp(prefix + '.out.coords', tmp_out, shallow=False))
+        assembly.Assembly._write_nucmer_file_with_reversed_contigs(prefix + '.in.coords.snps', tmp_out, {'contig2'}, snps=True)
+        self.assertTrue(filecmp.cmp(prefix + '.out.coords.snps', tmp_out, shallow=False))
+        os.unlink(tmp_out)
+
+
     def test_fix_contig_orientation(self):
         '''test _fix_contig_orientation'''
         scaffs_in = os.path.join(data_dir, 'assembly_test_fix_contig_orientation.in.fa')
@@ -122,6 +133,27 @@ class TestAssembly(unittest.TestCase):
         os.unlink(tmp_out)
 
 
+    def test_fix_contig_orientation_internal_aligner(self):
+        '''test _fix_contig_orientation using the internal aligner gives same result as nucmer'''
+        scaffs_in = os.path.join(data_dir, 'assembly_test_fix_contig_orientation.in.fa')
+        expected_out = os.path.join(data_dir, 'assembly_test_fix_contig_orientation.out.fa')
+        ref_fa = os.path.join(data_dir, 'assembly_test_fix_contig_orientation.ref.fa')
+        tmp_out = 'tmp.assembly_test_fix_contig_orientation_internal_aligner.out.fa'
+        got = assembly.Assembly._fix_contig_orientation(scaffs_in, ref_fa, tmp_out, aligner='internal')
+        self.assertTrue(filecmp.cmp(expected_out, tmp_out, shallow=False))
+        self.assertEqual({'match_both_strands'}, got)
+        os.unlink(tmp_out)
+
+        tmp_coords = 'tmp.assembly_test_fix_contig_orientation_internal_aligner.coords'
+        pairwise_aligner.Runner(ref_fa, scaffs_in, tmp_coords, min_id=90, min_length=20, breaklen=200, show_snps=True).run()
+        got = assembly.Assembly._fix_contig_orientation(scaffs_in, ref_fa, tmp_out, coords_in=tmp_coords, coords_out=tmp_coords + '.out')
+        self.assertTrue(filecmp.cmp(expected_out, tmp_out, shallow=False))
+        self.assertEqual({'match_both_strands'}, got)
+        self.assertTrue(os.path.exists(tmp_coords))
+        for filename in [tmp_out, tmp_coords, tmp_coords + '.snps', tmp_coords + '.out', tmp_coords + '.out.snps']:
+            os.unlink(filename)
+
+
     def test_parse_bam(self):
         '''test _parse_bam'''
         bam = os.path.join(data_dir, 'assembly_test_parse_assembly_bam.bam')
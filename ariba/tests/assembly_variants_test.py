@@ -2,7 +2,7 @@ import unittest
 import os
 import pymummer
 import pyfastaq
-from ariba import assembly_variants, reference_data, sequence_variant, sequence_metadata
+from ariba import assembly_compare, assembly_variants, reference_data, sequence_variant, sequence_metadata
 
 modules_dir = os.path.dirname(os.path.abspath(assembly_variants.__file__))
 data_dir = os.path.join(modules_dir, 'tests', 'data')
@@ -49,6 +49,52 @@ class TestAssemblyVariants(unittest.TestCase):
         self.assertEqual(expected, got)
 
 
+    def test_group_mummer_variants(self):
+        '''test _group_mummer_variants'''
+        v1 = pymummer.variant.Variant(pymummer.snp.Snp('42\tA\tG\t42\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        v2 = pymummer.variant.Variant(pymummer.snp.Snp('42\tA\tG\t42\t42\t42\t500\t500\t1\t1\tgene\tcontig2'))
+        v3 = pymummer.variant.Variant(pymummer.snp.Snp('40\tT\tC\t40\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        v4 = pymummer.variant.Variant(pymummer.snp.Snp('2\tC\tG\t2\t42\t42\t500\t500\t1\t1\tgene\tcontig1'))
+        variants = [v1, v2, v3, v4]
+        expected = {
+            'contig1': [[v4], [v3, v1]],
+            'contig2': [[v2]]
+        }
+        self.assertEqual(expected, assembly_variants.AssemblyVariants._group_mummer_variants(variants))
+        self.assertEqual([v1, v2, v3, v4], variants)
+        self.assertEqual({}, assembly_variants.AssemblyVariants._group_mummer_variants([]))
+
+
+    def test_translate(self):
+        '''test _translate'''
+        codon_table = assembly_variants.AssemblyVariants._codon_table()
+        self.assertEqual('M', codon_table['ATG'])
+        self.assertEqual('M', codon_table['atg'])
+        tests = ['', 'A', 'AT', 'ATG', 'ATGA', 'ATGAT', 'ATGTAA', 'atgTaAnnn', 'ATGTAACG']
+        for seq in tests:
+            expected = pyfastaq.sequences.Fasta('x', seq).translate().seq
+            self.assertEqual(expected, assembly_variants.AssemblyVariants._translate(seq, codon_table))
+            self.assertEqual(expected, assembly_variants.AssemblyVariants._translate(seq.encode(), codon_table))
+
+
+    def test_get_variant_effects(self):
+        '''test _get_variant_effects'''
+        ref_seq = pyfastaq.sequences.Fasta('gene', 'GATCGCGAAGCGATGACCCATGAAGCGACCGAACGCTGA')
+        v1 = pymummer.variant.Variant(pymummer.snp.Snp('6\tC\tT\t6\t1\t1\t39\t39\t1\t1\tgene\tcontig'))
+        v2 = pymummer.variant.Variant(pymummer.snp.Snp('4\tC\tT\t4\t1\t1\t39\t39\t1\t1\tgene\tcontig'))
+        v3 = pymummer.variant.Variant(pymummer.snp.Snp('4\tC\t.\t4\t1\t1\t39\t39\t1\t1\tgene\tcontig'))
+        variant_lists = [[v1], [v2], [v3], [v1, v3]]
+        expected = [
+            ('SYN', '.', 1),
+            ('NONSYN', 'R2C', 1),
+            ('FSHIFT', 'R2fs', 1),
+            ('MULTIPLE', '.', '.'),
+        ]
+        self.assertEqual(expected, assembly_variants.AssemblyVariants._get_variant_effects(variant_lists, ref_seq))
+        for variants, effect in zip(variant_lists, expected):
+            self.assertEqual(effect, assembly_variants.AssemblyVariants._get_variant_effect(variants, ref_seq))
+
+
     def test_get_variant_effect(self):
         '''test _get_variant_effect'''
         ref_seq = pyfastaq.sequences.Fasta('gene', 'GATCGCGAAGCGATGACCCATGAAGCGACCGAACGCTGA')
@@ -340,6 +386,11 @@ class TestAssemblyVariants(unittest.TestCase):
         got = a_variants.get_variants('presence_absence', nucmer_coords)
         self.assertEqual(expected, got)
 
+        nucmer_variants = assembly_compare.AssemblyCompare._parse_nucmer_snps_file(nucmer_snp_file)
+        a_variants = assembly_variants.AssemblyVariants(refdata, 'not_a_file', nucmer_variants=nucmer_variants)
+        got = a_variants.get_variants('presence_absence', nucmer_coords)
+        self.assertEqual(expected, got)
+
 
     def test_get_variants_variants_only(self):
         '''test get_variants variants only'''
@@ -0,0 +1,14 @@
+import unittest
+import os
+from ariba import batch_assembly
+
+modules_dir = os.path.dirname(os.path.abspath(batch_assembly.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestBatchAssembly(unittest.TestCase):
+    def test_assign_contigs_to_refs(self):
+        '''test _assign_contigs_to_refs'''
+        infile = os.path.join(data_dir, 'batch_assembly_test_assign_contigs_to_refs.coords')
+        expected = {'contig1': 'ref1', 'contig2': 'ref2', 'contig3': 'ref1'}
+        self.assertEqual(expected, batch_assembly.BatchAssembly._assign_contigs_to_refs(infile))
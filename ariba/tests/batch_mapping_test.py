@@ -0,0 +1,49 @@
+import unittest
+import os
+import pysam
+from ariba import batch_mapping
+
+modules_dir = os.path.dirname(os.path.abspath(batch_mapping.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestBatchMapping(unittest.TestCase):
+    def test_split_bam(self):
+        '''test _split_bam'''
+        bam = os.path.join(data_dir, 'batch_mapping_test_split_bam.bam')
+        tmp_bams = ['tmp.batch_mapping_test_split_bam.' + str(i) + '.bam' for i in range(1, 5)]
+        contig_to_assembly = {'c1': 0, 'c2': 1, 'c3': 0, 'c4': 2}
+        job_to_assembly = [0, 1, 2, 0]
+        got_remap = batch_mapping.BatchMapping._split_bam(bam, tmp_bams, contig_to_assembly, job_to_assembly)
+        # job 2 has a read with an XS tag. Job 3 has a read that mapped to the assembly of job 1.
+        # The BAM files of those jobs are incomplete, because run() makes them again
+        self.assertEqual({1, 2}, got_remap)
+
+        got = []
+        for filename in tmp_bams:
+            self.assertTrue(os.path.exists(filename + '.bai'))
+            sam_reader = pysam.Samfile(filename, 'rb')
+            reads = [(x.qname, x.reference_name, x.pos, x.is_unmapped, x.mate_is_unmapped, x.next_reference_name, x.pnext) for x in sam_reader.fetch(until_eof=True)]
+            got.append((sam_reader.references, reads))
+            sam_reader.close()
+
+        expected = [
+            (('c1', 'c3'), [
+                ('r1', 'c1', 10, False, False, 'c1', 50),
+                ('r5', 'c1', 40, False, False, 'c3', 10),
+                ('r1', 'c1', 50, False, False, 'c1', 10),
+                ('r6', 'c1', 60, False, True, 'c1', 60),
+                ('r6', 'c1', 60, True, False, 'c1', 60),
+                ('r5', 'c3', 10, False, False, 'c1', 40),
+                ('r7', None, -1, True, True, None, -1),
+                ('r7', None, -1, True, True, None, -1),
+            ]),
+            (('c2',), []),
+            (('c4',), []),
+            (('c1', 'c3'), []),
+        ]
+        self.assertEqual(expected, got)
+
+        for filename in tmp_bams:
+            os.unlink(filename)
+            os.unlink(filename + '.bai')
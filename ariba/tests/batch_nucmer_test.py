@@ -0,0 +1,90 @@
+import unittest
+import os
+import filecmp
+import pymummer
+from ariba import batch_nucmer, pairwise_aligner
+
+modules_dir = os.path.dirname(os.path.abspath(batch_nucmer.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestBatchNucmer(unittest.TestCase):
+    def test_run(self):
+        '''test run'''
+        jobs = []
+        for i in ['1', '2']:
+            jobs.append((
+                os.path.join(data_dir, 'batch_nucmer_test_run.ref' + i + '.fa'),
+                os.path.join(data_dir, 'batch_nucmer_test_run.contigs' + i + '.fa'),
+                'tmp.batch_nucmer_test_run.' + i + '.coords',
+            ))
+
+        tmp_dir = 'tmp.batch_nucmer_test_run'
+        batch = batch_nucmer.BatchNucmer(jobs, tmp_dir, aligner='internal')
+        batch.run()
+        self.assertFalse(os.path.exists(tmp_dir))
+
+        expected_hits = [1, 1]
+        expected_variants = [1, 1]
+        tmp_expected = 'tmp.batch_nucmer_test_run.expected.coords'
+
+        for i, (ref_fa, contigs_fa, coords_file) in enumerate(jobs):
+            pairwise_aligner.Runner(ref_fa, contigs_fa, tmp_expected, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True).run()
+            got_hits = list(pymummer.coords_file.reader(coords_file))
+            self.assertEqual(list(pymummer.coords_file.reader(tmp_expected)), got_hits)
+            self.assertEqual(expected_hits[i], len(got_hits))
+            got_variants = pymummer.snp_file.get_all_variants(coords_file + '.snps')
+            self.assertEqual(pymummer.snp_file.get_all_variants(tmp_expected + '.snps'), got_variants)
+            self.assertEqual(expected_variants[i], len(got_variants))
+            for filename in [coords_file, coords_file + '.snps', tmp_expected, tmp_expected + '.snps']:
+                os.unlink(filename)
+
+
+    def test_run_contig_hits_other_job(self):
+        '''test run when a contig also matches the reference of another job'''
+        # contig1 matches ref1 with one snp, but the snp is in a region
+        # of ref1 that is also in ref2 (and contig2)
+        jobs = []
+        for i in ['1', '2']:
+            jobs.append((
+                os.path.join(data_dir, 'batch_nucmer_test_run_shared_region.ref' + i + '.fa'),
+                os.path.join(data_dir, 'batch_nucmer_test_run_shared_region.contigs' + i + '.fa'),
+                'tmp.batch_nucmer_test_run_contig_hits_other_job.' + i + '.coords',
+            ))
+
+        tmp_dir = 'tmp.batch_nucmer_test_run_contig_hits_other_job'
+        batch = batch_nucmer.BatchNucmer(jobs, tmp_dir, aligner='internal')
+        batch.run()
+
+        expected_variants = [1, 0]
+        for i, (ref_fa, contigs_fa, coords_file) in enumerate(jobs):
+            got_hits = list(pymummer.coords_file.reader(coords_file))
+            self.assertEqual(1, len(got_hits))
+            self.assertEqual(expected_variants[i], len(pymummer.snp_file.get_all_variants(coords_file + '.snps')))
+            os.unlink(coords_file)
+            os.unlink(coords_file + '.snps')
+
+
+    def test_filter_delta_file(self):
+        '''test _filter_delta_file'''
+        infile = os.path.join(data_dir, 'batch_nucmer_test_filter_delta_file.in.delta')
+        expected = os.path.join(data_dir, 'batch_nucmer_test_filter_delta_file.out.delta')
+        tmp_file = 'tmp.batch_nucmer_test_filter_delta_file.delta'
+        ref_to_job = {'ref1': 0, 'ref2': 1}
+        contig_to_job = {'contig1': 0, 'contig2': 1}
+        batch_nucmer.BatchNucmer._filter_delta_file(infile, tmp_file, ref_to_job, contig_to_job)
+        self.assertTrue(filecmp.cmp(expected, tmp_file, shallow=False))
+        os.unlink(tmp_file)
+
+
+    def test_run_names_not_unique(self):
+        '''test run fails when sequence names are not unique'''
+        ref_fa = os.path.join(data_dir, 'batch_nucmer_test_run.ref1.fa')
+        contigs_fa = os.path.join(data_dir, 'batch_nucmer_test_run.contigs1.fa')
+        tmp_dir = 'tmp.batch_nucmer_test_run_names_not_unique'
+        jobs = [(ref_fa, contigs_fa, 'tmp.1.coords'), (ref_fa, contigs_fa, 'tmp.2.coords')]
+        batch = batch_nucmer.BatchNucmer(jobs, tmp_dir, aligner='internal')
+        with self.assertRaises(batch_nucmer.Error):
+            batch.run()
+        os.unlink(os.path.join(tmp_dir, 'references.fa'))
+        os.rmdir(tmp_dir)
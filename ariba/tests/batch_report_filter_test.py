@@ -0,0 +1,112 @@
+import unittest
+import os
+import shutil
+import filecmp
+from ariba import batch_report_filter, report, results_db
+
+modules_dir = os.path.dirname(os.path.abspath(batch_report_filter.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestBatchReportFilter(unittest.TestCase):
+    def test_load_fofn(self):
+        '''test load_fofn'''
+        tmp_fofn = 'tmp.batch_report_filter_test_load_fofn'
+        with open(tmp_fofn, 'w') as f:
+            print('file1', '', 'file2', sep='\n', file=f)
+        self.assertEqual(['file1', 'file2'], batch_report_filter.BatchReportFilter.load_fofn(tmp_fofn))
+        os.unlink(tmp_fofn)
+
+
+    def test_run(self):
+        '''test run'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        expected_file = os.path.join(data_dir, 'report_filter_test_run.expected.tsv')
+        tmp_dir = 'tmp.batch_report_filter_test_run'
+
+        for threads in [1, 2]:
+            for streaming in [False, True]:
+                if os.path.exists(tmp_dir):
+                    shutil.rmtree(tmp_dir)
+                batch_filter = batch_report_filter.BatchReportFilter([infile, infile], tmp_dir, threads=threads, streaming=streaming)
+                batch_filter.run()
+                for i in [1, 2]:
+                    self.assertTrue(filecmp.cmp(expected_file, os.path.join(tmp_dir, str(i) + '.tsv'), shallow=False))
+
+                with open(batch_filter.index_file) as f:
+                    lines = [x.rstrip('\n').split('\t') for x in f]
+                self.assertEqual('#' + '\t'.join(batch_report_filter.index_columns), '\t'.join(lines[0]))
+                self.assertEqual(3, len(lines))
+                for i, fields in enumerate(lines[1:]):
+                    self.assertEqual([str(i + 1), os.path.abspath(infile), '.', os.path.abspath(os.path.join(tmp_dir, str(i + 1) + '.tsv'))], fields[:4])
+                    self.assertEqual('.', fields[-1])
+
+        shutil.rmtree(tmp_dir)
+
+
+    def test_run_results_dbs(self):
+        '''test run with results databases'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        expected_file = os.path.join(data_dir, 'report_filter_test_run.expected.tsv')
+        with open(infile) as f:
+            records = [report.ReportRecord.from_line(x.rstrip('\n')) for x in f if not x.startswith('#')]
+
+        tmp_dbs = ['tmp.batch_report_filter_test_run_results_dbs.' + str(i) + '.db' for i in [1, 2]]
+        for filename, samples in zip(tmp_dbs, [['sample1', 'sample2'], ['sample3']]):
+            if os.path.exists(filename):
+                os.unlink(filename)
+            db = results_db.ResultsDb(filename)
+            for sample in samples:
+                db.add_sample(sample, records, [])
+            db.close()
+
+        tmp_dir = 'tmp.batch_report_filter_test_run_results_dbs'
+        tests = [
+            (None, [(tmp_dbs[0], 'sample1'), (tmp_dbs[0], 'sample2'), (tmp_dbs[1], 'sample3')]),
+            (['sample3', 'sample1'], [(tmp_dbs[0], 'sample1'), (tmp_dbs[1], 'sample3')]),
+        ]
+
+        for samples, expected_inputs in tests:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            batch_filter = batch_report_filter.BatchReportFilter(tmp_dbs, tmp_dir, threads=2, results_dbs=True, samples=samples)
+            batch_filter.run()
+
+            with open(batch_filter.index_file) as f:
+                lines = [x.rstrip('\n').split('\t') for x in f][1:]
+            self.assertEqual([(os.path.abspath(x), y) for x, y in expected_inputs], [(x[1], x[2]) for x in lines])
+            for i in range(len(expected_inputs)):
+                self.assertTrue(filecmp.cmp(expected_file, os.path.join(tmp_dir, str(i + 1) + '.tsv'), shallow=False))
+
+        shutil.rmtree(tmp_dir)
+        batch_filter = batch_report_filter.BatchReportFilter(tmp_dbs, tmp_dir, results_dbs=True, samples=['sample1', 'not_a_sample'])
+        with self.assertRaises(batch_report_filter.Error):
+            batch_filter.run()
+        self.assertFalse(os.path.exists(tmp_dir))
+
+        with self.assertRaises(batch_report_filter.Error):
+            batch_report_filter.BatchReportFilter(tmp_dbs, tmp_dir, results_dbs=True, streaming=True)
+
+        for filename in tmp_dbs:
+            os.unlink(filename)
+
+
+    def test_run_with_bad_file(self):
+        '''test run when one file cannot be filtered'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        bad_infile = os.path.join(data_dir, 'report_filter_test_load_report_bad.tsv')
+        tmp_dir = 'tmp.batch_report_filter_test_run_with_bad_file'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+        batch_filter = batch_report_filter.BatchReportFilter([bad_infile, infile], tmp_dir, threads=2)
+        with self.assertRaises(batch_report_filter.Error):
+            batch_filter.run()
+
+        with open(batch_filter.index_file) as f:
+            lines = [x.rstrip('\n').split('\t') for x in f]
+        self.assertEqual(3, len(lines))
+        self.assertNotEqual('.', lines[1][-1])
+        self.assertEqual('.', lines[2][-1])
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir, '2.tsv')))
+        shutil.rmtree(tmp_dir)
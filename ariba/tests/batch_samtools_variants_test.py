@@ -0,0 +1,37 @@
+import unittest
+import os
+import filecmp
+from ariba import batch_samtools_variants, samtools_variants
+
+modules_dir = os.path.dirname(os.path.abspath(batch_samtools_variants.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestBatchSamtoolsVariants(unittest.TestCase):
+    def test_split_vcf(self):
+        '''test _split_vcf'''
+        infile = os.path.join(data_dir, 'batch_samtools_variants_test_split.vcf')
+        tmp_outfiles = ['tmp.batch_samtools_variants_test_split_vcf.1.vcf', 'tmp.batch_samtools_variants_test_split_vcf.2.vcf']
+        seq_to_job = {'ctg1': 0, 'ctg2': 1, 'ctg3': 0}
+        batch_samtools_variants.BatchSamtoolsVariants._split_vcf(infile, tmp_outfiles, seq_to_job)
+        for i in [1, 2]:
+            expected = os.path.join(data_dir, 'batch_samtools_variants_test_split.expected.' + str(i) + '.vcf')
+            self.assertTrue(filecmp.cmp(expected, tmp_outfiles[i - 1], shallow=False))
+            os.unlink(tmp_outfiles[i - 1])
+
+
+    def test_split_read_depths(self):
+        '''test _split_read_depths'''
+        infile = os.path.join(data_dir, 'batch_samtools_variants_test_split.read_depths')
+        tmp_outfiles = ['tmp.batch_samtools_variants_test_split_read_depths.1.gz', 'tmp.batch_samtools_variants_test_split_read_depths.2.gz']
+        seq_to_job = {'ctg1': 0, 'ctg2': 1, 'ctg3': 0}
+        batch_samtools_variants.BatchSamtoolsVariants._split_read_depths(infile, tmp_outfiles, seq_to_job)
+
+        self.assertEqual({'ctg1': 39, 'ctg3': 25}, samtools_variants.SamtoolsVariants.total_depth_per_contig(tmp_outfiles[0]))
+        self.assertEqual({'ctg2': 60}, samtools_variants.SamtoolsVariants.total_depth_per_contig(tmp_outfiles[1]))
+        self.assertEqual(('A', 'G', 20, '1,19'), samtools_variants.SamtoolsVariants._get_read_depths(tmp_outfiles[0], 'ctg1', 9))
+        self.assertEqual(('C', 'T', 30, '2,28'), samtools_variants.SamtoolsVariants._get_read_depths(tmp_outfiles[1], 'ctg2', 41))
+
+        for filename in tmp_outfiles:
+            os.unlink(filename)
+            os.unlink(filename + '.tbi')
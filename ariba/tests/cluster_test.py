@@ -6,13 +6,17 @@ import filecmp
 import pyfastaq
 import pysam
 import pymummer
-from ariba import cluster, flag, reference_data
+from ariba import batch_mapping, cluster, flag, reference_data
 
 modules_dir = os.path.dirname(os.path.abspath(cluster.__file__))
 data_dir = os.path.join(modules_dir, 'tests', 'data')
 cluster.unittest = True
 
 
+def report_lines(c):
+    return [x.to_line() for x in c.report_records]
+
+
 def clean_cluster_dir(d, exclude=None):
     if not os.path.exists(d):
         return
@@ -52,6 +56,17 @@ class TestCluster(unittest.TestCase):
             shutil.rmtree(tmpdir)
 
 
+    def test_triage_fail_reason(self):
+        '''test _triage_fail_reason'''
+        self.assertIsNone(cluster.Cluster._triage_fail_reason(50, 1, 10, 0, 0.95, 30))
+        self.assertIsNone(cluster.Cluster._triage_fail_reason(1000, 20, 2000, 1000, 0.95, 30))
+        self.assertIsNone(cluster.Cluster._triage_fail_reason(1000, 20, 2000, None, 0.95, 30))
+        self.assertIsNotNone(cluster.Cluster._triage_fail_reason(1000, 1, 1000, 1000, 0.95, 30))
+        self.assertIsNotNone(cluster.Cluster._triage_fail_reason(1000, 4, 400, 400, 0.95, 30))
+        self.assertIsNone(cluster.Cluster._triage_fail_reason(1000, 20, 2000, 791, 0.95, 30))
+        self.assertIsNotNone(cluster.Cluster._triage_fail_reason(1000, 20, 2000, 789, 0.95, 30))
+
+
     def test_number_of_reads_for_assembly(self):
         '''Test _number_of_reads_for_assembly'''
         # ref is 100bp long
@@ -101,6 +116,39 @@ class TestCluster(unittest.TestCase):
         os.unlink(reads_out2)
 
 
+    def test_normalise_reads_for_assembly(self):
+        '''test _normalise_reads_for_assembly'''
+        reads_in1 = os.path.join(data_dir, 'cluster_test_normalise_reads_for_assembly.in_1.fq')
+        reads_in2 = os.path.join(data_dir, 'cluster_test_normalise_reads_for_assembly.in_2.fq')
+        expected_out1 = os.path.join(data_dir, 'cluster_test_normalise_reads_for_assembly.out_1.fq')
+        expected_out2 = os.path.join(data_dir, 'cluster_test_normalise_reads_for_assembly.out_2.fq')
+        reads_out1 = 'tmp.test_normalise_reads_for_assembly.out_1.fq'
+        reads_out2 = 'tmp.test_normalise_reads_for_assembly.out_2.fq'
+        reads_written = cluster.Cluster._normalise_reads_for_assembly(2, reads_in1, reads_in2, reads_out1, reads_out2, kmer=11)
+        self.assertEqual(8, reads_written)
+        self.assertTrue(filecmp.cmp(expected_out1, reads_out1, shallow=False))
+        self.assertTrue(filecmp.cmp(expected_out2, reads_out2, shallow=False))
+        os.unlink(reads_out1)
+        os.unlink(reads_out2)
+
+
+    def test_remove_duplicate_read_pairs(self):
+        '''test _remove_duplicate_read_pairs'''
+        reads_in1 = os.path.join(data_dir, 'cluster_test_remove_duplicate_read_pairs.in_1.fq')
+        reads_in2 = os.path.join(data_dir, 'cluster_test_remove_duplicate_read_pairs.in_2.fq')
+        expected_out1 = os.path.join(data_dir, 'cluster_test_remove_duplicate_read_pairs.out_1.fq')
+        expected_out2 = os.path.join(data_dir, 'cluster_test_remove_duplicate_read_pairs.out_2.fq')
+        reads_out1 = 'tmp.test_remove_duplicate_read_pairs.out_1.fq'
+        reads_out2 = 'tmp.test_remove_duplicate_read_pairs.out_2.fq'
+        reads_written, counts = cluster.Cluster._remove_duplicate_read_pairs(reads_in1, reads_in2, reads_out1, reads_out2)
+        self.assertEqual(8, reads_written)
+        self.assertEqual({'1': 3, '7': 2}, counts)
+        self.assertTrue(filecmp.cmp(expected_out1, reads_out1, shallow=False))
+        self.assertTrue(filecmp.cmp(expected_out2, reads_out2, shallow=False))
+        os.unlink(reads_out1)
+        os.unlink(reads_out2)
+
+
     def test_full_run_choose_ref_fail(self):
         '''test complete run of cluster when choosing ref seq fails'''
         refdata = reference_data.ReferenceData(
@@ -113,7 +161,7 @@ class TestCluster(unittest.TestCase):
         c.run()
 
         expected = '\t'.join(['.', '.', '1088', '2', 'cluster_name'] + ['.'] * 24)
-        self.assertEqual([expected], c.report_lines)
+        self.assertEqual([expected], report_lines(c))
         self.assertTrue(c.status_flag.has('ref_seq_choose_fail'))
         self.assertTrue(c.status_flag.has('assembly_fail'))
         shutil.rmtree(tmpdir)
@@ -131,12 +179,31 @@ class TestCluster(unittest.TestCase):
         c.run()
 
         expected = '\t'.join(['noncoding_ref_seq', 'non_coding', '64', '4', 'cluster_name'] + ['.'] * 24)
-        self.assertEqual([expected], c.report_lines)
+        self.assertEqual([expected], report_lines(c))
         self.assertFalse(c.status_flag.has('ref_seq_choose_fail'))
         self.assertTrue(c.status_flag.has('assembly_fail'))
         shutil.rmtree(tmpdir)
 
 
+    def test_full_run_triage_fail_renamed_cluster(self):
+        '''test complete run of cluster when triage fails and the cluster name is not a reference name'''
+        refdata = reference_data.ReferenceData(
+            non_coding_fa=os.path.join(data_dir, 'cluster_test_full_run_assembly_fail.noncoding.fa')
+        )
+        tmpdir = 'tmp.test_full_run_triage_fail_renamed_cluster'
+        shutil.copytree(os.path.join(data_dir, 'cluster_test_full_run_assembly_fail'), tmpdir)
+
+        c = cluster.Cluster(tmpdir, 'noncoding_ref_seq.n', refdata, total_reads=4, total_reads_bases=304, reference_names=['noncoding_ref_seq'], triage=True)
+        c.run()
+
+        self.assertEqual('noncoding_ref_seq', c.ref_sequence.id)
+        self.assertEqual('non_coding', c.ref_sequence_type)
+        expected = '\t'.join(['noncoding_ref_seq', 'non_coding', '64', '4', 'noncoding_ref_seq.n'] + ['.'] * 24)
+        self.assertEqual([expected], report_lines(c))
+        self.assertTrue(c.status_flag.has('assembly_fail'))
+        shutil.rmtree(tmpdir)
+
+
     def test_full_run_ok_non_coding(self):
         '''test complete run of cluster on a noncoding sequence'''
         refdata = reference_data.ReferenceData(
@@ -159,10 +226,38 @@ class TestCluster(unittest.TestCase):
             'noncoding1\tnon_coding\t531\t72\tcluster_name\t120\t120\t95.87\tnoncoding1.scaffold.1\t234\t15.4\t1\tSNP\tn\tG9T\t0\t.\t.\t9\t9\tG\t69\t69\tG\t19\t.\t19\tnoncoding1:n:G9T:.:wild type in ref and reads\tgeneric description of noncoding1'
         ]
 
-        self.assertEqual(expected, c.report_lines)
+        self.assertEqual(expected, report_lines(c))
         shutil.rmtree(tmpdir)
 
 
+    def test_full_run_ok_consensus(self):
+        '''test complete run of cluster when the consensus is used instead of an assembly'''
+        refdata = reference_data.ReferenceData(
+            non_coding_fa=os.path.join(data_dir, 'cluster_test_full_run_consensus.noncoding.fa'),
+        )
+
+        # Some of the read pairs are duplicates. The depth at the ends of the
+        # reference is only high enough if all copies of the reads are counted
+        for remove_duplicates in [False, True]:
+            tmpdir = 'tmp.cluster_test_full_run_ok_consensus'
+            shutil.copytree(os.path.join(data_dir, 'cluster_test_full_run_consensus'), tmpdir)
+
+            c = cluster.Cluster(tmpdir, 'cluster_name', refdata, total_reads=142, total_reads_bases=7100, consensus_min_id=98, consensus_min_depth=10, remove_duplicates=remove_duplicates)
+            c.run()
+
+            self.assertTrue(c.status_flag.has('assembled_by_consensus'))
+            self.assertTrue(c.status_flag.has('assembled'))
+            self.assertEqual(1, len(c.report_records))
+            record = c.report_records[0]
+            self.assertEqual('consensus_ref', record['ref_name'])
+            self.assertEqual(300, record['ref_base_assembled'])
+            self.assertEqual(99.67, record['pc_ident'])
+            self.assertEqual('T151C', record['ref_ctg_change'])
+            self.assertEqual('SNP', record['ref_ctg_effect'])
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, 'reference.reads_mapped.bam')))
+            shutil.rmtree(tmpdir)
+
+
     def test_full_run_ok_presence_absence(self):
         '''test complete run of cluster on a presence absence gene'''
         refdata = reference_data.ReferenceData(
@@ -185,10 +280,59 @@ class TestCluster(unittest.TestCase):
             'presence_absence1\tpresence_absence\t539\t64\tcluster_name\t96\t96\t97.92\tpresence_absence1.scaffold.1\t213\t15.0\t1\tSNP\tp\tI5A\t1\t.\t.\t13\t15\tG;C;G\t68\t70\tG;C;G\t18;20;20\t.;.;.\t18;20;20\tpresence_absence1:p:I5A:.:Ref and reads have variant so report\tGeneric description of presence_absence1',
         ]
 
-        self.assertEqual(expected, c.report_lines)
+        self.assertEqual(expected, report_lines(c))
         shutil.rmtree(tmpdir)
 
 
+    def test_full_run_batch_mapping_same_as_per_cluster(self):
+        '''test complete run of clusters gives the same report when the reads are mapped in a batch'''
+        tests = [
+            ('cluster_test_full_run_ok_non_coding', {'non_coding_fa': 'cluster_test_full_run_ok_non_coding.fa'}, 72, 3600),
+            ('cluster_test_full_run_ok_presence_absence', {'presence_absence_fa': 'cluster_test_full_run_ok_presence_absence.fa'}, 64, 3200),
+        ]
+
+        def make_clusters():
+            clusters = []
+            for name, fasta_option, total_reads, total_bases in tests:
+                refdata = reference_data.ReferenceData(
+                    metadata_tsv=os.path.join(data_dir, name + '.metadata.tsv'),
+                    **{x: os.path.join(data_dir, y) for x, y in fasta_option.items()}
+                )
+                tmpdir = 'tmp.' + name + '.batch_mapping'
+                shutil.copytree(os.path.join(data_dir, name), tmpdir)
+                clusters.append(cluster.Cluster(tmpdir, 'cluster_name', refdata, spades_other_options='--only-assembler', total_reads=total_reads, total_reads_bases=total_bases))
+            return clusters
+
+        expected = []
+        for c in make_clusters():
+            c.run()
+            expected.append(c.report_records)
+            shutil.rmtree(c.root_dir)
+
+        clusters = make_clusters()
+        for c in clusters:
+            c.map_reads_in_batch = True
+            c.run_up_to_variant_calling()
+
+        tmp_batch_dir = 'tmp.cluster_test_full_run_batch_mapping'
+        batch_mapping.BatchMapping(
+            [job for c in clusters for job in c.batch_mapping_jobs()],
+            tmp_batch_dir,
+            tmp_batch_dir + '.log',
+            samtools_exe=clusters[0].extern_progs.exe('samtools'),
+            bowtie2_exe=clusters[0].extern_progs.exe('bowtie2'),
+        ).run()
+        os.unlink(tmp_batch_dir + '.log')
+
+        got = []
+        for c in clusters:
+            c.run()
+            got.append(c.report_records)
+            shutil.rmtree(c.root_dir)
+
+        self.assertEqual(expected, got)
+
+
     def test_full_run_ok_variants_only_variant_not_present(self):
         '''test complete run of cluster on a variants only gene when variant not present'''
         refdata = reference_data.ReferenceData(
@@ -204,7 +348,7 @@ class TestCluster(unittest.TestCase):
         expected = [
             'variants_only1\tvariants_only\t27\t66\tcluster_name\t96\t96\t100.0\tvariants_only1.scaffold.1\t215\t15.3\t1\tSNP\tp\tR3S\t0\t.\t.\t7\t9\tC;G;C\t65\t67\tC;G;C\t18;18;19\t.;.;.\t18;18;19\tvariants_only1:p:R3S:.:Ref and assembly have wild type, so do not report\tGeneric description of variants_only1'
         ]
-        self.assertEqual(expected, c.report_lines)
+        self.assertEqual(expected, report_lines(c))
         shutil.rmtree(tmpdir)
 
 
@@ -223,7 +367,7 @@ class TestCluster(unittest.TestCase):
         expected = [
             'variants_only1\tvariants_only\t27\t66\tcluster_name\t96\t96\t100.0\tvariants_only1.scaffold.1\t215\t15.3\t1\tSNP\tp\tR3S\t0\t.\t.\t7\t9\tC;G;C\t65\t67\tC;G;C\t18;18;19\t.;.;.\t18;18;19\tvariants_only1:p:R3S:.:Ref and assembly have wild type, but always report anyway\tGeneric description of variants_only1'
         ]
-        self.assertEqual(expected, c.report_lines)
+        self.assertEqual(expected, report_lines(c))
         shutil.rmtree(tmpdir)
 
 
@@ -244,5 +388,5 @@ class TestCluster(unittest.TestCase):
             'variants_only1\tvariants_only\t27\t66\tcluster_name\t96\t96\t100.0\tvariants_only1.scaffold.1\t215\t15.3\t1\tSNP\tp\tR3S\t0\t.\t.\t7\t9\tC;G;C\t65\t67\tC;G;C\t18;18;19\t.;.;.\t18;18;19\tvariants_only1:p:R3S:.:Ref and assembly have wild type\tGeneric description of variants_only1',
             'variants_only1\tvariants_only\t27\t66\tcluster_name\t96\t96\t100.0\tvariants_only1.scaffold.1\t215\t15.3\t1\tSNP\tp\tI5A\t1\t.\t.\t13\t15\tG;C;G\t71\t73\tG;C;G\t17;17;17\t.;.;.\t17;17;17\tvariants_only1:p:I5A:.:Ref and reads have variant so report\tGeneric description of variants_only1',
         ]
-        self.assertEqual(expected, c.report_lines)
+        self.assertEqual(expected, report_lines(c))
         shutil.rmtree(tmpdir)
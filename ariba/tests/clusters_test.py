@@ -12,6 +12,19 @@ data_dir = os.path.join(modules_dir, 'tests', 'data')
 extern_progs = external_progs.ExternalProgs()
 
 
+class FakeStageCluster:
+    '''Picklable stand-in for a cluster, to test running stages in a pool'''
+    def __init__(self, name):
+        self.name = name
+        self.root_dir = name
+        self.stage_run = False
+
+    def stage(self):
+        if self.name == 'fail':
+            raise Exception('Something went wrong')
+        self.stage_run = True
+
+
 def file_to_list(infile):
     f = pyfastaq.utils.open_file_read(infile)
     lines = [x for x in f.readlines()]
@@ -93,6 +106,7 @@ class TestClusters(unittest.TestCase):
         self.assertEqual({}, c.insert_hist.bins)
         self.assertEqual({}, c.cluster_read_counts)
         self.assertEqual({}, c.cluster_base_counts)
+        self.assertEqual({}, c.cluster_covered_bases)
         self.assertEqual(0, c.proper_pairs)
 
         shutil.rmtree(clusters_dir)
@@ -122,6 +136,7 @@ class TestClusters(unittest.TestCase):
         self.assertEqual({780:1}, c.insert_hist.bins)
         self.assertEqual({'ref1': 4, 'ref2': 2}, c.cluster_read_counts)
         self.assertEqual({'ref1': 240, 'ref2': 120}, c.cluster_base_counts)
+        self.assertEqual({'ref1': 180, 'ref2': 60}, c.cluster_covered_bases)
         self.assertEqual(1, c.proper_pairs)
 
         shutil.rmtree(clusters_dir)
@@ -149,9 +164,16 @@ class TestClusters(unittest.TestCase):
 
 
     def test_write_reports(self):
+        class FakeRecord:
+            def __init__(self, line):
+                self.line = line
+
+            def to_line(self):
+                return self.line
+
         class FakeCluster:
             def __init__(self, lines):
-                self.report_lines = lines
+                self.report_records = [FakeRecord(x) for x in lines]
 
         clusters_dict = {
             'gene1': FakeCluster(['gene1\tline1']),
@@ -169,6 +191,70 @@ class TestClusters(unittest.TestCase):
         os.unlink(tmp_xls)
 
 
+    def test_report_records(self):
+        '''test _report_records'''
+        class FakeCluster:
+            def __init__(self, records):
+                self.report_records = records
+
+        clusters_dict = {
+            'gene2': FakeCluster(['record3']),
+            'gene1': FakeCluster(['record1', 'record2']),
+            'gene3': FakeCluster(None),
+        }
+
+        self.assertEqual(['record1', 'record2', 'record3'], clusters.Clusters._report_records(clusters_dict))
+
+
+    def test_run_batch_stage(self):
+        '''test _run_batch_stage'''
+        class FakeCluster:
+            def __init__(self, assembled_ok):
+                self.assembled_ok = assembled_ok
+
+            def batch_mapping_jobs(self):
+                return []
+
+        cluster_list = [FakeCluster(False), FakeCluster(False)]
+        fails_file = os.path.join(self.clusters.fails_dir, 'batch_stage.batch_mapping')
+
+        # nothing to map, so the stage returns None and the list is unchanged
+        self.assertEqual(cluster_list, self.clusters._run_batch_stage('batch_mapping', self.clusters._batch_map_reads, cluster_list))
+        self.assertEqual([], os.listdir(self.clusters.fails_dir))
+
+        new_list = [FakeCluster(True)]
+        self.assertEqual(new_list, self.clusters._run_batch_stage('batch_nucmer', lambda x: new_list, cluster_list))
+
+        def fail(cluster_list):
+            raise Exception('Something went wrong')
+
+        self.assertEqual(cluster_list, self.clusters._run_batch_stage('batch_mapping', fail, cluster_list))
+        self.assertEqual(['batch_stage.batch_mapping'], os.listdir(self.clusters.fails_dir))
+        with open(fails_file) as f:
+            self.assertIn('Something went wrong', f.read())
+
+        # a stage has failed, so later stages are not run
+        self.assertEqual(cluster_list, self.clusters._run_batch_stage('batch_nucmer', lambda x: new_list, cluster_list))
+        os.unlink(fails_file)
+
+
+    def test_run_jobs_with_memory_limit(self):
+        '''test _run_jobs_with_memory_limit'''
+        self.clusters.threads = 2
+        self.clusters.max_memory = 1
+        jobs = [(x, FakeStageCluster(x), 1000, 1000) for x in ['a', 'b', 'c']]
+        got = self.clusters._run_jobs_with_memory_limit(jobs, clusters._run_cluster_stage, ('stage', False, self.clusters.fails_dir))
+        self.assertEqual(['a', 'b', 'c'], [x.name for x in got])
+        self.assertTrue(all([x.stage_run for x in got]))
+        self.assertTrue(all([x.peak_memory is not None for x in got]))
+        self.assertEqual([], os.listdir(self.clusters.fails_dir))
+
+        jobs = [(x, FakeStageCluster(x), 1000, 1000) for x in ['a', 'fail']]
+        got = self.clusters._run_jobs_with_memory_limit(jobs, clusters._run_cluster_stage, ('stage', False, self.clusters.fails_dir))
+        self.assertEqual(['fail'], os.listdir(self.clusters.fails_dir))
+        os.unlink(os.path.join(self.clusters.fails_dir, 'fail'))
+
+
     def test_write_catted_assembled_seqs_fasta(self):
         '''test _write_catted_assembled_seqs_fasta'''
         seq1 = pyfastaq.sequences.Fasta('seq1', 'ACGT')
@@ -0,0 +1,47 @@
+import unittest
+import os
+import pyfastaq
+from ariba import consensus
+
+modules_dir = os.path.dirname(os.path.abspath(consensus.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestConsensus(unittest.TestCase):
+    def test_consensus_from_counts(self):
+        '''test _consensus_from_counts'''
+        counts = [{'A': 10}, {'C': 1, 'G': 9}, {'T': 2, 'G': 8}]
+        self.assertEqual(('AGG', 'Consensus made. Percent identity of reads to reference is 63.33'), consensus.Consensus._consensus_from_counts('ACG', counts, 10, 60))
+        self.assertEqual(None, consensus.Consensus._consensus_from_counts('ACG', counts, 10, 64)[0])
+        self.assertEqual(None, consensus.Consensus._consensus_from_counts('ACG', counts, 11, 60)[0])
+
+        counts = [{'A': 10}, {'C': 4, '-': 6}, {'G': 10}]
+        self.assertEqual(None, consensus.Consensus._consensus_from_counts('ACG', counts, 10, 50)[0])
+
+        counts = [{'A': 10}, {'C': 10, '+': 6}, {'G': 10}]
+        self.assertEqual(None, consensus.Consensus._consensus_from_counts('ACG', counts, 10, 50)[0])
+        counts = [{'A': 10}, {'C': 10, '+': 1}, {'G': 10}]
+        self.assertEqual('ACG', consensus.Consensus._consensus_from_counts('ACG', counts, 10, 50)[0])
+
+
+    def test_run(self):
+        '''test run'''
+        ref_seqs = {}
+        pyfastaq.tasks.file_to_dict(os.path.join(data_dir, 'consensus_test_run.ref.fa'), ref_seqs)
+        bam = os.path.join(data_dir, 'consensus_test_run.bam')
+
+        c = consensus.Consensus(bam, ref_seqs['ref'], min_depth=5, min_identity=95)
+        self.assertTrue(c.run())
+        self.assertEqual(pyfastaq.sequences.Fasta('ref', 'ACGTTGCATGACGATAGCTAGGCTTACGGATCCAT'), c.sequence)
+
+        c = consensus.Consensus(bam, ref_seqs['ref'], min_depth=6, min_identity=95)
+        self.assertFalse(c.run())
+        self.assertEqual(None, c.sequence)
+
+        c = consensus.Consensus(bam, ref_seqs['ref'], min_depth=5, min_identity=98)
+        self.assertFalse(c.run())
+        self.assertEqual(None, c.sequence)
+
+        c = consensus.Consensus(bam, ref_seqs['ref'], min_depth=6, min_identity=95, read_counts={'read2': 2})
+        self.assertTrue(c.run())
+        self.assertEqual(pyfastaq.sequences.Fasta('ref', 'ACGTTGCATGACGATAGCTAGGCTTACGGATCCAT'), c.sequence)
@@ -0,0 +1,68 @@
+import unittest
+from ariba import interval_index
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_init_bad_interval(self):
+        '''test __init__ with start after end'''
+        with self.assertRaises(interval_index.Error):
+            interval_index.IntervalIndex([(1, 5, 'a'), (10, 9, 'b')])
+
+
+    def test_containing(self):
+        '''test containing and contains'''
+        index = interval_index.IntervalIndex([
+            (20, 30, 'c'),
+            (0, 100, 'a'),
+            (10, 15, 'b'),
+            (200, 200, 'd'),
+        ])
+        self.assertEqual(4, len(index))
+
+        tests = [
+            (-1, []),
+            (0, ['a']),
+            (10, ['b', 'a']),
+            (15, ['b', 'a']),
+            (16, ['a']),
+            (25, ['c', 'a']),
+            (100, ['a']),
+            (101, []),
+            (199, []),
+            (200, ['d']),
+            (201, []),
+        ]
+
+        for position, expected in tests:
+            self.assertEqual(expected, index.containing(position))
+            self.assertEqual(len(expected) > 0, index.contains(position))
+
+
+    def test_overlaps(self):
+        '''test overlaps'''
+        index = interval_index.IntervalIndex([
+            (0, 100, 'a'),
+            (10, 15, 'b'),
+            (20, 30, 'c'),
+            (200, 210, 'd'),
+        ])
+
+        tests = [
+            (-5, -1, []),
+            (-5, 0, ['a']),
+            (16, 19, ['a']),
+            (14, 21, ['c', 'b', 'a']),
+            (101, 199, []),
+            (150, 250, ['d']),
+            (211, 300, []),
+        ]
+
+        for start, end, expected in tests:
+            self.assertEqual(len(expected) > 0, index.overlaps(start, end))
+
+
+    def test_empty(self):
+        '''test empty index'''
+        index = interval_index.IntervalIndex([])
+        self.assertEqual([], index.containing(42))
+        self.assertFalse(index.contains(42))
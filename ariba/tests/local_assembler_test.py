@@ -0,0 +1,42 @@
+import unittest
+import os
+import filecmp
+from ariba import local_assembler
+
+modules_dir = os.path.dirname(os.path.abspath(local_assembler.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestLocalAssembler(unittest.TestCase):
+    def test_next_base(self):
+        '''test _next_base'''
+        assembler = local_assembler.LocalAssembler('reads1', 'reads2', 'ref', 'out', kmer=3)
+        self.assertEqual(None, assembler._next_base('ACG', {}))
+        self.assertEqual('T', assembler._next_base('ACG', {'CGT': 10}))
+        self.assertEqual('T', assembler._next_base('ACG', {'CGT': 10, 'CGA': 1}))
+        self.assertEqual(None, assembler._next_base('ACG', {'CGT': 10, 'CGA': 2}))
+
+
+    def test_extend_right(self):
+        '''test _extend_right'''
+        assembler = local_assembler.LocalAssembler('reads1', 'reads2', 'ref', 'out', kmer=3)
+        counts = {'ACG': 5, 'CGT': 5, 'GTT': 5, 'TTA': 5}
+        used = set()
+        self.assertEqual('ACGTTA', assembler._extend_right('ACG', counts, used))
+        self.assertEqual({'CGT', 'ACG', 'GTT', 'AAC', 'TTA', 'TAA'}, used)
+        used = {'ACG', 'CGT'}
+        counts = {'ACG': 5, 'CGA': 5, 'GAC': 5}
+        self.assertEqual('ACGAC', assembler._extend_right('ACG', counts, used))
+
+
+    def test_run(self):
+        '''test run'''
+        reads1 = os.path.join(data_dir, 'local_assembler_test_run.reads_1.fq')
+        reads2 = os.path.join(data_dir, 'local_assembler_test_run.reads_2.fq')
+        ref_fa = os.path.join(data_dir, 'local_assembler_test_run.ref.fa')
+        expected = os.path.join(data_dir, 'local_assembler_test_run.expected.fa')
+        tmp_out = 'tmp.local_assembler_test_run.fa'
+        assembler = local_assembler.LocalAssembler(reads1, reads2, ref_fa, tmp_out)
+        self.assertEqual(1, assembler.run())
+        self.assertTrue(filecmp.cmp(expected, tmp_out, shallow=False))
+        os.unlink(tmp_out)
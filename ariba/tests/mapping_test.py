@@ -114,6 +114,8 @@ class TestMapping(unittest.TestCase):
         expected = 219
         got = mapping.get_total_alignment_score(bam)
         self.assertEqual(got, expected)
+        got = mapping.get_total_alignment_score(bam, read_counts={'5': 2, '4': 3})
+        self.assertEqual(got, 366)
 
 
     def test_sam_to_fastq(self):
@@ -0,0 +1,75 @@
+import unittest
+from ariba import memory_scheduler
+
+
+class TestMemoryScheduler(unittest.TestCase):
+    def test_init_bad_values(self):
+        '''test __init__ with bad values'''
+        with self.assertRaises(memory_scheduler.Error):
+            memory_scheduler.MemoryScheduler(0, 2)
+        with self.assertRaises(memory_scheduler.Error):
+            memory_scheduler.MemoryScheduler(1000, 0)
+
+
+    def test_estimate(self):
+        '''test estimate'''
+        scheduler = memory_scheduler.MemoryScheduler(1000, 2)
+        predicted = memory_scheduler.MemoryScheduler._predicted_memory(1000, 500)
+        self.assertEqual(predicted, scheduler.estimate(1000, 500))
+        scheduler.scale = 2
+        self.assertEqual(2 * predicted, scheduler.estimate(1000, 500))
+
+
+    def test_can_start(self):
+        '''test can_start'''
+        scheduler = memory_scheduler.MemoryScheduler(1000, 2)
+        self.assertTrue(scheduler.can_start(5000))
+        scheduler.running = {'a': 600}
+        self.assertTrue(scheduler.can_start(400))
+        self.assertFalse(scheduler.can_start(401))
+        scheduler.running = {'a': 1, 'b': 1}
+        self.assertFalse(scheduler.can_start(1))
+
+
+    def test_next_job(self):
+        '''test next_job'''
+        big = memory_scheduler.MemoryScheduler._predicted_memory(100000, 10000)
+        small = memory_scheduler.MemoryScheduler._predicted_memory(10, 10)
+        scheduler = memory_scheduler.MemoryScheduler(big + small + 1, 3)
+        pending = [(100000, 10000), (10, 10)]
+        self.assertEqual(0, scheduler.next_job(pending))
+        scheduler.start('a', 100000, 10000)
+        self.assertEqual(1, scheduler.next_job(pending))
+        scheduler.start('b', 10, 10)
+        self.assertEqual(None, scheduler.next_job(pending))
+        self.assertEqual(None, scheduler.next_job([]))
+
+
+    def test_start_and_finish(self):
+        '''test start and finish'''
+        scheduler = memory_scheduler.MemoryScheduler(10000, 2)
+        predicted = memory_scheduler.MemoryScheduler._predicted_memory(1000, 1000)
+        self.assertEqual(predicted, scheduler.start('a', 1000, 1000))
+        with self.assertRaises(memory_scheduler.Error):
+            scheduler.start('a', 1000, 1000)
+        scheduler.start('b', 1000, 1000)
+        self.assertEqual(2 * predicted, scheduler.memory_in_use())
+
+        scheduler.finish('a', 1000, 1000, peak_memory_mb=2 * predicted)
+        self.assertEqual({'b': predicted}, scheduler.running)
+        self.assertEqual(2, scheduler.scale)
+        scheduler.finish('b', 1000, 1000, peak_memory_mb=predicted)
+        self.assertEqual(1.5, scheduler.scale)
+        self.assertEqual(1.5 * predicted, scheduler.estimate(1000, 1000))
+
+        with self.assertRaises(memory_scheduler.Error):
+            scheduler.finish('b', 1000, 1000)
+
+        scheduler.start('c', 1000, 1000)
+        scheduler.finish('c', 1000, 1000)
+        self.assertEqual(1.5, scheduler.scale)
+
+        for name in 'd', 'e':
+            scheduler.start(name, 1000, 1000)
+            scheduler.finish(name, 1000, 1000, peak_memory_mb=0.5 * predicted)
+        self.assertEqual(1, scheduler.scale)
@@ -0,0 +1,117 @@
+import unittest
+import os
+import pymummer
+from ariba import pairwise_aligner
+
+modules_dir = os.path.dirname(os.path.abspath(pairwise_aligner.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestPairwiseAligner(unittest.TestCase):
+    def test_seed_chains(self):
+        '''test _seed_chains'''
+        runner = pairwise_aligner.Runner('ref', 'qry', 'out', kmer=3, band=1, max_gap=5, min_cluster=5)
+        ref_index = runner._kmer_index('ACGTTGCAAT')
+        self.assertEqual({'ACG': [0], 'CGT': [1], 'GTT': [2], 'TTG': [3], 'TGC': [4], 'GCA': [5], 'CAA': [6], 'AAT': [7]}, ref_index)
+        self.assertEqual([[(0, 0), (1, 1), (2, 2)]], runner._seed_chains(ref_index, 'ACGTTAAA'))
+        self.assertEqual([], runner._seed_chains(ref_index, 'ACGAAAAA'))
+        self.assertEqual([[(0, 0), (1, 1), (3, 4), (4, 5)]], runner._seed_chains(ref_index, 'ACGTGCAG'))
+
+        # kmers that are repeated too many times are not used as seeds
+        runner = pairwise_aligner.Runner('ref', 'qry', 'out', kmer=3, band=1, max_gap=5, min_cluster=3, max_kmer_hits=2)
+        ref_index = runner._kmer_index('AAAAACGTT')
+        self.assertEqual({'AAC': [3], 'ACG': [4], 'CGT': [5], 'GTT': [6]}, ref_index)
+        self.assertEqual([[(2, 3), (3, 4)]], runner._seed_chains(ref_index, 'AAAACGAA'))
+
+
+    def test_banded_local_alignment(self):
+        '''test _banded_local_alignment'''
+        ref = 'ACGTACGTTGCATGCA'
+        self.assertEqual([(i, i) for i in range(len(ref))], pairwise_aligner.Runner._banded_local_alignment(ref, ref, 0, len(ref), -2, 2))
+        self.assertEqual([(i + 4, i) for i in range(8)], pairwise_aligner.Runner._banded_local_alignment(ref, ref[4:12], 0, 8, 2, 6))
+        self.assertEqual([(i, i) for i in range(4)], pairwise_aligner.Runner._banded_local_alignment(ref, ref[4:12], 0, 8, -2, 2))
+
+        qry = ref[:9] + ref[10:]
+        expected = [(i, i) for i in range(9)] + [(9, None)] + [(i, i - 1) for i in range(10, len(ref))]
+        self.assertEqual(expected, pairwise_aligner.Runner._banded_local_alignment(ref, qry, 0, len(qry), -2, 2))
+
+        qry = ref[:8] + 'A' + ref[8:]
+        expected = [(i, i) for i in range(8)] + [(None, 8)] + [(i, i + 1) for i in range(8, len(ref))]
+        self.assertEqual(expected, pairwise_aligner.Runner._banded_local_alignment(ref, qry, 0, len(qry), -2, 2))
+
+
+    def test_run(self):
+        '''test run'''
+        ref_fa = os.path.join(data_dir, 'pairwise_aligner_test_run.ref.fa')
+        qry_fa = os.path.join(data_dir, 'pairwise_aligner_test_run.qry.fa')
+        expected_coords = os.path.join(data_dir, 'pairwise_aligner_test_run.expected.coords')
+        tmp_coords = 'tmp.pairwise_aligner_test_run.coords'
+        runner = pairwise_aligner.Runner(ref_fa, qry_fa, tmp_coords, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True)
+        runner.run()
+        expected = list(pymummer.coords_file.reader(expected_coords))
+        got = list(pymummer.coords_file.reader(tmp_coords))
+        self.assertEqual(expected, got)
+        expected = pymummer.snp_file.get_all_variants(expected_coords + '.snps')
+        got = pymummer.snp_file.get_all_variants(tmp_coords + '.snps')
+        self.assertEqual(expected, got)
+        self.assertEqual(3, len(got))
+        os.unlink(tmp_coords)
+        os.unlink(tmp_coords + '.snps')
+
+
+    def test_run_same_as_nucmer(self):
+        '''test run gives the same output as nucmer, show-coords and show-snps'''
+        # contig1 has a SNP, a deletion in a homopolymer and an insertion. contig2 is on the
+        # reverse strand, and has a SNP and an insertion in a homopolymer
+        ref_fa = os.path.join(data_dir, 'pairwise_aligner_test_run_same_as_nucmer.ref.fa')
+        qry_fa = os.path.join(data_dir, 'pairwise_aligner_test_run_same_as_nucmer.qry.fa')
+        tmp_nucmer = 'tmp.pairwise_aligner_test_run_same_as_nucmer.nucmer.coords'
+        tmp_internal = 'tmp.pairwise_aligner_test_run_same_as_nucmer.internal.coords'
+        pymummer.nucmer.Runner(ref_fa, qry_fa, tmp_nucmer, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True).run()
+        pairwise_aligner.Runner(ref_fa, qry_fa, tmp_internal, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True).run()
+
+        expected = list(pymummer.coords_file.reader(tmp_nucmer))
+        got = list(pymummer.coords_file.reader(tmp_internal))
+        self.assertEqual(2, len(expected))
+        self.assertEqual([x.percent_identity for x in expected], [x.percent_identity for x in got])
+        self.assertEqual(expected, got)
+
+        expected = list(pymummer.snp_file.reader(tmp_nucmer + '.snps'))
+        got = list(pymummer.snp_file.reader(tmp_internal + '.snps'))
+        self.assertEqual(5, len(expected))
+        self.assertEqual([(x.ref_pos, x.qry_pos) for x in expected], [(x.ref_pos, x.qry_pos) for x in got])
+        self.assertEqual(expected, got)
+
+        for filename in [tmp_nucmer, tmp_nucmer + '.snps', tmp_internal, tmp_internal + '.snps']:
+            os.unlink(filename)
+
+
+    def test_run_seq_groups(self):
+        '''test run with seq_groups'''
+        prefix = os.path.join(data_dir, 'batch_nucmer_test_run_shared_region.')
+        tmp_ref = 'tmp.pairwise_aligner_test_run_seq_groups.ref.fa'
+        tmp_qry = 'tmp.pairwise_aligner_test_run_seq_groups.qry.fa'
+        tmp_coords = 'tmp.pairwise_aligner_test_run_seq_groups.coords'
+        for outfile, names in [(tmp_ref, ['ref1', 'ref2']), (tmp_qry, ['contigs1', 'contigs2'])]:
+            with open(outfile, 'w') as f_out:
+                for name in names:
+                    with open(prefix + name + '.fa') as f_in:
+                        print(f_in.read(), end='', file=f_out)
+
+        # Without groups, each contig matches both references, and the
+        # snp in contig1 is not reported because it is in two hits
+        runner = pairwise_aligner.Runner(tmp_ref, tmp_qry, tmp_coords, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True)
+        runner.run()
+        self.assertEqual(4, len(list(pymummer.coords_file.reader(tmp_coords))))
+        self.assertEqual(0, len(pymummer.snp_file.get_all_variants(tmp_coords + '.snps')))
+
+        seq_groups = {'ref1': 1, 'contig1': 1, 'ref2': 2, 'contig2': 2}
+        runner = pairwise_aligner.Runner(tmp_ref, tmp_qry, tmp_coords, min_id=90, min_length=20, breaklen=200, maxmatch=True, show_snps=True, seq_groups=seq_groups)
+        runner.run()
+        got = list(pymummer.coords_file.reader(tmp_coords))
+        self.assertEqual([('ref1', 'contig1'), ('ref2', 'contig2')], [(x.ref_name, x.qry_name) for x in got])
+        got = pymummer.snp_file.get_all_variants(tmp_coords + '.snps')
+        self.assertEqual(1, len(got))
+
+        for filename in [tmp_ref, tmp_qry, tmp_coords, tmp_coords + '.snps']:
+            os.unlink(filename)
@@ -0,0 +1,93 @@
+import unittest
+import os
+import pyfastaq
+from ariba import pysam_variants
+
+modules_dir = os.path.dirname(os.path.abspath(pysam_variants.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+def file2lines(filename):
+    f = pyfastaq.utils.open_file_read(filename)
+    lines = f.readlines()
+    pyfastaq.utils.close(f)
+    return lines
+
+
+class TestPysamVariants(unittest.TestCase):
+    def test_call_position(self):
+        '''test _call_position'''
+        counts = {'A': 10}
+        qual_sums = {'A': 400}
+        self.assertEqual(([], 10, [10], 0, 0), pysam_variants.PysamVariants._call_position('A', counts, qual_sums))
+
+        counts = {'A': 3, 'C': 5, 'G': 8}
+        qual_sums = {'A': 90, 'C': 150, 'G': 320}
+        self.assertEqual((['G', 'C'], 16, [3, 8, 5], 13, 470), pysam_variants.PysamVariants._call_position('A', counts, qual_sums))
+
+        counts = {'C': 30}
+        qual_sums = {'C': 1200}
+        self.assertEqual((['C'], 30, [0, 30], 30, pysam_variants.max_qual), pysam_variants.PysamVariants._call_position('T', counts, qual_sums))
+
+
+    def test_call_indels(self):
+        '''test _call_indels'''
+        ref_seq = 'ACGTACGT'
+        indel_counts = {'+TT': 2, '-2': 3}
+        indel_qual_sums = {'+TT': 80, '-2': 120}
+        self.assertEqual(('CGT', ['C', 'CTTGT'], [3, 3, 2], 5, 200), pysam_variants.PysamVariants._call_indels(ref_seq, 1, 8, indel_counts, indel_qual_sums))
+
+        indel_counts = {'+A': 4}
+        indel_qual_sums = {'+A': 1000}
+        self.assertEqual(('T', ['TA'], [0, 4], 4, pysam_variants.max_qual), pysam_variants.PysamVariants._call_indels(ref_seq, 7, 4, indel_counts, indel_qual_sums))
+
+
+    def test_run(self):
+        '''test run'''
+        ref_fa = os.path.join(data_dir, 'pysam_variants_test_run.ref.fa')
+        bam = os.path.join(data_dir, 'pysam_variants_test_run.bam')
+        tmp_prefix = 'tmp.pysam_variants_test_run'
+        pysam_vars = pysam_variants.PysamVariants(ref_fa, bam, tmp_prefix, bcf_min_dp=5, bcf_min_dv=3)
+        pysam_vars.run()
+        expected_vcf = os.path.join(data_dir, 'pysam_variants_test_run.expected.vcf')
+        expected_depths = os.path.join(data_dir, 'pysam_variants_test_run.expected.read_depths')
+        self.assertEqual(file2lines(expected_vcf), file2lines(pysam_vars.vcf_file))
+        self.assertEqual(file2lines(expected_depths), file2lines(pysam_vars.read_depths_file))
+        self.assertEqual(('T', 'A', 6, '2,4'), pysam_vars.get_depths_at_position('ref1', 8))
+        self.assertEqual(('G', '.', 5, '5'), pysam_vars.get_depths_at_position('ref1', 11))
+        self.assertEqual({'ref1': 59}, pysam_vars.total_depth_per_contig_from_index())
+        os.unlink(pysam_vars.vcf_file)
+        os.unlink(pysam_vars.read_depths_file)
+        os.unlink(pysam_vars.read_depths_file + '.tbi')
+
+
+    def test_run_indels(self):
+        '''test run when reads have indels'''
+        ref_fa = os.path.join(data_dir, 'pysam_variants_test_run.ref.fa')
+        bam = os.path.join(data_dir, 'pysam_variants_test_run_indels.bam')
+        tmp_prefix = 'tmp.pysam_variants_test_run_indels'
+        pysam_vars = pysam_variants.PysamVariants(ref_fa, bam, tmp_prefix, bcf_min_dp=5, bcf_min_dv=3)
+        pysam_vars.run()
+        vcf_lines = [x for x in file2lines(pysam_vars.vcf_file) if not x.startswith('#')]
+        self.assertEqual(['ref1\t10\t.\tCGG\tC,CTTGG\t200\tPASS\tINDEL;DP=8;DV=5;DPR=3,3,2\n'], vcf_lines)
+        self.assertEqual(('CGG', 'C,CTTGG', 8, '3,3,2'), pysam_vars.get_depths_at_position('ref1', 9))
+        self.assertEqual(('G', '.', 5, '5'), pysam_vars.get_depths_at_position('ref1', 10))
+        os.unlink(pysam_vars.vcf_file)
+        os.unlink(pysam_vars.read_depths_file)
+        os.unlink(pysam_vars.read_depths_file + '.tbi')
+
+
+    def test_run_with_regions(self):
+        '''test run with regions'''
+        ref_fa = os.path.join(data_dir, 'pysam_variants_test_run.ref.fa')
+        bam = os.path.join(data_dir, 'pysam_variants_test_run.bam')
+        tmp_prefix = 'tmp.pysam_variants_test_run_with_regions'
+        regions = {'ref1': [pyfastaq.intervals.Interval(8, 9)]}
+        pysam_vars = pysam_variants.PysamVariants(ref_fa, bam, tmp_prefix, regions=regions)
+        pysam_vars.run()
+        expected = ['ref1\t9\tT\tA\t6\t2,4\n', 'ref1\t10\tC\t.\t6\t6\n']
+        self.assertEqual(expected, file2lines(pysam_vars.read_depths_file))
+        self.assertEqual([], pysam_vars._get_variant_positions_from_vcf(pysam_vars.vcf_file))
+        os.unlink(pysam_vars.vcf_file)
+        os.unlink(pysam_vars.read_depths_file)
+        os.unlink(pysam_vars.read_depths_file + '.tbi')
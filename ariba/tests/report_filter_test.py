@@ -23,12 +23,15 @@ class TestReportFilter(unittest.TestCase):
                 'cluster1.scaffold.1': [report_filter.ReportFilter._report_line_to_dict(line1), report_filter.ReportFilter._report_line_to_dict(line2)],
                 'cluster1.scaffold.2': [report_filter.ReportFilter._report_line_to_dict(line3)],
             },
-            'cluster2': {
-                'cluster2.scaffold.1': [report_filter.ReportFilter._report_line_to_dict(line4)]
-            }
         }
 
         self.assertEqual(expected, rf.report)
+        self.assertEqual(4, rf.lines_in)
+
+        rf = report_filter.ReportFilter(infile=infile, min_pc_ident=40)
+        expected['cluster2'] = {'cluster2.scaffold.1': [report_filter.ReportFilter._report_line_to_dict(line4)]}
+        self.assertEqual(expected, rf.report)
+        self.assertEqual(4, rf.lines_in)
 
 
     def test_init_bad_file(self):
@@ -135,11 +138,41 @@ class TestReportFilter(unittest.TestCase):
             }
         }
 
-        got = report_filter.ReportFilter._load_report(good_infile)
+        rf = report_filter.ReportFilter(min_pc_ident=40)
+        got = rf._load_report(good_infile)
         self.maxDiff = None
         self.assertEqual(expected, got)
+        self.assertEqual(4, rf.lines_in)
+        with self.assertRaises(report_filter.Error):
+            rf._load_report(bad_infile)
+
+        rf = report_filter.ReportFilter(exclude_flags=['assembled'])
+        self.assertEqual({}, rf._load_report(good_infile))
+        self.assertEqual(4, rf.lines_in)
+
+
+    def test_load_records(self):
+        '''test _load_records and __init__ with records'''
+        line1 = '\t'.join(['cluster1', 'non_coding', '27', '10000', 'cluster1', '1000', '999', '99.42', 'cluster1.scaffold.1', '1300', '12.2', '1', 'SNP', 'n', 'C42T', '0', '.', '.', '42', '42', 'C', '142', '142', 'C', '500', '.', '500', 'a:n:C42T:id1:foo', 'free_text'])
+        line2 = '\t'.join(['cluster1', 'non_coding', '27', '10000', 'cluster1', '1000', '999', '99.42', 'cluster1.scaffold.2', '1300', '22.2', '1', 'SNP', 'n', 'A51G', '0', '.', '.', '51', '51', 'C', '151', '151', 'C', '542', '.', '542', 'a:n:A51G:id3:spam', 'free_text3'])
+        line3 = '\t'.join(['cluster2', 'variants_only', '179', '20000', 'cluster2', '1042', '1042', '42.42', 'cluster2.scaffold.1', '1442', '33.3', '1', 'SNP', 'p', 'I42L', '1', 'I42L', 'NONSYN', '112', '112', 'C', '442', '442', 'T', '300', '.', '290', 'a:v:I42L:id4:eggs', 'free_text3'])
+        records = [report.ReportRecord.from_line(x) for x in [line1, line2, line3]]
+        expected = {
+            'cluster1': {
+                'cluster1.scaffold.1': [records[0]],
+                'cluster1.scaffold.2': [records[1]],
+            },
+            'cluster2': {
+                'cluster2.scaffold.1': [records[2]]
+            }
+        }
+
+        self.assertEqual(expected, report_filter.ReportFilter._load_records(records))
+        rf = report_filter.ReportFilter(records=records)
+        self.assertEqual(expected, rf.report)
+
         with self.assertRaises(report_filter.Error):
-            report_filter.ReportFilter._load_report(bad_infile)
+            report_filter.ReportFilter(infile='foo', records=records)
 
 
     def test_report_dict_passes_non_essential_filters_known_vars(self):
@@ -194,6 +227,20 @@ class TestReportFilter(unittest.TestCase):
             self.assertEqual(expected,  rf._report_dict_passes_essential_filters(test_dict))
 
 
+    def test_values_pass_essential_filters(self):
+        '''Test _values_pass_essential_filters'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        with open(infile) as f:
+            lines = [x.rstrip() for x in f if not x.startswith('#')]
+
+        for options in [{}, {'min_pc_ident': 95}, {'min_ref_base_assembled': 1000}, {'exclude_flags': ['has_nonsynonymous_variants']}]:
+            rf = report_filter.ReportFilter(**options)
+            exclude_bits = sum([flag.flag_bits[x] for x in rf.exclude_flags])
+            for line in lines:
+                expected = rf._report_dict_passes_essential_filters(rf._report_line_to_dict(line))
+                self.assertEqual(expected, rf._values_pass_essential_filters(line.split('\t'), exclude_bits))
+
+
     def test_flag_passes_filter(self):
         '''Test _flag_passes_filter'''
         rf = report_filter.ReportFilter()
@@ -313,11 +360,47 @@ class TestReportFilter(unittest.TestCase):
         self.assertEqual(expected, rf.report)
 
 
+    def test_report_groups(self):
+        '''test _report_groups'''
+        infile = os.path.join(data_dir, 'report_filter_test_load_report_good.tsv')
+        expected_dict = report_filter.ReportFilter(min_pc_ident=0)._load_report(infile)
+        expected = [
+            expected_dict['cluster1']['cluster1.scaffold.1'],
+            expected_dict['cluster1']['cluster1.scaffold.2'],
+            expected_dict['cluster2']['cluster2.scaffold.1'],
+        ]
+        self.assertEqual(expected, list(report_filter.ReportFilter._report_groups(infile)))
+
+        tmp_file = 'tmp.report_filter_test_report_groups.tsv'
+        with open(infile) as f_in, open(tmp_file, 'w') as f_out:
+            lines = f_in.readlines()
+            print(*[lines[i] for i in [0, 1, 3, 2]], sep='', end='', file=f_out)
+        got = list(report_filter.ReportFilter._report_groups(tmp_file))
+        self.assertEqual([1, 1, 1], [len(x) for x in got])
+        self.assertEqual(['cluster1.scaffold.1', 'cluster1.scaffold.2', 'cluster1.scaffold.1'], [x[0]['ctg'] for x in got])
+        os.unlink(tmp_file)
+
+        with open(infile) as f_in, open(tmp_file, 'w') as f_out:
+            lines = f_in.readlines()
+            no_ctg_fields = lines[4].split('\t')
+            no_ctg_fields[0] = no_ctg_fields[8] = '.'
+            no_ctg_line = '\t'.join(no_ctg_fields)
+            print(lines[0], no_ctg_line, lines[1], no_ctg_line, sep='', end='', file=f_out)
+        got = list(report_filter.ReportFilter._report_groups(tmp_file))
+        self.assertEqual([1, 1, 1], [len(x) for x in got])
+        self.assertEqual(['.', 'cluster1', '.'], [x[0]['ref_name'] for x in got])
+        os.unlink(tmp_file)
+
+        bad_infile = os.path.join(data_dir, 'report_filter_test_load_report_bad.tsv')
+        with self.assertRaises(report_filter.Error):
+            list(report_filter.ReportFilter._report_groups(bad_infile))
+
+
     def test_write_report_tsv(self):
         '''Test write_report_tsv'''
         infile = os.path.join(data_dir, 'report_filter_test_write_report.tsv')
         tmpfile = 'tmp.test.report_filter.write_report.tsv'
-        rf = report_filter.ReportFilter(infile=infile)
+        rf = report_filter.ReportFilter(infile=infile, min_pc_ident=0)
         rf._write_report_tsv(tmpfile)
         self.assertTrue(filecmp.cmp(tmpfile, infile, shallow=False))
         os.unlink(tmpfile)
@@ -333,3 +416,27 @@ class TestReportFilter(unittest.TestCase):
         self.assertTrue(filecmp.cmp(expected_file, tmpprefix + '.tsv', shallow=False))
         os.unlink(tmpprefix + '.tsv')
 
+
+    def test_run_streaming(self):
+        '''Test run_streaming'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        expected_file = os.path.join(data_dir, 'report_filter_test_run.expected.tsv')
+        tmpprefix = 'tmp.test.report_filter.run_streaming.out'
+        rf = report_filter.ReportFilter()
+        rf.run_streaming(infile, tmpprefix)
+        self.assertTrue(filecmp.cmp(expected_file, tmpprefix + '.tsv', shallow=False))
+        os.unlink(tmpprefix + '.tsv')
+
+
+    def test_run_with_records(self):
+        '''Test run using records instead of a file gives the same output'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        expected_file = os.path.join(data_dir, 'report_filter_test_run.expected.tsv')
+        tmpprefix = 'tmp.test.report_filter.run_with_records.out'
+        with open(infile) as f:
+            records = [report.ReportRecord.from_line(x) for x in f if not x.startswith('#')]
+        rf = report_filter.ReportFilter(records=records)
+        rf.run(tmpprefix)
+        self.assertTrue(filecmp.cmp(expected_file, tmpprefix + '.tsv', shallow=False))
+        os.unlink(tmpprefix + '.tsv')
+
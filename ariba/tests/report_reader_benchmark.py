@@ -0,0 +1,68 @@
+'''Benchmark of loading a large report file with report_reader, compared with parsing
+   one line at a time with ReportFilter._report_line_to_dict and SummaryCluster.line2dict.
+   About half of the lines have pc_ident below 90, so that they are removed by the default
+   filters of ReportFilter, which checks the raw values of each line and only makes
+   dicts of the lines that pass.
+   This is not run by the tests. Usage: python3 report_reader_benchmark.py [number of lines]'''
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from ariba import report, report_filter, report_reader, summary_cluster
+
+
+def write_report(filename, number_of_lines):
+    random.seed(42)
+    with open(filename, 'w') as f:
+        print('#' + '\t'.join(report.columns), file=f)
+        for i in range(number_of_lines):
+            cluster = 'cluster' + str(i // 20)
+            ctg = cluster + '.l15.c30.ctg.' + str(i % 3 + 1)
+            if i % 5 == 0:
+                variant_columns = ['0'] + ['.'] * 16
+            else:
+                position = random.randint(1, 1000)
+                variant_columns = ['1', 'SNP', 'p', 'A' + str(position) + 'V', '1', 'A' + str(position) + 'V', 'NONSYN',
+                    str(3 * position), str(3 * position + 2), 'GCC', str(3 * position + 50), str(3 * position + 52), 'GTC',
+                    '42;43;41', 'T', '40', cluster + ':1:0:A' + str(position) + 'V:id' + str(i % 7) + ':description']
+            print(cluster, 'variants_only', 27, 5000, cluster, 1500, 1490, round(random.uniform(80, 100), 2), ctg, 1600, 42.3, *variant_columns, 'free text', sep='\t', file=f)
+
+
+def time_function(description, function):
+    start = time.time()
+    result = function()
+    print(description, round(time.time() - start, 3), 's', sep='\t', flush=True)
+    return result
+
+
+def line_at_a_time(filename, line2dict):
+    with open(filename) as f:
+        return [line2dict(x.rstrip()) for x in f if not x.startswith('#')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark loading report files')
+    parser.add_argument('lines', type=int, nargs='?', help='Number of lines in report [%(default)s]', default=100000)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='tmp.report_reader_benchmark.') as tmp_dir:
+        report_file = os.path.join(tmp_dir, 'report.tsv')
+        write_report(report_file, options.lines)
+        print('Report lines:', options.lines)
+
+        old_dicts = time_function('ReportFilter._report_line_to_dict', lambda: line_at_a_time(report_file, report_filter.ReportFilter._report_line_to_dict))
+        time_function('report_reader.load_report', lambda: report_reader.load_report(report_file))
+        new_dicts = time_function('report_reader.load_report + dicts', lambda: list(report_reader.load_report(report_file).dicts()))
+        assert old_dicts == new_dicts
+
+        time_function('SummaryCluster.line2dict', lambda: line_at_a_time(report_file, summary_cluster.SummaryCluster.line2dict))
+        summary_table = time_function('report_reader.load_report (summary columns)', lambda: report_reader.load_report(report_file, int_columns=summary_cluster.int_columns, float_columns=summary_cluster.float_columns))
+        time_function('dicts (summary columns)', lambda: list(summary_table.dicts()))
+        time_function('ReportFilter(infile), no filtering', lambda: report_filter.ReportFilter(infile=report_file, min_pc_ident=0))
+        time_function('ReportFilter(infile)', lambda: report_filter.ReportFilter(infile=report_file))
+
+
+if __name__ == '__main__':
+    main()
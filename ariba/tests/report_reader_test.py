@@ -0,0 +1,67 @@
+import unittest
+import os
+import array
+from ariba import flag, report, report_filter, report_reader, summary_cluster
+
+modules_dir = os.path.dirname(os.path.abspath(report_reader.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestReportReader(unittest.TestCase):
+    def test_convert_column(self):
+        '''test _convert_column'''
+        got = report_reader._convert_column(['1', '42'], int, 'l')
+        self.assertEqual(array.array('l', [1, 42]), got)
+        got = report_reader._convert_column(['1', '.', '42'], int, 'l')
+        self.assertEqual([1, '.', 42], got)
+        got = report_reader._convert_column(['1.5', '.'], float, 'd')
+        self.assertEqual([1.5, '.'], got)
+        with self.assertRaises(report_reader.Error):
+            report_reader._convert_column(['1', 'x'], int, 'l')
+
+
+    def test_load_report(self):
+        '''test load_report'''
+        infile = os.path.join(data_dir, 'report_filter_test_load_report_good.tsv')
+        table = report_reader.load_report(infile)
+        self.assertEqual(4, len(table))
+        self.assertEqual(array.array('l', [27, 27, 27, 179]), table.columns['flag'])
+        self.assertEqual(['cluster1', 'cluster1', 'cluster1', 'cluster2'], table.columns['ref_name'])
+        self.assertTrue(table.columns['ref_name'][0] is table.columns['cluster'][0])
+
+        with open(infile) as f:
+            expected = [report_filter.ReportFilter._report_line_to_dict(x.rstrip()) for x in f if not x.startswith('#')]
+        got = list(table.dicts())
+        self.assertEqual(expected, got)
+        self.assertTrue(got[0]['flag'] is got[1]['flag'])
+        self.assertEqual(len(expected), len(list(table.rows())))
+        self.assertEqual([expected[1], expected[3]], list(table.dicts(indexes=[1, 3])))
+        self.assertEqual([], list(table.dicts(indexes=[])))
+
+        bad_infile = os.path.join(data_dir, 'report_filter_test_load_report_bad.tsv')
+        with self.assertRaises(report_reader.Error):
+            report_reader.load_report(bad_infile)
+
+
+    def test_load_report_summary_columns(self):
+        '''test load_report using the number columns of summary_cluster'''
+        infile = os.path.join(data_dir, 'summary_sample_test_load_file.in.tsv')
+        table = report_reader.load_report(infile, int_columns=summary_cluster.int_columns, float_columns=summary_cluster.float_columns)
+        got = list(table.dicts())
+        for d in got:
+            summary_cluster.SummaryCluster.add_var_group(d)
+
+        with open(infile) as f:
+            expected = [summary_cluster.SummaryCluster.line2dict(x) for x in f if not x.startswith('#')]
+        self.assertEqual(expected, got)
+
+
+    def test_load_report_header_only(self):
+        '''test load_report on file with no rows'''
+        tmp_file = 'tmp.report_reader_test_load_report_header_only.tsv'
+        with open(tmp_file, 'w') as f:
+            print('#' + '\t'.join(report.columns), file=f)
+        table = report_reader.load_report(tmp_file)
+        self.assertEqual(0, len(table))
+        self.assertEqual([], list(table.dicts()))
+        os.unlink(tmp_file)
@@ -0,0 +1,49 @@
+import unittest
+import copy
+from ariba import flag, report
+
+
+class TestReport(unittest.TestCase):
+    def test_report_record_from_line(self):
+        '''test ReportRecord.from_line'''
+        line = 'cluster1\tnon_coding\t27\t10000\tcluster1\t1000\t999\t99.42\tcluster1.scaffold.1\t999\t23.2\t1\tSNP\tn\tC42T\t0\t.\t.\t42\t42\tC\t142\t142\tC\t500\t.\t500\ta:n:C42T:id1:foo\tfree text'
+        record = report.ReportRecord.from_line(line)
+        self.assertEqual('cluster1', record.ref_name)
+        self.assertEqual(flag.Flag(27), record.flag)
+        self.assertEqual(10000, record.reads)
+        self.assertEqual(99.42, record.pc_ident)
+        self.assertEqual(23.2, record['ctg_cov'])
+        self.assertEqual(42, record['ref_start'])
+        self.assertEqual('.', record.ref_ctg_change)
+        self.assertEqual('500', record.smtls_total_depth)
+        self.assertEqual('free text', record.get('free_text'))
+        self.assertEqual(None, record.get('not_a_column'))
+        self.assertEqual(line, record.to_line())
+
+        with self.assertRaises(report.Error):
+            report.ReportRecord.from_line('\t'.join(line.split('\t')[:-1]))
+
+
+    def test_report_record_dots_in_number_columns(self):
+        '''test ReportRecord keeps . in int and float columns'''
+        row = ['.', '.', '64', '10', 'cluster1'] + ['.'] * (len(report.columns) - 5)
+        record = report.ReportRecord(row)
+        self.assertEqual(10, record.reads)
+        self.assertEqual('.', record.ref_len)
+        self.assertEqual('.', record.pc_ident)
+        self.assertEqual('\t'.join(row), record.to_line())
+
+
+    def test_report_record_set_and_copy(self):
+        '''test ReportRecord __setitem__ and copy'''
+        line = 'cluster1\tnon_coding\t27\t10000\tcluster1\t1000\t999\t99.42\tcluster1.scaffold.1\t999\t23.2\t1\tSNP\tn\tC42T\t0\t.\t.\t42\t42\tC\t142\t142\tC\t500\t.\t500\ta:n:C42T:id1:foo\tfree text'
+        record = report.ReportRecord.from_line(line)
+        record_copy = copy.copy(record)
+        self.assertEqual(record, record_copy)
+        record_copy['known_var'] = '.'
+        self.assertEqual('.', record_copy.known_var)
+        self.assertEqual('1', record.known_var)
+        self.assertNotEqual(record, record_copy)
+
+        with self.assertRaises(KeyError):
+            record['not_a_column'] = 'x'
@@ -0,0 +1,46 @@
+import unittest
+import os
+import openpyxl
+from ariba import report, report_xls
+
+modules_dir = os.path.dirname(os.path.abspath(report_xls.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+def load_xls(filename):
+    with open(filename, 'rb') as f:
+        workbook = openpyxl.load_workbook(f)
+        worksheet = workbook['ARIBA_report']
+        return [[cell.value for cell in row] for row in worksheet.iter_rows()]
+
+
+class TestReportXls(unittest.TestCase):
+    def test_write_xls(self):
+        '''test write_xls'''
+        rows = [['a'] * len(report.columns), ['b'] * len(report.columns)]
+        tmp_xls = 'tmp.report_xls_test_write_xls.xls'
+        report_xls.write_xls(iter(rows), tmp_xls)
+        self.assertEqual([report.columns] + rows, load_xls(tmp_xls))
+        os.unlink(tmp_xls)
+
+
+    def test_write_xls_from_tsv(self):
+        '''test write_xls_from_tsv and start_xls_from_tsv'''
+        infile = os.path.join(data_dir, 'report_filter_test_run.in.tsv')
+        with open(infile) as f:
+            expected = [report.columns] + [x.rstrip('\n').split('\t') for x in f if not x.startswith('#')]
+
+        tmp_xls = 'tmp.report_xls_test_write_xls_from_tsv.xls'
+        report_xls.write_xls_from_tsv(infile, tmp_xls)
+        self.assertEqual(expected, load_xls(tmp_xls))
+        os.unlink(tmp_xls)
+
+        process = report_xls.start_xls_from_tsv(infile, tmp_xls)
+        report_xls.wait_for_xls(process)
+        self.assertEqual(expected, load_xls(tmp_xls))
+        os.unlink(tmp_xls)
+
+        process = report_xls.start_xls_from_tsv('not_a_file', tmp_xls)
+        with self.assertRaises(report_xls.Error):
+            report_xls.wait_for_xls(process)
+        self.assertFalse(os.path.exists(tmp_xls))
@@ -0,0 +1,85 @@
+import unittest
+import os
+from ariba import flag, report, results_db
+
+modules_dir = os.path.dirname(os.path.abspath(results_db.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+line1 = '\t'.join(['cluster1', 'non_coding', '27', '10000', 'cluster1', '1000', '999', '99.42', 'cluster1.scaffold.1', '1300', '12.2', '1', 'SNP', 'n', 'C42T', '0', '.', '.', '42', '42', 'C', '142', '142', 'C', '500', '.', '500', 'a:n:C42T:id1:foo', 'free_text'])
+line2 = '\t'.join(['cluster2', 'variants_only', '179', '20000', 'cluster2', '1042', '1042', '42.42', 'cluster2.scaffold.1', '1442', '33.3', '1', 'SNP', 'p', 'I42L', '1', 'I42L', 'NONSYN', '112', '112', 'C', '442', '442', 'T', '300', '.', '290', 'a:v:I42L:id4:eggs', 'free_text3'])
+line3 = '\t'.join(['.', '.', '1024', '12', 'cluster3'] + ['.'] * (len(report.columns) - 5))
+
+
+class TestResultsDb(unittest.TestCase):
+    def test_add_sample_and_get_results(self):
+        '''test add_sample and getting the results back'''
+        tmp_db = 'tmp.results_db_test_add_sample.db'
+        if os.path.exists(tmp_db):
+            os.unlink(tmp_db)
+
+        all_records = [report.ReportRecord.from_line(x) for x in [line1, line2, line3]]
+        filtered_records = [report.ReportRecord.from_line(x) for x in [line2, line1]]
+        cluster_stats = [
+            ('cluster1', 'cluster1', flag.Flag(27), 10000, 1500000),
+            ('cluster3', None, flag.Flag(1024), 12, 1800),
+        ]
+        timings = [('run_clusters', 42.5), ('write_reports', 0.5)]
+
+        db = results_db.ResultsDb(tmp_db)
+        db.add_sample('sample1', all_records, filtered_records, cluster_stats=cluster_stats, timings=timings)
+        db.add_sample('sample2', [], [])
+        with self.assertRaises(results_db.Error):
+            db.add_sample('sample1', [], [])
+        db.close()
+
+        db = results_db.ResultsDb(tmp_db)
+        self.assertEqual(['sample1', 'sample2'], db.sample_names())
+        self.assertEqual(all_records, db.report_records('sample1', filtered=False))
+        self.assertEqual(filtered_records, db.report_records('sample1'))
+        self.assertEqual([line2, line1], [x.to_line() for x in db.report_records('sample1')])
+        self.assertEqual([], db.report_records('sample2'))
+        expected_stats = {'cluster1': ('cluster1', 27, 10000, 1500000), 'cluster3': (None, 1024, 12, 1800)}
+        self.assertEqual(expected_stats, db.cluster_stats('sample1'))
+        self.assertEqual({'run_clusters': 42.5, 'write_reports': 0.5}, db.timings('sample1'))
+        self.assertEqual({}, db.timings('sample2'))
+
+        with self.assertRaises(results_db.Error):
+            db.report_records('not_a_sample')
+
+        db.close()
+        os.unlink(tmp_db)
+
+
+    def test_merge(self):
+        '''test merge'''
+        tmp_dbs = ['tmp.results_db_test_merge.' + str(i) + '.db' for i in range(3)]
+        for filename in tmp_dbs:
+            if os.path.exists(filename):
+                os.unlink(filename)
+
+        records1 = [report.ReportRecord.from_line(x) for x in [line1, line2]]
+        records2 = [report.ReportRecord.from_line(line3)]
+        db1 = results_db.ResultsDb(tmp_dbs[1])
+        db1.add_sample('sample1', records1, records1[1:], timings=[('run_clusters', 1.0)])
+        db1.add_sample('sample2', records2, records2)
+        db1.close()
+        db2 = results_db.ResultsDb(tmp_dbs[2])
+        db2.add_sample('sample3', records2, [], cluster_stats=[('cluster3', None, flag.Flag(1024), 12, 1800)])
+        db2.close()
+
+        db = results_db.ResultsDb(tmp_dbs[0])
+        db.add_sample('sample3', [], [])
+        db.merge(tmp_dbs[1])
+        with self.assertRaises(results_db.Error):
+            db.merge(tmp_dbs[2])
+        self.assertEqual(['sample3', 'sample1', 'sample2'], db.sample_names())
+        self.assertEqual(records1, db.report_records('sample1', filtered=False))
+        self.assertEqual(records1[1:], db.report_records('sample1'))
+        self.assertEqual(records2, db.report_records('sample2'))
+        self.assertEqual({'run_clusters': 1.0}, db.timings('sample1'))
+        self.assertEqual([], db.report_records('sample3', filtered=False))
+        self.assertEqual({}, db.cluster_stats('sample3'))
+        db.close()
+
+        for filename in tmp_dbs:
+            os.unlink(filename)
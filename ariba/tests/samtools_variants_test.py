@@ -1,5 +1,7 @@
 import unittest
 import os
+import shutil
+import pysam
 import pyfastaq
 import pymummer
 from ariba import samtools_variants, external_progs
@@ -70,6 +72,19 @@ class TestSamtoolsVariants(unittest.TestCase):
         os.unlink(sv.read_depths_file + '.tbi')
 
 
+    def test_write_regions_bed(self):
+        '''test _write_regions_bed'''
+        regions = {
+            'ctg2': [pyfastaq.intervals.Interval(4, 4)],
+            'ctg1': [pyfastaq.intervals.Interval(19, 29), pyfastaq.intervals.Interval(0, 9)],
+        }
+        tmp_bed = 'tmp.samtools_variants_test_write_regions_bed.bed'
+        samtools_variants.SamtoolsVariants._write_regions_bed(regions, tmp_bed)
+        expected = os.path.join(data_dir, 'samtools_variants_test_write_regions_bed.expected.bed')
+        self.assertEqual(file2lines(expected), file2lines(tmp_bed))
+        os.unlink(tmp_bed)
+
+
     def test_get_read_depths(self):
         '''test _get_read_depths'''
         read_depths_file = os.path.join(data_dir, 'samtools_variants_test_get_read_depths.gz')
@@ -87,6 +102,26 @@ class TestSamtoolsVariants(unittest.TestCase):
             self.assertEqual(expected, samtools_variants.SamtoolsVariants._get_read_depths(read_depths_file, name, position))
 
 
+    def test_get_read_depths_from_index(self):
+        '''test _load_read_depths and _get_read_depths_from_index'''
+        read_depths_file = os.path.join(data_dir, 'samtools_variants_test_get_read_depths.gz')
+        index = samtools_variants.SamtoolsVariants._load_read_depths(read_depths_file)
+        self.assertEqual(['ref1'], list(index.keys()))
+        self.assertEqual([0, 1, 2, 3, 4, 4], list(index['ref1'][0]))
+
+        tests = [
+            ( ('ref1', 42), None ),
+            ( ('ref2', 1), None ),
+            ( ('ref1', 0), ('G', '.', 1, '1') ),
+            ( ('ref1', 2), ('T', 'A', 3, '2,1') ),
+            ( ('ref1', 3), ('C', 'A,G', 42, '21,11,10') ),
+            ( ('ref1', 4), ('C', 'AC', 41, '0,42') )
+        ]
+
+        for (name, position), expected in tests:
+            self.assertEqual(expected, samtools_variants.SamtoolsVariants._get_read_depths_from_index(index, name, position))
+
+
     def test_get_variant_positions_from_vcf(self):
         '''test _get_variant_positions_from_vcf'''
         vcf_file = os.path.join(data_dir, 'samtools_variants_test_get_variant_positions_from_vcf.vcf')
@@ -133,6 +168,45 @@ class TestSamtoolsVariants(unittest.TestCase):
         self.assertEqual(expected, got)
 
 
+    def test_total_depth_per_contig_from_index(self):
+        '''test total_depth_per_contig_from_index'''
+        prefix = os.path.join(data_dir, 'samtools_variants_test_get_variants')
+        samtools_vars = samtools_variants.SamtoolsVariants('ref.fa', 'reads.bam', prefix)
+        expected = samtools_variants.SamtoolsVariants.total_depth_per_contig(samtools_vars.read_depths_file)
+        self.assertEqual(expected, samtools_vars.total_depth_per_contig_from_index())
+
+
+    def test_total_depth_per_contig_from_bam(self):
+        '''test total_depth_per_contig_from_bam'''
+        # No position in this BAM has more than 250 reads and there are no
+        # indels, so the depths are the same as from the mpileup read depths file
+        # made without regions
+        tmp_prefix = 'tmp.test_total_depth_per_contig_from_bam'
+        bam = tmp_prefix + '.bam'
+        shutil.copyfile(os.path.join(data_dir, 'samtools_variants_test_make_vcf_and_read_depths_files.bam'), bam)
+        pysam.index(bam)
+        read_depths = os.path.join(data_dir, 'samtools_variants_test_make_vcf_and_read_depths_files.expected.read_depths.gz')
+        expected = samtools_variants.SamtoolsVariants.total_depth_per_contig(read_depths)
+        regions = {
+            '16__cat_2_M35190.scaffold.1': [pyfastaq.intervals.Interval(9, 99), pyfastaq.intervals.Interval(200, 249)],
+            '16__cat_2_M35190.scaffold.2': [pyfastaq.intervals.Interval(0, 399)],
+        }
+        samtools_vars = samtools_variants.SamtoolsVariants('ref.fa', bam, tmp_prefix, regions=regions)
+
+        f_in = pyfastaq.utils.open_file_read(read_depths)
+        f_out = pyfastaq.utils.open_file_write(samtools_vars.read_depths_file)
+        for line in f_in:
+            name, pos = line.split('\t')[:2]
+            if any(x.start <= int(pos) - 1 <= x.end for x in regions.get(name, [])):
+                print(line, end='', file=f_out)
+        pyfastaq.utils.close(f_in)
+        pyfastaq.utils.close(f_out)
+
+        self.assertEqual(expected, samtools_vars.total_depth_per_contig_from_bam())
+        for filename in [bam, bam + '.bai', samtools_vars.read_depths_file]:
+            os.unlink(filename)
+
+
     def test_variants_in_coords(self):
         '''test variants_in_coords'''
         vcf_file = os.path.join(data_dir, 'samtools_variants_test_variants_in_coords.vcf')
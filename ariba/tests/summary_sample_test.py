@@ -1,6 +1,6 @@
 import unittest
 import os
-from ariba import summary_cluster, summary_sample
+from ariba import report, results_db, summary_cluster, summary_sample
 
 modules_dir = os.path.dirname(os.path.abspath(summary_sample.__file__))
 data_dir = os.path.join(modules_dir, 'tests', 'data')
@@ -33,6 +33,38 @@ class TestSummarySample(unittest.TestCase):
         got = summary_sample.SummarySample._load_file(infile, 90)
         self.assertEqual(expected, got)
 
+        expected = {
+            'cluster.n': summary_cluster.SummaryCluster(min_pc_id=99),
+            'cluster.p': summary_cluster.SummaryCluster(min_pc_id=99),
+            'cluster.v': summary_cluster.SummaryCluster(min_pc_id=99),
+        }
+        expected['cluster.v'].add_data_dict(dicts[5])
+        got = summary_sample.SummarySample._load_file(infile, 99)
+        self.assertEqual(expected, got)
+
+
+    def test_load_results_db(self):
+        '''Test loading from a results database gives the same summary as loading from a file'''
+        infile = os.path.join(data_dir, 'summary_sample_test_load_file.in.tsv')
+        with open(infile) as f:
+             records = [report.ReportRecord.from_line(x) for x in f if not x.startswith('#')]
+
+        tmp_db = 'tmp.summary_sample_test_load_results_db.db'
+        if os.path.exists(tmp_db):
+            os.unlink(tmp_db)
+        db = results_db.ResultsDb(tmp_db)
+        db.add_sample('sample1', records, records)
+        db.close()
+
+        sample_from_file = summary_sample.SummarySample(infile)
+        sample_from_file.run()
+        sample_from_db = summary_sample.SummarySample('sample1', results_db_file=tmp_db)
+        sample_from_db.run()
+        self.assertEqual(sample_from_file.column_summary_data, sample_from_db.column_summary_data)
+        self.assertEqual(sample_from_file.variant_column_names_tuples, sample_from_db.variant_column_names_tuples)
+        self.assertEqual(sample_from_file.var_groups, sample_from_db.var_groups)
+        os.unlink(tmp_db)
+
 
     def test_column_summary_data(self):
         '''Test _column_summary_data'''
@@ -2,7 +2,7 @@ import unittest
 import copy
 import filecmp
 import os
-from ariba import flag, summary, summary_cluster, summary_sample
+from ariba import flag, results_db, summary, summary_cluster, summary_sample
 
 modules_dir = os.path.dirname(os.path.abspath(summary.__file__))
 data_dir = os.path.join(modules_dir, 'tests', 'data')
@@ -19,6 +19,32 @@ class TestSummary(unittest.TestCase):
         self.assertEqual(s.filenames, ['file42', 'file1', 'file2'])
 
 
+    def test_init_results_dbs(self):
+        '''Test init with results databases'''
+        tmp_dbs = ['tmp.summary_test_init_results_dbs.' + str(i) + '.db' for i in range(2)]
+        for i, filename in enumerate(tmp_dbs):
+            if os.path.exists(filename):
+                os.unlink(filename)
+            db = results_db.ResultsDb(filename)
+            db.add_sample('sample' + str(i + 2), [], [])
+            db.add_sample('sample' + str(i + 1), [], [])
+            db.close()
+
+        s = summary.Summary('out', results_dbs=tmp_dbs[:1])
+        self.assertEqual(['sample1', 'sample2'], s.filenames)
+        s = summary.Summary('out', filenames=['file42'], results_dbs=tmp_dbs[:1])
+        self.assertEqual(['file42', 'sample1', 'sample2'], s.filenames)
+        self.assertEqual({'sample1': tmp_dbs[0], 'sample2': tmp_dbs[0]}, s.results_db_samples)
+
+        with self.assertRaises(summary.Error):
+            summary.Summary('out', results_dbs=tmp_dbs)
+        with self.assertRaises(summary.Error):
+            summary.Summary('out', filenames=['sample1'], results_dbs=tmp_dbs[:1])
+
+        for filename in tmp_dbs:
+            os.unlink(filename)
+
+
     def test_determine_cluster_cols(self):
         col_strings = [
             'assembled,has_res,ref_seq,pct_id,known_var,novel_var',
@@ -0,0 +1,46 @@
+import unittest
+import os
+from ariba import reference_data, sequence_metadata, variant_index
+
+modules_dir = os.path.dirname(os.path.abspath(variant_index.__file__))
+data_dir = os.path.join(modules_dir, 'tests', 'data')
+
+
+class TestVariantIndex(unittest.TestCase):
+    def setUp(self):
+        refdata = reference_data.ReferenceData(
+            presence_absence_fa=os.path.join(data_dir, 'reference_data_test_all_non_wild_type_variants.ref.pres_abs.fa'),
+            variants_only_fa=os.path.join(data_dir, 'reference_data_test_all_non_wild_type_variants.ref.var_only.fa'),
+            non_coding_fa=os.path.join(data_dir, 'reference_data_test_all_non_wild_type_variants.ref.noncoding.fa'),
+            metadata_tsv=os.path.join(data_dir, 'reference_data_test_all_non_wild_type_variants.tsv'),
+        )
+        self.ref_seq = refdata.sequence('var_only_gene')
+        self.index = variant_index.VariantIndex(self.ref_seq, refdata.metadata['var_only_gene'])
+        self.v1 = sequence_metadata.SequenceMetadata('var_only_gene\tn\tA8T\t.\tref has wild type A')
+        self.v2 = sequence_metadata.SequenceMetadata('var_only_gene\tn\tG9C\t.\tref has variant C instead of G')
+        self.v3 = sequence_metadata.SequenceMetadata('var_only_gene\tp\tP3Q\t.\tref has wild type P')
+        self.v4 = sequence_metadata.SequenceMetadata('var_only_gene\tp\tG4I\t.\tref has wild type F')
+        self.v5 = sequence_metadata.SequenceMetadata('var_only_gene\tp\tI5V\t.\tref has variant V instead of I')
+        self.v6 = sequence_metadata.SequenceMetadata('var_only_gene\tp\tF6I\t.\tref has wild type F')
+
+
+    def test_init(self):
+        '''test __init__'''
+        expected = {
+             'n': {7: {self.v1}, 8: {self.v2}},
+             'p': {2: {self.v3}, 3: {self.v4}, 4: {self.v5}, 5: {self.v6}}
+        }
+        self.assertEqual(expected, self.index.variants)
+        self.assertEqual(self.ref_seq.translate().seq, self.index.translation)
+        index = variant_index.VariantIndex(self.ref_seq, None)
+        self.assertEqual({'n': {}, 'p': {}}, index.variants)
+        self.assertIsNone(index.translation)
+
+
+    def test_has_variant(self):
+        '''test has_variant'''
+        for seq_meta in [self.v1, self.v2, self.v3, self.v4, self.v5, self.v6]:
+            self.assertEqual(seq_meta.has_variant(self.ref_seq), self.index.has_variant(seq_meta))
+        self.assertTrue(self.index.has_variant(self.v2))
+        self.assertTrue(self.index.has_variant(self.v5))
+        self.assertFalse(self.index.has_variant(self.v3))
@@ -0,0 +1,34 @@
+class Error (Exception): pass
+
+
+class VariantIndex:
+    def __init__(self, ref_sequence, metadata):
+        '''Index of the known variants of one reference sequence, made once and then only read.
+           ref_sequence = pyfastaq.sequences.Fasta object.
+           metadata = dictionary of the metadata of the sequence, in the same form as
+           ReferenceData.metadata[sequence name]. Can be None if there is no metadata.
+           The translation of the sequence is made here (only if there are protein variants),
+           so that checking for protein variants does not translate the sequence every time'''
+        self.ref_sequence = ref_sequence
+        self.variants = {'n': {}, 'p': {}}
+
+        if metadata is not None:
+            for variant_type in ['n', 'p']:
+                for position, metadata_set in metadata[variant_type].items():
+                    self.variants[variant_type][position] = set(metadata_set)
+
+        self.translation = ref_sequence.translate().seq if len(self.variants['p']) > 0 else None
+
+
+    def has_variant(self, seq_meta):
+        '''Returns True iff the reference sequence has the variant type of seq_meta (a
+           sequence_metadata.SequenceMetadata object). Same as seq_meta.has_variant(self.ref_sequence)'''
+        if seq_meta.variant is None:
+            return False
+        elif seq_meta.variant.variant_type == 'p':
+            test_seq = self.translation if self.translation is not None else self.ref_sequence.translate().seq
+        else:
+            test_seq = self.ref_sequence.seq
+
+        assert seq_meta.variant.position < len(test_seq)
+        return test_seq[seq_meta.variant.position] == seq_meta.variant.variant_value